@@ -7,9 +7,8 @@ from handlers.support_api_handlers import SupportAPIHandlers
 from handlers.common_handlers import CommonHandlers
 from handlers.catalog_handlers import CatalogHandlers
 from config import BOT_TOKEN, get_api_url
+from services.log_pipeline import LogPipeline
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 async def main():
@@ -36,4 +35,5 @@ async def main():
         logger.error(f"Ошибка бота: {e}")
 
 if __name__ == "__main__":
+    LogPipeline().start()
     asyncio.run(main())
\ No newline at end of file
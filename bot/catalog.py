@@ -0,0 +1,206 @@
+"""
+Каталог товаров магазина
+Единый источник данных о товарах для карточек, корзины и заказов.
+Если собран снимок каталога (python catalog_snapshot.py), товары читаются
+из него через mmap, иначе - из PRODUCTS.
+"""
+import logging
+import os
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import config
+from catalog_snapshot import CatalogSnapshot
+from services.variant_index import VariantIndex
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.path.join(config.DATA_DIR, "catalog.snap")
+
+CATEGORIES = {
+    "mountain": "🏔️ Горные велосипеды",
+    "folding": "📦 Складные велосипеды",
+    "hybrid": "🚴 Гибридные велосипеды"
+}
+
+PRODUCTS = {
+    1: {
+        "id": 1,
+        "name": "Горный велосипед X1",
+        "price": 25000,
+        "desc": "21 скорость, алюминиевая рама. Идеален для начинающих",
+        "category": "mountain",
+        "in_stock": 10,
+        "photo_path": "media/products/mountain_x1.jpg",
+        "variant": "S"
+    },
+    2: {
+        "id": 2,
+        "name": "Горный велосипед Pro",
+        "price": 35000,
+        "desc": "27 скоростей, гидравлические тормоза. Профессиональная модель",
+        "category": "mountain",
+        "in_stock": 5,
+        "photo_path": "media/products/mountain_pro.jpg"
+    },
+    3: {
+        "id": 3,
+        "name": "Складной велосипед City",
+        "price": 18000,
+        "desc": "Компактный для города. Удобен для commuting",
+        "category": "folding",
+        "in_stock": 8,
+        "photo_path": "media/products/folding_city.jpg"
+    },
+    4: {
+        "id": 4,
+        "name": "Гибридный велосипед Tour",
+        "price": 22000,
+        "desc": "Универсальный для города и трассы. Комфортная посадка",
+        "category": "hybrid",
+        "in_stock": 6,
+        "photo_path": "media/products/hybrid_tour.jpg"
+    },
+    # Варианты товаров (parent_id - основной товар семейства)
+    11: {
+        "id": 11,
+        "name": "Горный велосипед X1",
+        "price": 25000,
+        "desc": "21 скорость, алюминиевая рама. Идеален для начинающих",
+        "category": "mountain",
+        "in_stock": 7,
+        "photo_path": "media/products/mountain_x1.jpg",
+        "parent_id": 1,
+        "variant": "M"
+    },
+    12: {
+        "id": 12,
+        "name": "Горный велосипед X1",
+        "price": 26000,
+        "desc": "21 скорость, алюминиевая рама. Идеален для начинающих",
+        "category": "mountain",
+        "in_stock": 3,
+        "photo_path": "media/products/mountain_x1.jpg",
+        "parent_id": 1,
+        "variant": "L"
+    }
+}
+
+# Товары категорий в порядке показа (для навигации между карточками), без вариантов
+_CATEGORY_INDEX: Dict[str, List[int]] = {}
+for _product in PRODUCTS.values():
+    if not _product.get("parent_id"):
+        _CATEGORY_INDEX.setdefault(_product["category"], []).append(_product["id"])
+
+
+def _open_snapshot() -> Optional[CatalogSnapshot]:
+    if not os.path.exists(SNAPSHOT_PATH):
+        return None
+    try:
+        snapshot = CatalogSnapshot(SNAPSHOT_PATH)
+        logger.info(f"📦 Каталог загружен из снимка {SNAPSHOT_PATH}: {snapshot.count} товаров")
+        return snapshot
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ Не удалось открыть снимок каталога: {e}")
+        return None
+
+
+_snapshot = _open_snapshot()
+if _snapshot:
+    CATEGORIES = _snapshot.categories
+
+# Цены, изменённые после загрузки (снимок каталога только для чтения);
+# сохраняются в журнале состояния и применяются заново после перезапуска
+_price_overrides: Dict[int, int] = {}
+
+
+def get_product(product_id: int) -> Optional[dict]:
+    """Товар по ID"""
+    if _snapshot:
+        product = _snapshot.get(product_id)
+        if product and product_id in _price_overrides:
+            product["price"] = _price_overrides[product_id]
+        return product
+    return PRODUCTS.get(product_id)
+
+
+def set_price(product_id: int, price: int) -> None:
+    """Изменить цену товара"""
+    _price_overrides[product_id] = price
+    if not _snapshot:
+        PRODUCTS[product_id]["price"] = price
+
+
+def price_overrides() -> Dict[int, int]:
+    """Цены, изменённые после загрузки каталога: {product_id: цена}"""
+    return dict(_price_overrides)
+
+
+def format_price(value) -> str:
+    """Сумма для вывода: 25,000 или 1,234.50 (копейки - только если они есть)"""
+    if value == int(value):
+        return f"{int(value):,}"
+    return f"{value:,.2f}"
+
+
+def _category_ids(category: str) -> List[int]:
+    if _snapshot:
+        return _snapshot.category_ids(category)
+    return _CATEGORY_INDEX.get(category, [])
+
+
+def get_category_products(category: str) -> List[dict]:
+    """Товары категории"""
+    return [get_product(product_id) for product_id in _category_ids(category)]
+
+
+def get_neighbours(product_id: int) -> tuple:
+    """Предыдущий и следующий товар той же категории (или None)"""
+    product = get_product(product_id)
+    if not product:
+        return None, None
+
+    ids = _category_ids(product["category"])
+    index = ids.index(product_id)
+    prev_id = ids[index - 1] if index > 0 else None
+    next_id = ids[index + 1] if index < len(ids) - 1 else None
+    return prev_id, next_id
+
+
+def feature_columns() -> Tuple[Sequence[int], Sequence[int], Sequence[int], List[str], Sequence[int], Sequence[int]]:
+    """
+    Колонки каталога для рекомендаций, по возрастанию id:
+    id, parent_id (0 - нет), номер категории, ключи категорий, цена в копейках, остаток
+    """
+    if _snapshot:
+        return _snapshot.columns()
+
+    category_keys = list(CATEGORIES)
+    for product in PRODUCTS.values():
+        if product["category"] not in category_keys:
+            category_keys.append(product["category"])
+    codes = {key: index for index, key in enumerate(category_keys)}
+    rows = sorted(PRODUCTS.values(), key=lambda p: p["id"])
+    return (
+        [product["id"] for product in rows],
+        [product.get("parent_id") or 0 for product in rows],
+        [codes[product["category"]] for product in rows],
+        category_keys,
+        [int(product["price"] * 100) for product in rows],
+        [product["in_stock"] for product in rows]
+    )
+
+
+def _variant_rows() -> Iterator[tuple]:
+    """Строки для индекса вариантов: только товары, входящие в семейства"""
+    if _snapshot:
+        yield from _snapshot.iter_variant_rows()
+        return
+
+    parents = {product["parent_id"] for product in PRODUCTS.values() if product.get("parent_id")}
+    for product in PRODUCTS.values():
+        if product.get("parent_id") or product["id"] in parents:
+            yield (product["id"], product.get("parent_id"), product["price"],
+                   product["in_stock"], product.get("variant") or "")
+
+
+variant_index = VariantIndex.lazy(_variant_rows)
@@ -0,0 +1,213 @@
+"""
+Бинарный снимок каталога для быстрого старта
+Каталог записывается в колоночный файл (id, цены, остатки, категории,
+смещения строк в общем блоке), который каждый процесс бота открывает
+через mmap только на чтение. Страницы файла делятся между процессами
+через кэш ОС, а объекты товаров создаются только при обращении.
+
+Сборка снимка:
+    python catalog_snapshot.py [путь]
+"""
+import json
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+MAGIC = b"CATSNAP2"
+# magic, количество товаров, размер meta (JSON), размер блока строк
+HEADER = struct.Struct("<8sIII")
+# Строковые поля товара в блоке строк, по порядку
+STRING_FIELDS = ("name", "desc", "photo_path", "variant")
+
+
+def _align(offset: int, size: int = 8) -> int:
+    return (offset + size - 1) // size * size
+
+
+def _layout(count: int, meta_size: int, blob_size: int) -> Dict[str, Tuple[int, int]]:
+    """Смещения и длины колонок: имя -> (offset, длина в байтах)"""
+    columns = [
+        ("ids", 8 * count),
+        ("prices", 8 * count),
+        ("parents", 8 * count),
+        ("stock", 4 * count),
+        ("types", 4 * count),
+        ("category_rows", 4 * count),
+        ("string_offsets", 4 * (count * len(STRING_FIELDS) + 1)),
+        ("meta", meta_size),
+        ("blob", blob_size)
+    ]
+    layout = {}
+    offset = HEADER.size
+    for name, size in columns:
+        offset = _align(offset)
+        layout[name] = (offset, size)
+        offset += size
+    return layout
+
+
+def build_snapshot(products: Iterable[dict], categories: Dict[str, str], path: str) -> int:
+    """Записать снимок каталога. Возвращает количество товаров"""
+    rows = sorted(products, key=lambda p: p["id"])
+    count = len(rows)
+    category_keys = list(categories)
+    for product in rows:
+        if product["category"] not in categories:
+            category_keys.append(product["category"])
+    category_ids = {key: index for index, key in enumerate(category_keys)}
+
+    types = [category_ids[p["category"]] for p in rows]
+
+    # Строки товаров одной категории подряд: сначала основные товары по id, потом варианты.
+    # Диапазон категории покрывает только основные товары
+    category_rows = sorted(range(count), key=lambda row: (
+        types[row], bool(rows[row].get("parent_id")), rows[row]["id"]
+    ))
+    category_ranges = {}
+    for position, row in enumerate(category_rows):
+        if rows[row].get("parent_id"):
+            continue
+        key = category_keys[types[row]]
+        start, _ = category_ranges.get(key, (position, position))
+        category_ranges[key] = (start, position + 1)
+
+    blob = bytearray()
+    string_offsets = []
+    for product in rows:
+        for field in STRING_FIELDS:
+            string_offsets.append(len(blob))
+            blob += (product.get(field) or "").encode("utf-8")
+    string_offsets.append(len(blob))
+
+    meta = json.dumps({
+        "categories": [[key, categories.get(key, key)] for key in category_keys],
+        "category_ranges": category_ranges
+    }, ensure_ascii=False).encode("utf-8")
+
+    layout = _layout(count, len(meta), len(blob))
+    columns = {
+        "ids": struct.pack(f"<{count}q", *(p["id"] for p in rows)),
+        "prices": struct.pack(f"<{count}q", *(int(Decimal(p["price"]) * 100) for p in rows)),
+        "parents": struct.pack(f"<{count}q", *(p.get("parent_id") or 0 for p in rows)),
+        "stock": struct.pack(f"<{count}i", *(p["in_stock"] for p in rows)),
+        "types": struct.pack(f"<{count}i", *types),
+        "category_rows": struct.pack(f"<{count}i", *category_rows),
+        "string_offsets": struct.pack(f"<{len(string_offsets)}I", *string_offsets),
+        "meta": meta,
+        "blob": bytes(blob)
+    }
+
+    end = max(offset + size for offset, size in layout.values())
+    buffer = bytearray(end)
+    HEADER.pack_into(buffer, 0, MAGIC, count, len(meta), len(blob))
+    for name, (offset, size) in layout.items():
+        buffer[offset:offset + size] = columns[name]
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buffer)
+    # Атомарная замена: работающие процессы продолжают читать старый файл
+    os.replace(tmp_path, path)
+    return count
+
+
+class CatalogSnapshot:
+    """Каталог поверх mmap-снимка, только чтение"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, meta_size, blob_size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Файл {path} не является снимком каталога")
+
+        self.count = count
+        view = memoryview(self._mmap)
+        layout = _layout(count, meta_size, blob_size)
+
+        def column(name: str, fmt: str) -> memoryview:
+            offset, size = layout[name]
+            return view[offset:offset + size].cast(fmt)
+
+        self._ids = column("ids", "q")
+        self._prices = column("prices", "q")
+        self._parents = column("parents", "q")
+        self._stock = column("stock", "i")
+        self._types = column("types", "i")
+        self._category_rows = column("category_rows", "i")
+        self._string_offsets = column("string_offsets", "I")
+
+        offset, size = layout["meta"]
+        meta = json.loads(bytes(view[offset:offset + size]).decode("utf-8"))
+        self.categories: Dict[str, str] = dict(meta["categories"])
+        self._category_keys: List[str] = [key for key, _ in meta["categories"]]
+        self._category_ranges: Dict[str, List[int]] = meta["category_ranges"]
+
+        offset, size = layout["blob"]
+        self._blob = view[offset:offset + size]
+
+    def _row(self, product_id: int) -> Optional[int]:
+        row = bisect_left(self._ids, product_id)
+        if row < self.count and self._ids[row] == product_id:
+            return row
+        return None
+
+    def _string(self, row: int, field_index: int) -> str:
+        index = row * len(STRING_FIELDS) + field_index
+        start, end = self._string_offsets[index], self._string_offsets[index + 1]
+        return str(self._blob[start:end], "utf-8")
+
+    def _price(self, row: int):
+        price = self._prices[row]
+        return price // 100 if price % 100 == 0 else Decimal(price) / 100
+
+    def _product(self, row: int) -> dict:
+        product = {
+            "id": self._ids[row],
+            "price": self._price(row),
+            "category": self._category_keys[self._types[row]],
+            "in_stock": self._stock[row],
+            "parent_id": self._parents[row] or None
+        }
+        for field_index, field in enumerate(STRING_FIELDS):
+            product[field] = self._string(row, field_index)
+        product["photo_path"] = product["photo_path"] or None
+        return product
+
+    def get(self, product_id: int) -> Optional[dict]:
+        row = self._row(product_id)
+        return self._product(row) if row is not None else None
+
+    def category_ids(self, category: str) -> List[int]:
+        start, end = self._category_ranges.get(category, (0, 0))
+        return [self._ids[self._category_rows[position]] for position in range(start, end)]
+
+    def iter_variant_rows(self) -> Iterator[tuple]:
+        """Строки для индекса вариантов: только товары, входящие в семейства"""
+        parents = {parent_id for parent_id in self._parents if parent_id}
+        variant_field = STRING_FIELDS.index("variant")
+        for row in range(self.count):
+            product_id, parent_id = self._ids[row], self._parents[row]
+            if parent_id or product_id in parents:
+                yield (product_id, parent_id or None, self._price(row),
+                       self._stock[row], self._string(row, variant_field))
+
+    def columns(self) -> Tuple[Sequence[int], Sequence[int], Sequence[int], List[str], Sequence[int], Sequence[int]]:
+        """Колонки как есть (без копирования): id, parent_id, номер категории, ключи категорий, цена в копейках, остаток"""
+        return self._ids, self._parents, self._types, self._category_keys, self._prices, self._stock
+
+
+if __name__ == "__main__":
+    import sys
+
+    from catalog import CATEGORIES, PRODUCTS, SNAPSHOT_PATH
+
+    target = sys.argv[1] if len(sys.argv) > 1 else SNAPSHOT_PATH
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    written = build_snapshot(PRODUCTS.values(), CATEGORIES, target)
+    print(f"✅ Снимок каталога записан: {target} ({written} товаров)")
@@ -10,6 +10,17 @@ class Config(BaseSettings):
     SHOP_NAME: str
     SHOP_PHONE: str
     SHOP_ADDRESS: str
+    DATA_DIR: str = "data"
+    WORKER_ID: int = 0
+    BROADCAST_RATE: float = 25
+    PROMO_RULES_PATH: str = "promocodes.json"
+    QUIZ_PATH: str = "quizzes.json"
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9108  # 0 - не поднимать /metrics
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "text"  # text | json
+    LOG_LEVELS: str = ""  # уровни модулей: "aiogram=WARNING,ticket_service=DEBUG"
+    LOG_SAMPLE: str = "ticket_service=10"  # прореживание записей ниже WARNING: "логгер=N"
     model_config = SettingsConfigDict(env_file=".env")
 
 
@@ -1,19 +1,476 @@
 import logging
-from aiogram import Router, F, Bot
+from aiogram import Router, Bot
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from datetime import datetime
-import random
+import asyncio
+import os
+import time
+from decimal import Decimal
+
+from config import config
+from catalog import format_price, get_product, price_overrides, set_price, variant_index
+from services.stock_reservation import StockReservations
+from services.order_repository import OrderRepository
+from services.persistence import StateJournal
+from services.order_ids import OrderIdGenerator, id_timestamp
+from services.notifications import NotificationPipeline, PRIORITY_STATUS, PRIORITY_PROMO
+from services.broadcast import BroadcastEngine
+from services.subscribers import SubscriberRegistry, SegmentAudience
+from services.scheduler import TimerWheel, Scheduler
+from services.promo_engine import PromoEngine
+from services.cart import CartStore
+from services.analytics import SalesAnalytics, ReportRunner
+from services.callback_data import CallbackRouter
+from services.callback_schemas import codec, ORDER_STATUS, SIMULATE_PROGRESS, PROMOTION
 
 logger = logging.getLogger(__name__)
 
 router = Router()
+callbacks = CallbackRouter(codec)
+callbacks.attach(router)
+
+def _price_cart(cart):
+    return promo_engine.evaluate(cart.promo, cart.user_id, cart.subtotal, cart.category_totals)
+
+# Корзины и заказы в памяти, все изменения пишутся в журнал (см. StateJournal)
+# Итоги корзины (сумма, скидка, доставка) поддерживаются на каждом изменении
+user_carts = CartStore(pricer=_price_cart)
+user_orders = OrderRepository()
+
+# Агрегаты продаж обновляются вместе с заказами (в том числе при восстановлении)
+analytics = SalesAnalytics()
+reports = ReportRunner(max_workers=2)
+
+# Подписчики на изменение свободного остатка: функция(product_id, остаток)
+stock_listeners = [variant_index.update_stock]
+
+def _on_stock_change(product_id: int, available: int):
+    for listener in stock_listeners:
+        listener(product_id, available)
+
+# Подписчики на изменение цены: функция(product_id, цена); корзины пересчитываются пакетом
+price_listeners = [variant_index.update_price]
+
+def _set_prices(prices: dict):
+    for product_id, price in prices.items():
+        set_price(product_id, price)
+        for listener in price_listeners:
+            listener(product_id, price)
+    user_carts.reprice_all(prices)
+
+def change_prices(prices: dict) -> asyncio.Future:
+    """
+    Изменить цены товаров {product_id: цена}: каталог, индекс вариантов и
+    корзины (каждая пересчитывается один раз); пишется в журнал одной записью
+    """
+    data = {"prices": {str(product_id): price for product_id, price in prices.items()}}
+    return _record("price_set", data)
+
+
+# Отложенные переходы статусов и напоминания; таймеры пишутся в журнал
+# и после перезапуска ставятся заново (просроченные срабатывают сразу)
+timers = TimerWheel()
+
+STATUS_FLOW = ["Новый", "В работе", "Готов", "В пути", "Доставлен"]
+# После этих статусов плановые этапы заказа снимаются
+FINAL_STATUSES = ("Доставлен", "Отменен")
+# Товар отменённого заказа возвращается в остаток
+RESTOCK_STATUSES = ("Отменен",)
+
+# Этапы заказа: (статус, через сколько секунд после оформления)
+ORDER_LIFECYCLE = {
+    "Самовывоз": [("В работе", 10 * 60), ("Готов", 60 * 60)],
+    "Доставка курьером": [("В работе", 10 * 60), ("Готов", 60 * 60), ("В пути", 90 * 60), ("Доставлен", 150 * 60)]
+}
+
+# Напоминание о брошенном оформлении заказа
+CHECKOUT_REMINDER_DELAY = 60 * 60
+
+# Промокоды: правила из файла, счётчики использований - в журнале
+promo_engine = PromoEngine(config.PROMO_RULES_PATH)
+
+# Продано по заказам из журнала (считается при старте): product_id -> количество
+_sold_before_start = {}
+
+def _initial_stock(product_id: int):
+    """Свободный остаток товара на момент старта; None - товара нет"""
+    product = get_product(product_id)
+    if product is None:
+        return None
+    return max(0, product['in_stock'] - _sold_before_start.get(product_id, 0))
+
+# Резервы остатков под корзины (резерв живёт 15 минут с последнего изменения корзины);
+# остаток товара разбивается на шарды при первом резерве
+stock_reservations = StockReservations(ttl=15 * 60, on_change=_on_stock_change, load_stock=_initial_stock)
+
+# ИЗМЕНЕНИЯ СОСТОЯНИЯ: применяются к памяти и пишутся в журнал
+def _apply(op: str, data: dict):
+    """Применить запись журнала к корзинам и заказам"""
+    if op == "cart_add":
+        product = _cart_product(data['product_id'])
+        user_carts.add(data['user_id'], data['product_id'], data['quantity'], product['price'], product['category'])
+    elif op == "cart_set":
+        product = _cart_product(data['product_id'])
+        user_carts.set_quantity(data['user_id'], data['product_id'], data['quantity'], product['price'], product['category'])
+    elif op == "cart_promo":
+        user_carts.cart(data['user_id']).set_promo(data['code'])
+    elif op == "cart_delivery":
+        user_carts.cart(data['user_id']).set_delivery(_money(data['price']))
+    elif op == "cart_clear":
+        user_carts.clear(data['user_id'])
+    elif op == "price_set":
+        # В ранних записях журнала - одна цена: {product_id, price}
+        prices = data.get('prices') or {data['product_id']: data['price']}
+        _set_prices({int(product_id): _money(price) for product_id, price in prices.items()})
+    elif op == "subscription":
+        subscribers.apply_change(data)
+    elif op == "customer_blocked":
+        customer_audience.blocked.add(data['user_id'])
+    elif op == "promo_redeem":
+        promo_engine.record_redemption(data['code'], data['user_id'])
+    elif op == "order_create":
+        user_orders.add(_load_order(data['order']))
+        order_ids.observe(data['order']['id'])
+        analytics.order_created(data['order'])
+    elif op == "order_status":
+        order = user_orders[data['order_id']]
+        old_status, order['status'] = order['status'], data['status']
+        analytics.status_changed(order, old_status)
+    elif op == "timer_set":
+        timers.schedule(data['key'], data['due'], data['kind'], data.get('data'), data.get('group'))
+    elif op == "timer_cancel":
+        timers.cancel(data['key'])
+    elif op == "timer_cancel_group":
+        timers.cancel_group(data['group'])
+    elif op == "timer_fired":
+        # Таймер с тем же ключом мог быть переставлен - снимаем только сработавший
+        timer = timers.get(data['key'])
+        if timer is not None and timer.due == data['due']:
+            timers.cancel(data['key'])
+    else:
+        logger.warning(f"⚠️ Неизвестная запись журнала: {op}")
+
+def _money(value):
+    """Сумма из журнала: Decimal (цены с копейками) записан строкой"""
+    return Decimal(value) if isinstance(value, str) else value
+
+def _load_order(order: dict) -> dict:
+    for key in ('total', 'discount', 'delivery_price'):
+        if key in order:
+            order[key] = _money(order[key])
+    for item in order['items']:
+        item['price'] = _money(item['price'])
+        item['total'] = _money(item['total'])
+    return order
+
+def _cart_product(product_id: int) -> dict:
+    return get_product(product_id) or {"name": f"Товар #{product_id}", "price": 0, "category": None}
+
+def _dump() -> dict:
+    return {
+        "carts": {
+            str(user_id): {
+                "items": {str(product_id): quantity for product_id, quantity in cart.items()},
+                "promo": cart.promo,
+                "delivery_price": cart.delivery_price
+            }
+            for user_id, cart in user_carts.items()
+        },
+        "orders": [dict(order) for order in user_orders.values()],
+        "timers": [timer.to_dict() for timer in timers.timers()],
+        "promo_redemptions": promo_engine.dump(),
+        "prices": {str(product_id): price for product_id, price in price_overrides().items()},
+        "blocked_customers": sorted(customer_audience.blocked),
+        # Изменения сегментов, которых ещё нет в файле подписчиков
+        "subscriber_changes": subscribers.unsaved()
+    }
+
+def _restore(state: dict):
+    # Цены - до корзин: корзины считаются по текущей цене товара
+    _set_prices({int(product_id): _money(price) for product_id, price in state.get("prices", {}).items()})
+    for user_id, saved in state.get("carts", {}).items():
+        user_id = int(user_id)
+        # В старых снимках корзина - просто {product_id: количество}
+        items = saved["items"] if "items" in saved else saved
+        for product_id, quantity in items.items():
+            product = _cart_product(int(product_id))
+            user_carts.set_quantity(user_id, int(product_id), quantity, product['price'], product['category'])
+        if "items" in saved:
+            cart = user_carts.cart(user_id)
+            cart.set_delivery(_money(saved.get("delivery_price", 0)))
+            cart.set_promo(saved.get("promo"))
+    for order in state.get("orders", []):
+        user_orders.add(_load_order(order))
+        order_ids.observe(order['id'])
+        analytics.order_created(order)
+    for timer in state.get("timers", []):
+        timers.schedule(timer['key'], timer['due'], timer['kind'], timer['data'], timer['group'])
+    promo_engine.restore(state.get("promo_redemptions", []))
+    customer_audience.blocked.update(state.get("blocked_customers", []))
+    for change in state.get("subscriber_changes", []):
+        subscribers.apply_change(change)
+
+# Очередь уведомлений пользователям (статусы заказов впереди акций)
+notifications = NotificationPipeline(workers=4)
+
+class CustomerAudience:
+    """Аудитория рассылки: пользователи, оформлявшие заказы (кроме заблокировавших бота)"""
+    
+    def __init__(self, orders: OrderRepository):
+        self.orders = orders
+        self.blocked = set()
+    
+    def iter_from(self, after_user_id: int = None):
+        return (user_id for user_id in self.orders.user_ids_after(after_user_id) if user_id not in self.blocked)
+    
+    def discard(self, user_id: int):
+        block_customer(user_id)
+    
+    def __len__(self):
+        return len(self.orders.user_ids()) - len(self.blocked)
+
+# Подписчики и сегменты (битовые карты user_id)
+subscribers = SubscriberRegistry(os.path.join(config.DATA_DIR, "subscribers.bin"))
+
+def record_order_segments(order: dict):
+    """Отметить заказ в сегментах: день заказа, категории, способ получения"""
+    categories = set()
+    for item in order['items']:
+        product = get_product(item.get('product_id'))
+        if product:
+            categories.add(product['category'])
+    delivery = "pickup" if order['delivery_type'] == "Самовывоз" else "courier"
+    subscribers.record_order(order['user_id'], order['created_ts'], categories, delivery)
+
+# Рассылки акций (скорость - сообщений в секунду)
+# Аудитория - имя из audiences или выражение над сегментами, например
+# "subscribed & bought:mountain - ordered:30d"
+broadcasts = BroadcastEngine(
+    notifications,
+    os.path.join(config.DATA_DIR, "campaigns"),
+    rate=config.BROADCAST_RATE,
+    audience_factory=lambda expression: SegmentAudience(subscribers, expression)
+)
+customer_audience = CustomerAudience(user_orders)
+broadcasts.audiences["customers"] = customer_audience
+
+# ID заказов: упорядочены по времени, уникальны между процессами с разными WORKER_ID
+order_ids = OrderIdGenerator(worker_id=config.WORKER_ID)
+
+journal = StateJournal(os.path.join(config.DATA_DIR, "state"), _apply, _dump, _restore)
+subscribers.on_change = lambda change: journal.append("subscription", change)
+
+def _record(op: str, data: dict) -> asyncio.Future:
+    """Записать изменение в журнал и применить его: не записанное в журнал не меняет память"""
+    future = journal.append(op, data)
+    _apply(op, data)
+    return future
+
+def cart_add(user_id: int, product_id: int, quantity: int = 1) -> asyncio.Future:
+    """Добавить товар в корзину"""
+    data = {"user_id": user_id, "product_id": product_id, "quantity": quantity}
+    return _record("cart_add", data)
+
+def cart_set_quantity(user_id: int, product_id: int, quantity: int) -> asyncio.Future:
+    """Изменить количество товара в корзине (0 - убрать)"""
+    data = {"user_id": user_id, "product_id": product_id, "quantity": quantity}
+    return _record("cart_set", data)
+
+def cart_set_promo(user_id: int, code: str) -> asyncio.Future:
+    """Привязать промокод к корзине"""
+    data = {"user_id": user_id, "code": code}
+    return _record("cart_promo", data)
+
+def cart_set_delivery(user_id: int, price: float) -> asyncio.Future:
+    """Стоимость доставки для корзины"""
+    data = {"user_id": user_id, "price": price}
+    return _record("cart_delivery", data)
+
+def cart_clear(user_id: int) -> asyncio.Future:
+    """Очистить корзину (и снять напоминание об оформлении)"""
+    cancel_timer(f"checkout:{user_id}")
+    data = {"user_id": user_id}
+    return _record("cart_clear", data)
+
+def save_order(order: dict) -> asyncio.Future:
+    """Сохранить новый заказ"""
+    data = {"order": order}
+    return _record("order_create", data)
+
+def set_order_status(order_id: str, status: str) -> asyncio.Future:
+    """Изменить статус заказа (завершённый или отменённый заказ теряет отложенные этапы)"""
+    data = {"order_id": order_id, "status": status}
+    restock = status in RESTOCK_STATUSES and user_orders[order_id]['status'] not in RESTOCK_STATUSES
+    future = _record("order_status", data)
+    if restock:
+        for item in user_orders[order_id]['items']:
+            if 'product_id' in item:
+                stock_reservations.restock(item['product_id'], item['quantity'])
+    if status in FINAL_STATUSES:
+        cancel_order_timers(order_id)
+    return future
+
+def redeem_promo(code: str, user_id: int) -> str:
+    """Засчитать использование промокода. Возвращает ошибку или None"""
+    error = promo_engine.redeem(code, user_id)
+    if error is None:
+        journal.append("promo_redeem", {"code": code, "user_id": user_id})
+    return error
 
-# Временные хранилища (в продакшене - БД)
-user_carts = {}
-user_orders = {}
+def block_customer(user_id: int) -> asyncio.Future:
+    """Пользователь заблокировал бота - больше не попадает в рассылки по покупателям"""
+    data = {"user_id": user_id}
+    return _record("customer_blocked", data)
+
+def schedule_timer(key: str, due: float, kind: str, data: dict = None, group: str = None) -> asyncio.Future:
+    """Поставить таймер (таймер с тем же ключом переносится)"""
+    record = {"key": key, "due": due, "kind": kind, "data": data, "group": group}
+    return _record("timer_set", record)
+
+def cancel_timer(key: str):
+    """Снять таймер, если он есть"""
+    if key in timers:
+        data = {"key": key}
+        _record("timer_cancel", data)
+
+def cancel_order_timers(order_id: str):
+    """Снять все отложенные этапы заказа, если они есть"""
+    data = {"group": f"order:{order_id}"}
+    if timers.group(data['group']):
+        _record("timer_cancel_group", data)
+
+def schedule_order_lifecycle(order: dict):
+    """Запланировать этапы заказа от момента оформления"""
+    for status, delay in ORDER_LIFECYCLE.get(order['delivery_type'], ()):
+        schedule_timer(
+            f"order:{order['id']}:{status}",
+            order['created_ts'] + delay,
+            "order_status",
+            {"order_id": order['id'], "status": status},
+            group=f"order:{order['id']}"
+        )
+
+def _rebuild_stock():
+    """Остатки после восстановления: минус проданное (кроме отменённого), корзины снова в резерве"""
+    sold = _sold_before_start
+    sold.clear()
+    for order in user_orders.values():
+        if order['status'] in RESTOCK_STATUSES:
+            continue
+        for item in order['items']:
+            if 'product_id' in item:
+                sold[item['product_id']] = sold.get(item['product_id'], 0) + item['quantity']
+    
+    # Остальные товары берут остаток из каталога при первом резерве
+    for product_id in sold:
+        variant_index.update_stock(product_id, stock_reservations.available(product_id))
+    
+    for user_id, cart in user_carts.items():
+        stock_reservations.reserve_cart(user_id, cart)
+
+_expiry_task = None
+
+_subscribers_saving = None
+
+async def _save_subscribers():
+    # Копия сегментов снимается здесь, в цикле событий: поток пишет только её
+    snapshot = subscribers.snapshot()
+    await asyncio.to_thread(subscribers.write, snapshot)
+    subscribers.mark_saved(snapshot[0])
+
+async def run_housekeeping(interval: float = 60):
+    """Фоновые задачи: освобождение просроченных резервов, сохранение подписчиков"""
+    global _subscribers_saving
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            for user_id, released in stock_reservations.expire():
+                logger.info(f"⌛ Резерв пользователя {user_id} истёк: {released}")
+            subscribers.prune()
+            if subscribers.dirty:
+                # Запись не прерывается отменой задачи - её дожидается on_shutdown
+                _subscribers_saving = asyncio.create_task(_save_subscribers())
+                await asyncio.shield(_subscribers_saving)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Ошибка фоновых задач: {e}")
+
+async def advance_order_on_timer(timer):
+    """Плановый переход статуса заказа"""
+    order = user_orders.get(timer.data['order_id'])
+    if order is None:
+        return
+    status = timer.data['status']
+    # Статус могли продвинуть раньше (демо-кнопка) - назад не откатываем
+    if order['status'] in STATUS_FLOW and STATUS_FLOW.index(order['status']) >= STATUS_FLOW.index(status):
+        return
+    await set_order_status(order['id'], status)
+    queue_order_notification(order)
+    logger.info(f"⏱ Статус заказа {order['id']} изменен по расписанию на: {status}")
+
+async def remind_about_checkout(timer):
+    """Напоминание о брошенном оформлении заказа"""
+    user_id = timer.data['user_id']
+    if not user_carts.get(user_id):
+        return
+    
+    async def send(bot: Bot):
+        await bot.send_message(
+            chat_id=user_id,
+            text="🛒 Вы не закончили оформление заказа - товары ещё ждут вас в корзине!",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="🚚 Оформить заказ", callback_data="checkout")],
+                [InlineKeyboardButton(text="🛒 Корзина", callback_data="cart")]
+            ])
+        )
+    notifications.submit(f"checkout:{user_id}", send, PRIORITY_PROMO, chat_id=user_id)
+
+def _mark_timer_fired(timer):
+    journal.append("timer_fired", {"key": timer.key, "due": timer.due})
+
+scheduler = Scheduler(
+    timers,
+    {"order_status": advance_order_on_timer, "checkout_reminder": remind_about_checkout},
+    on_fired=_mark_timer_fired
+)
+
+@router.startup()
+async def on_startup(bot: Bot):
+    global _expiry_task
+    promo_engine.load()
+    # Файл подписчиков - до журнала: журнал доигрывает изменения новее файла
+    subscribers.load()
+    journal.recover()
+    _rebuild_stock()
+    await journal.start()
+    # Сегменты по заказам выводятся из журнала - досчитываем то, что не успело сохраниться
+    for order in user_orders.values():
+        record_order_segments(order)
+    await notifications.start(bot)
+    broadcasts.resume(notify_user_about_promotion)
+    scheduler.start()
+    logger.info(f"⏱ Таймеров в расписании: {len(timers)}")
+    _expiry_task = asyncio.create_task(run_housekeeping())
+
+@router.shutdown()
+async def on_shutdown():
+    if _expiry_task:
+        _expiry_task.cancel()
+    if _subscribers_saving is not None and not _subscribers_saving.done():
+        try:
+            await _subscribers_saving
+        except Exception as e:
+            logger.error(f"❌ Не удалось сохранить подписчиков: {e}")
+    await scheduler.stop()
+    await broadcasts.stop()
+    await notifications.stop()
+    subscribers.save()
+    await journal.stop()
+    reports.shutdown()
 
 class OrderStates(StatesGroup):
     waiting_for_phone = State()
@@ -41,7 +498,7 @@ async def notify_user_about_order_status(bot: Bot, order_data: dict):
         f"{message}\n\n"
         f"🎫 Заказ: #{order_data['id']}\n"
         f"📊 Статус: {order_data['status']}\n"
-        f"💵 Сумма: {order_data['total']}₽\n"
+        f"💵 Сумма: {format_price(order_data['total'])}₽\n"
     )
     
     if order_data['status'] == "Готов" and order_data['delivery_type'] == "Самовывоз":
@@ -51,19 +508,26 @@ async def notify_user_about_order_status(bot: Bot, order_data: dict):
         notification_text += f"\n🚗 Курьер уже в пути!\n📞 Телефон курьера: +7 (999) 765-43-21"
     
     keyboard = [
-        [InlineKeyboardButton(text="📦 Подробнее о заказе", callback_data=f"order_status_{order_data['id']}")],
+        [InlineKeyboardButton(text="📦 Подробнее о заказе", callback_data=ORDER_STATUS.pack(order_data['id']))],
         [InlineKeyboardButton(text="📞 Связаться с нами", callback_data="support")]
     ]
     
-    try:
-        await bot.send_message(
-            chat_id=user_id,
-            text=notification_text,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
-        )
-        logger.info(f"✅ Уведомление отправлено пользователю {user_id} о заказе {order_data['id']}")
-    except Exception as e:
-        logger.error(f"❌ Ошибка отправки уведомления пользователю: {e}")
+    await bot.send_message(
+        chat_id=user_id,
+        text=notification_text,
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+    )
+    logger.info(f"✅ Уведомление отправлено пользователю {user_id} о заказе {order_data['id']}")
+
+def queue_order_notification(order_data: dict) -> asyncio.Future:
+    """Поставить уведомление о статусе заказа в очередь (повторные по заказу схлопываются)"""
+    order_snapshot = dict(order_data)
+    return notifications.submit(
+        f"order:{order_snapshot['id']}",
+        lambda bot: notify_user_about_order_status(bot, order_snapshot),
+        priority=PRIORITY_STATUS,
+        chat_id=order_snapshot['user_id']
+    )
 
 async def notify_user_about_promotion(bot: Bot, user_id: int, promotion_data: dict):
     """Уведомление о акциях и специальных предложениях"""
@@ -76,17 +540,31 @@ async def notify_user_about_promotion(bot: Bot, user_id: int, promotion_data: di
     
     keyboard = [
         [InlineKeyboardButton(text="🛒 Посмотреть товары", callback_data="catalog")],
-        [InlineKeyboardButton(text="🎁 Подробнее об акции", callback_data=f"promo_{promotion_data['id']}")]
+        [InlineKeyboardButton(text="🎁 Подробнее об акции", callback_data=PROMOTION.pack(promotion_data['id']))]
     ]
     
-    try:
-        await bot.send_message(
-            chat_id=user_id,
-            text=promotion_text,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
-        )
-    except Exception as e:
-        logger.error(f"❌ Ошибка отправки промо-уведомления: {e}")
+    # Ошибки не перехватываем - по ним рассылка понимает, что пользователь заблокировал бота
+    await bot.send_message(
+        chat_id=user_id,
+        text=promotion_text,
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+    )
+
+# Акции для карточек и рассылок
+PROMOTIONS = {
+    "bike2024": {
+        "id": "bike2024",
+        "title": "🚴 СКИДКА 15% НА ВЕЛОСИПЕДЫ",
+        "description": "Только в январе специальное предложение на все модели велосипедов!",
+        "duration": "Акция действует до 31.01.2024"
+    },
+    "welcome": {
+        "id": "welcome",
+        "title": "🎁 10% СКИДКА ДЛЯ НОВЫХ КЛИЕНТОВ",
+        "description": "Приветственная скидка на первый заказ!",
+        "duration": "Постоянная акция"
+    }
+}
 
 # Автоматическое обновление статусов заказов (заглушка)
 async def simulate_order_progress(bot: Bot, order_id: str):
@@ -95,30 +573,26 @@ async def simulate_order_progress(bot: Bot, order_id: str):
         return
     
     order = user_orders[order_id]
-    status_flow = ["Новый", "В работе", "Готов", "В пути", "Доставлен"]
+    current_index = STATUS_FLOW.index(order['status']) if order['status'] in STATUS_FLOW else 0
     
-    current_index = status_flow.index(order['status']) if order['status'] in status_flow else 0
-    
-    if current_index < len(status_flow) - 1:
-        # Обновляем статус
-        new_status = status_flow[current_index + 1]
-        user_orders[order_id]['status'] = new_status
+    if current_index < len(STATUS_FLOW) - 1:
+        # Обновляем статус (плановые этапы, которые уже пройдены, таймер пропустит)
+        new_status = STATUS_FLOW[current_index + 1]
+        await set_order_status(order_id, new_status)
         
-        # Отправляем уведомление пользователю
-        await notify_user_about_order_status(bot, user_orders[order_id])
+        # Уведомление уходит в фоне, обработчик его не ждёт
+        queue_order_notification(user_orders[order_id])
         
         logger.info(f"🔄 Статус заказа {order_id} изменен на: {new_status}")
 
 # 5. СИСТЕМА АКЦИЙ И ПРОМОКОДОВ (оставляем, это полезно)
-@router.callback_query(F.data == "promo")
+@callbacks.exact("promo")
 async def enter_promo(callback: CallbackQuery, state: FSMContext):
     """Ввод промокода"""
+    promo_list = "\n".join(f"• {promo.code} - {promo.title}" for promo in promo_engine.promos.values())
     await callback.message.edit_text(
         "🎁 **Введите промокод:**\n\n"
-        "Доступные промокоды:\n"
-        "• WELCOME10 - 10% скидка\n"
-        "• BIKE2024 - 15% на велосипеды\n"
-        "• FREEDELIVERY - бесплатная доставка",
+        f"Доступные промокоды:\n{promo_list}",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="❌ Отмена", callback_data="cart")]
         ])
@@ -128,33 +602,43 @@ async def enter_promo(callback: CallbackQuery, state: FSMContext):
 @router.message(OrderStates.waiting_for_promo)
 async def apply_promo(message: Message, state: FSMContext):
     """Применение промокода"""
-    promo = message.text.upper().strip()
-    promocodes = {
-        "WELCOME10": {"discount": 10, "type": "percent", "message": "🎉 10% скидка на весь заказ!"},
-        "BIKE2024": {"discount": 15, "type": "percent", "message": "🚴 15% скидка на велосипеды!"},
-        "FREEDELIVERY": {"discount": 0, "type": "free_delivery", "message": "🚗 Бесплатная доставка активирована!"}
-    }
+    user_id = message.from_user.id
+    cart = user_carts.get(user_id)
+    result = promo_engine.evaluate(
+        message.text, user_id,
+        cart.subtotal if cart else 0, cart.category_totals if cart else {}
+    )
     
-    if promo in promocodes:
-        promo_data = promocodes[promo]
-        await state.update_data(promo=promo, promo_data=promo_data)
-        await message.answer(f"✅ {promo_data['message']}")
-        
-        # Показываем обновленную корзину
-        await message.answer("🛒 Обновите корзину для применения скидки")
-        
-    else:
-        await message.answer("❌ Неверный промокод. Попробуйте еще раз:")
+    if not result.ok:
+        # Остаёмся в ожидании промокода - можно ввести другой
+        await message.answer(
+            f"❌ {result.message}. Попробуйте еще раз:",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="❌ Отмена", callback_data="cart")]
+            ])
+        )
+        return
     
-    await state.clear()
+    # Промокод хранится в корзине, скидка пересчитывается при её изменении
+    await cart_set_promo(user_id, result.code)
+    # Выходим из ввода, не очищая данные оформления
+    await state.set_state(None)
+    
+    discount_text = f"\n💸 Скидка: {format_price(result.discount)}₽" if result.discount else ""
+    await message.answer(
+        f"✅ {result.message}{discount_text}",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="✅ Оформить заказ", callback_data="checkout")],
+            [InlineKeyboardButton(text="🛒 Корзина", callback_data="cart")]
+        ])
+    )
 
 # 6. СИСТЕМА УВЕДОМЛЕНИЙ О АКЦИЯХ (вместо отзывов)
-@router.callback_query(F.data == "subscribe_promo")
+@callbacks.exact("subscribe_promo")
 async def subscribe_to_promotions(callback: CallbackQuery):
     """Подписка на акции и уведомления"""
-    user_id = callback.from_user.id
+    subscribers.subscribe(callback.from_user.id)
     
-    # Здесь можно сохранить в БД подписку пользователя
     await callback.message.edit_text(
         "🔔 **Вы подписаны на уведомления!**\n\n"
         "Теперь вы будете первыми узнавать о:\n"
@@ -168,25 +652,13 @@ async def subscribe_to_promotions(callback: CallbackQuery):
         ])
     )
 
-@router.callback_query(F.data.startswith("promo_"))
-async def show_promotion_details(callback: CallbackQuery):
+@callbacks.packed(PROMOTION)
+@callbacks.prefix("promo_", PROMOTION.from_text)
+async def show_promotion_details(callback: CallbackQuery, cb):
     """Показать детали акции"""
-    promo_id = callback.data.split('_')[1]
-    
-    promotions = {
-        "bike2024": {
-            "title": "🚴 СКИДКА 15% НА ВЕЛОСИПЕДЫ",
-            "description": "Только в январе специальное предложение на все модели велосипедов!",
-            "duration": "Акция действует до 31.01.2024"
-        },
-        "welcome": {
-            "title": "🎁 10% СКИДКА ДЛЯ НОВЫХ КЛИЕНТОВ",
-            "description": "Приветственная скидка на первый заказ!",
-            "duration": "Постоянная акция"
-        }
-    }
+    promo_id = cb.promo_id
     
-    promo = promotions.get(promo_id, {
+    promo = PROMOTIONS.get(promo_id, {
         "title": "🎁 Акция",
         "description": "Специальное предложение",
         "duration": "Ограниченное время"
@@ -205,7 +677,7 @@ async def show_promotion_details(callback: CallbackQuery):
     )
 
 # 7. СИСТЕМА ДОСТАВКИ И САМОВЫВОЗА (оставляем, это важно)
-@router.callback_query(F.data == "checkout")
+@callbacks.exact("checkout")
 async def choose_delivery(callback: CallbackQuery, state: FSMContext):
     """Выбор способа доставки"""
     user_id = callback.from_user.id
@@ -221,6 +693,9 @@ async def choose_delivery(callback: CallbackQuery, state: FSMContext):
         )
         return
     
+    # Если оформление не дойдёт до конца - напомним
+    schedule_timer(f"checkout:{user_id}", time.time() + CHECKOUT_REMINDER_DELAY, "checkout_reminder", {"user_id": user_id})
+    
     keyboard = [
         [InlineKeyboardButton(text="🚗 Доставка курьером (+300₽)", callback_data="delivery_courier")],
         [InlineKeyboardButton(text="🏪 Самовывоз из магазина (бесплатно)", callback_data="delivery_pickup")],
@@ -236,10 +711,10 @@ async def choose_delivery(callback: CallbackQuery, state: FSMContext):
     )
     await state.set_state(OrderStates.choosing_delivery)
 
-@router.callback_query(F.data.startswith("delivery_"))
-async def handle_delivery_choice(callback: CallbackQuery, state: FSMContext):
+@callbacks.prefix("delivery_")
+async def handle_delivery_choice(callback: CallbackQuery, state: FSMContext, cb: str):
     """Обработка выбора доставки"""
-    delivery_type = callback.data.split('_')[1]
+    delivery_type = cb
     
     delivery_info = {
         "courier": {"name": "Доставка курьером", "price": 300},
@@ -247,7 +722,8 @@ async def handle_delivery_choice(callback: CallbackQuery, state: FSMContext):
     }
     
     delivery_data = delivery_info.get(delivery_type, {"name": "Не указано", "price": 0})
-    await state.update_data(delivery_type=delivery_data['name'], delivery_price=delivery_data['price'])
+    await state.update_data(delivery_type=delivery_data['name'])
+    cart_set_delivery(callback.from_user.id, delivery_data['price'])
     
     await callback.message.edit_text(
         "📞 **Введите ваш номер телефона для связи:**",
@@ -292,7 +768,8 @@ async def complete_order(message: Message, state: FSMContext, bot: Bot = None):
     data = await state.get_data()
     
     # Создаем заказ
-    order_id = f"{random.randint(1000, 9999)}"
+    order_id = order_ids.next_id()
+    created_ts = id_timestamp(order_id)
     order_data = {
         "id": order_id,
         "user_id": user_id,
@@ -300,54 +777,64 @@ async def complete_order(message: Message, state: FSMContext, bot: Bot = None):
         "phone": data['phone'],
         "address": data.get('address', 'Самовывоз'),
         "delivery_type": data.get('delivery_type', 'Самовывоз'),
-        "delivery_price": data.get('delivery_price', 0),
+        "delivery_price": 0,
         "status": "Новый",
-        "created_at": datetime.now().strftime("%d.%m.%Y %H:%M"),
+        "created_at": datetime.fromtimestamp(created_ts).strftime("%d.%m.%Y %H:%M"),
+        "created_ts": created_ts,
         "items": [],
         "total": 0
     }
     
-    # Добавляем товары
-    products = {
-        1: {"name": "Горный велосипед X1", "price": 25000},
-        2: {"name": "Городской велосипед", "price": 18000},
-    }
+    cart = user_carts.cart(user_id)
     
-    cart = user_carts.get(user_id, {})
-    items_total = 0
+    # Резерв мог истечь, пока пользователь оформлял заказ - пробуем взять товар снова;
+    # если чего-то не хватило, дозарезервированное сейчас возвращается в остаток
+    unavailable = stock_reservations.reserve_cart(user_id, cart, atomic=True)
+    if unavailable:
+        names = ", ".join(get_product(product_id)['name'] for product_id in unavailable if get_product(product_id))
+        await message.answer(
+            f"😔 К сожалению, товар закончился: {names}\n\n"
+            "Измените корзину и оформите заказ снова.",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="🛒 Корзина", callback_data="cart")]
+            ])
+        )
+        await state.clear()
+        return
     
-    for product_id, quantity in cart.items():
-        product = products.get(product_id, {"name": f"Товар #{product_id}", "price": 0})
-        item_total = product['price'] * quantity
-        items_total += item_total
-        
+    # Позиции и итоги уже посчитаны в корзине
+    for product_id, quantity, price, line_total in cart.lines():
         order_data['items'].append({
-            "name": product['name'],
-            "price": product['price'],
+            "product_id": product_id,
+            "name": _cart_product(product_id)['name'],
+            "price": price,
             "quantity": quantity,
-            "total": item_total
+            "total": line_total
         })
     
-    # Применяем промокод если есть
-    promo_data = data.get('promo_data', {})
-    if promo_data:
-        if promo_data['type'] == 'percent':
-            discount = items_total * promo_data['discount'] / 100
-            items_total -= discount
-        elif promo_data['type'] == 'free_delivery':
-            order_data['delivery_price'] = 0
-    
-    order_data['total'] = items_total + order_data['delivery_price']
-    
-    # Сохраняем заказ
-    user_orders[order_id] = order_data
-    
-    # Очищаем корзину
-    user_carts[user_id] = {}
-    
-    # Отправляем первое уведомление пользователю
-    if bot:
-        await notify_user_about_order_status(bot, order_data)
+    # Промокод: лимиты проверяются и счётчик растёт атомарно
+    if cart.promo:
+        error = cart.promo_error or redeem_promo(cart.promo, user_id)
+        if error:
+            await message.answer(f"⚠️ Промокод {cart.promo} не применён: {error}")
+            # Корзина сейчас будет очищена - итог считаем без скидки
+            cart.set_promo(None)
+        else:
+            order_data['promo'] = cart.promo
+            order_data['discount'] = cart.discount
+    
+    order_data['delivery_price'] = cart.delivery_cost
+    order_data['total'] = cart.total
+    
+    # Списываем зарезервированный товар, сохраняем заказ и очищаем корзину
+    stock_reservations.commit(user_id)
+    cart_clear(user_id)
+    await save_order(order_data)
+    record_order_segments(order_data)
+    schedule_order_lifecycle(order_data)
+    
+    # Первое уведомление пользователю - в фоне, не задерживая подтверждение
+    queue_order_notification(order_data)
     
     # Подтверждение пользователю
     confirmation_text = (
@@ -362,8 +849,11 @@ async def complete_order(message: Message, state: FSMContext, bot: Bot = None):
     else:
         confirmation_text += "📍 Самовывоз: г. Москва, ул. Велосипедная, 1\n"
     
+    if order_data.get('promo'):
+        confirmation_text += f"🎁 Промокод {order_data['promo']}: -{format_price(order_data['discount'])}₽\n"
+    
     confirmation_text += (
-        f"💵 Сумма: {order_data['total']}₽\n\n"
+        f"💵 Сумма: {format_price(order_data['total'])}₽\n\n"
         f"⏰ {order_data['delivery_type']} - готов через 1-2 часа\n"
         f"💳 Оплата при получении\n\n"
         f"📞 Для связи: +7 (999) 123-45-67\n\n"
@@ -371,7 +861,7 @@ async def complete_order(message: Message, state: FSMContext, bot: Bot = None):
     )
     
     keyboard = [
-        [InlineKeyboardButton(text="📦 Отследить заказ", callback_data=f"order_status_{order_id}")],
+        [InlineKeyboardButton(text="📦 Отследить заказ", callback_data=ORDER_STATUS.pack(order_id))],
         [InlineKeyboardButton(text="🔔 Подписаться на акции", callback_data="subscribe_promo")],
         [InlineKeyboardButton(text="📋 Главное меню", callback_data="main_menu")]
     ]
@@ -380,10 +870,11 @@ async def complete_order(message: Message, state: FSMContext, bot: Bot = None):
     await state.clear()
 
 # ОБНОВЛЕННАЯ ФУНКЦИЯ СТАТУСА ЗАКАЗА
-@router.callback_query(F.data.startswith("order_status_"))
-async def check_order_status(callback: CallbackQuery, bot: Bot):
+@callbacks.packed(ORDER_STATUS, flags={"flood": "refresh"})
+@callbacks.prefix("order_status_", ORDER_STATUS.from_text, flags={"flood": "refresh"})
+async def check_order_status(callback: CallbackQuery, bot: Bot, cb):
     """Проверка статуса заказа с возможностью симуляции прогресса"""
-    order_id = callback.data.split('_')[2]
+    order_id = cb.order_id
     
     if order_id not in user_orders:
         await callback.message.edit_text(
@@ -402,7 +893,7 @@ async def check_order_status(callback: CallbackQuery, bot: Bot):
     
     # Если заказ не завершен, добавляем кнопку "Обновить статус" для демо
     if order['status'] != "Доставлен":
-        keyboard.append([InlineKeyboardButton(text="🔄 Обновить статус (демо)", callback_data=f"simulate_progress_{order_id}")])
+        keyboard.append([InlineKeyboardButton(text="🔄 Обновить статус (демо)", callback_data=SIMULATE_PROGRESS.pack(order_id))])
     
     keyboard.extend([
         [InlineKeyboardButton(text="📞 Связаться с нами", callback_data="support")],
@@ -426,22 +917,26 @@ async def check_order_status(callback: CallbackQuery, bot: Bot):
         f"{status_description}\n\n"
         f"📅 Создан: {order['created_at']}\n"
         f"🚚 Доставка: {order['delivery_type']}\n"
-        f"💵 Сумма: {order['total']}₽\n"
+        f"💵 Сумма: {format_price(order['total'])}₽\n"
     )
     
+    upcoming = sorted(timers.group(f"order:{order_id}"), key=lambda timer: timer.due)
+    if upcoming:
+        order_text += f"⏱ Далее: {upcoming[0].data['status']} ~ в {datetime.fromtimestamp(upcoming[0].due):%H:%M}\n"
+    
     if order['delivery_type'] == 'Самовывоз' and order['status'] in ['Готов', 'В пути', 'Доставлен']:
         order_text += "\n🏪 Адрес самовывоза:\nг. Москва, ул. Велосипедная, 1\n⏰ 10:00-20:00"
     
     await callback.message.edit_text(order_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard))
 
 # ДЕМО-ФУНКЦИЯ ДЛЯ СИМУЛЯЦИИ ПРОГРЕССА
-@router.callback_query(F.data.startswith("simulate_progress_"))
-async def simulate_order_progress_demo(callback: CallbackQuery, bot: Bot):
+@callbacks.packed(SIMULATE_PROGRESS, flags={"flood": "refresh"})
+async def simulate_order_progress_demo(callback: CallbackQuery, bot: Bot, cb):
     """Демо-функция для симуляции прогресса заказа"""
-    order_id = callback.data.split('_')[2]
+    order_id = cb.order_id
     
     if order_id in user_orders:
         await simulate_order_progress(bot, order_id)
-        await check_order_status(callback, bot)  # Показываем обновленный статус
+        await check_order_status(callback, bot, ORDER_STATUS.record(order_id))  # Показываем обновленный статус
     else:
         await callback.answer("❌ Заказ не найден")
\ No newline at end of file
@@ -0,0 +1,53 @@
+import asyncio
+import importlib
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from aiogram import Dispatcher
+
+logger = logging.getLogger(__name__)
+
+
+class LazyRouters:
+    """
+    Роутеры, импортируемые после старта polling
+    Модули с обработчиками (и всё, что они тянут: клавиатуры, тесты,
+    сервисы) импортируются в фоне, в отдельном потоке, уже после запуска
+    бота, и подключаются к диспетчеру по мере готовности. Апдейты,
+    пришедшие раньше, ждут окончания загрузки - первый ответ чуть
+    медленнее, зато процесс стартует и начинает опрос сразу.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, modules: Iterable[str]):
+        self.dispatcher = dispatcher
+        self.modules = list(modules)
+        self._loading: Optional[asyncio.Task] = None
+        dispatcher.startup.register(self._on_startup)
+        dispatcher.update.outer_middleware(self._wait_loaded)
+
+    async def _on_startup(self) -> None:
+        self._loading = asyncio.create_task(self._load())
+
+    async def _load(self) -> None:
+        for name in self.modules:
+            started = time.perf_counter()
+            try:
+                module = await asyncio.to_thread(importlib.import_module, name)
+            except Exception as e:
+                logger.error(f"❌ Не удалось загрузить роутер {name}: {e}")
+                continue
+            self.dispatcher.include_router(module.router)
+            logger.info(f"Роутер {name} загружен за {(time.perf_counter() - started) * 1000:.0f} мс")
+
+    async def _wait_loaded(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        loading = self._loading
+        if loading is not None and not loading.done():
+            # shield: отмена одного апдейта не должна прерывать загрузку
+            await asyncio.shield(loading)
+        return await handler(event, data)
@@ -1,4 +1,5 @@
 import logging
+import os
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.filters import Command
@@ -7,16 +8,17 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from ..config import config
+from ..services.quiz_engine import QuizEngine
+from ..services.quiz_sessions import QuizSession, QuizSessionStore
+from ..services.callback_data import CallbackRouter
+from ..services.callback_schemas import codec, SUPPORT_REPLY, SUPPORT_RESOLVE
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
-# Роутер
+# Роутер; кнопки с параметрами разбирает CallbackRouter
 router = Router()
+callbacks = CallbackRouter(codec)
+callbacks.attach(router)
 
 
 # Состояния для FSM
@@ -24,47 +26,12 @@ class SupportStates(StatesGroup):
     awaiting_support_message = State()
     replying_to_user = State()
 
-# Структура тестов
-TESTS = [
-    {
-        "id": 1,
-        "name": "bike_type_selection",
-        "title": "🚴 Подбор идеального велосипеда",
-        "questions": [
-            {
-                "id": 1,
-                "text": "Для каких целей планируете использовать велосипед?",
-                "answers": [
-                    {"id": 1, "key": "city", "value": 1, "text": "🏙️ Городские поездки"},
-                    {"id": 2, "key": "sport", "value": 2, "text": "🏁 Спорт и тренировки"},
-                    {"id": 3, "key": "tourism", "value": 3, "text": "🗺️ Туризм и походы"},
-                    {"id": 4, "key": "offroad", "value": 4, "text": "🏔️ Бездорожье и горы"}
-                ]
-            },
-            {
-                "id": 2,
-                "text": "Какой у вас уровень подготовки?",
-                "answers": [
-                    {"id": 5, "key": "beginner", "value": 1, "text": "🟢 Начинающий"},
-                    {"id": 6, "key": "intermediate", "value": 2, "text": "🟡 Продолжающий"},
-                    {"id": 7, "key": "pro", "value": 3, "text": "🔴 Профессионал"}
-                ]
-            },
-            {
-                "id": 3,
-                "text": "Какой бюджет рассматриваете?",
-                "answers": [
-                    {"id": 8, "key": "budget", "value": 1, "text": "💰 До 20,000₽"},
-                    {"id": 9, "key": "medium", "value": 2, "text": "💵 20,000-50,000₽"},
-                    {"id": 10, "key": "premium", "value": 3, "text": "💎 Свыше 50,000₽"}
-                ]
-            }
-        ]
-    }
-]
+# Тесты (общий с support_bot файл, перечитывается при изменении)
+quiz_engine = QuizEngine(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), config.QUIZ_PATH))
+quiz_engine.load()
 
 # Хранилища данных
-user_progress = {}
+quiz_sessions = QuizSessionStore(ttl=3600, max_entries=100_000)
 user_support_messages = {}
 
 @router.message(Command("start"))
@@ -147,8 +114,8 @@ async def forward_to_support(message: Message, state: FSMContext, bot: Bot, conf
     
     # Клавиатура для ответа поддержки
     reply_keyboard = [
-        [InlineKeyboardButton(text="📝 Ответить", callback_data=f"reply_{user.id}")],
-        [InlineKeyboardButton(text="✅ Решено", callback_data=f"resolve_{user.id}")]
+        [InlineKeyboardButton(text="📝 Ответить", callback_data=SUPPORT_REPLY.pack(user.id))],
+        [InlineKeyboardButton(text="✅ Решено", callback_data=SUPPORT_RESOLVE.pack(user.id))]
     ]
     reply_markup = InlineKeyboardMarkup(inline_keyboard=reply_keyboard)
     
@@ -189,10 +156,11 @@ async def forward_to_support(message: Message, state: FSMContext, bot: Bot, conf
     # Сбрасываем состояние
     await state.clear()
 
-@router.callback_query(F.data.startswith("reply_"))
-async def handle_support_reply(callback: CallbackQuery, state: FSMContext, config=config):
+@callbacks.packed(SUPPORT_REPLY)
+@callbacks.prefix("reply_", SUPPORT_REPLY.from_text)
+async def handle_support_reply(callback: CallbackQuery, state: FSMContext, cb, config=config):
     """Обработка ответа от поддержки"""
-    user_id = int(callback.data.split('_')[1])
+    user_id = cb.user_id
     
     user_name = "пользователь"
     if user_id in user_support_messages and user_support_messages[user_id]:
@@ -208,10 +176,11 @@ async def handle_support_reply(callback: CallbackQuery, state: FSMContext, confi
     await state.update_data(user_id=user_id)
     await callback.answer()
 
-@router.callback_query(F.data.startswith("resolve_"))
-async def handle_resolve_support(callback: CallbackQuery, config=config):
+@callbacks.packed(SUPPORT_RESOLVE)
+@callbacks.prefix("resolve_", SUPPORT_RESOLVE.from_text)
+async def handle_resolve_support(callback: CallbackQuery, cb, config=config):
     """Пометить обращение как решенное"""
-    user_id = int(callback.data.split('_')[1])
+    user_id = cb.user_id
     
     await callback.message.edit_text(
         f"✅ Обращение {user_id} помечено как решенное"
@@ -266,8 +235,8 @@ async def forward_user_reply_to_support(message: Message, bot: Bot, config=confi
 
         try:
             keyboard = [
-                [InlineKeyboardButton(text="📝 Ответить", callback_data=f"reply_{user.id}")],
-                [InlineKeyboardButton(text="✅ Решено", callback_data=f"resolve_{user.id}")]
+                [InlineKeyboardButton(text="📝 Ответить", callback_data=SUPPORT_REPLY.pack(user.id))],
+                [InlineKeyboardButton(text="✅ Решено", callback_data=SUPPORT_RESOLVE.pack(user.id))]
             ]
             
             await bot.send_message(
@@ -327,109 +296,62 @@ async def handle_main_menu(callback: CallbackQuery):
     await callback.answer()
 
 # Обработчики тестов и каталога
-@router.callback_query(F.data.startswith("test_"))
-async def handle_test_selection(callback: CallbackQuery):
+@callbacks.prefix("test_", int)
+async def handle_test_selection(callback: CallbackQuery, state: FSMContext, cb: int):
     """Обработка выбора теста"""
-    global user_progress
-    test_id = int(callback.data.split('_')[1])
+    test_id = cb
     user_id = callback.from_user.id
     
-    test = next((t for t in TESTS if t['id'] == test_id), None)
-    if not test:
+    quiz = quiz_engine.quiz(test_id)
+    if not quiz:
         await callback.message.edit_text("Тест не найден")
         return
     
-    user_progress[user_id] = {
-        'test_id': test_id,
-        'current_question': 0,
-        'answers': {},
-        'test_data': test
-    }
+    session = QuizSession(test_id)
+    await quiz_sessions.save(user_id, session, state)
     
-    await show_question(callback)
+    await show_question(callback, session, state)
     await callback.answer()
 
-async def show_question(callback: CallbackQuery):
+async def show_question(callback: CallbackQuery, session: QuizSession, state: FSMContext):
     """Показ вопроса теста"""
-    user_id = callback.from_user.id
-    global user_progress
-    if user_id not in user_progress:
+    quiz = quiz_engine.quizzes.get(session.test_id)
+    if not quiz:
         await callback.message.edit_text("Сессия устарела")
         return
     
-    progress = user_progress[user_id]
-    test = progress['test_data']
-    current_q_index = progress['current_question']
-    
-    if current_q_index >= len(test['questions']):
-        await finish_test(callback)
+    question = quiz.question(session.index)
+    if question is None:
+        await finish_test(callback, state)
         return
     
-    question = test['questions'][current_q_index]
-    
-    keyboard = []
-    for answer in question['answers']:
-        keyboard.append([InlineKeyboardButton(text=answer['text'], callback_data=f"answer_{answer['id']}")])
-    
-    if current_q_index > 0:
-        keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back")])
-    
-    keyboard.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_test")])
-    
-    reply_markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
-    
-    progress_text = f"📊 Вопрос {current_q_index + 1}/{len(test['questions'])}"
-    
-    await callback.message.edit_text(
-        f"{progress_text}\n\n{question['text']}",
-        reply_markup=reply_markup
-    )
+    await callback.message.edit_text(question.screen, reply_markup=question.markup)
 
-@router.callback_query(F.data.startswith("answer_"))
-async def handle_answer(callback: CallbackQuery):
+@callbacks.prefix("answer_", int)
+async def handle_answer(callback: CallbackQuery, state: FSMContext, cb: int):
     """Обработка ответа на вопрос теста"""
     user_id = callback.from_user.id
-    global user_progress
-    if callback.data == "back":
-        progress = user_progress[user_id]
-        if progress['current_question'] > 0:
-            progress['current_question'] -= 1
-        await show_question(callback)
-        return
-    
-    if callback.data == "cancel_test":
-        if user_id in user_progress:
-            del user_progress[user_id]
-        await callback.message.edit_text("Тест отменен")
-        await handle_main_menu(callback)
+    session = await quiz_sessions.load(user_id, state)
+    if not session:
+        await callback.answer("❌ Сессия устарела")
         return
     
-    answer_id = int(callback.data.split('_')[1])
-    
-    progress = user_progress[user_id]
-    test = progress['test_data']
-    current_question = test['questions'][progress['current_question']]
-    
-    selected_answer = next((a for a in current_question['answers'] if a['id'] == answer_id), None)
-    if not selected_answer:
-        await callback.message.edit_text("Ошибка: ответ не найден")
+    answer = quiz_engine.answer(cb)
+    # Ответ должен относиться к текущему вопросу (старая кнопка или тест перезагружен)
+    if not answer or answer.question.quiz.id != session.test_id \
+            or answer.question.index != session.index:
+        await callback.answer("Ошибка: ответ не найден")
         return
     
-    progress['answers'][current_question['id']] = selected_answer['id']
-    progress['current_question'] += 1
+    session.answer(answer.id)
+    await quiz_sessions.save(user_id, session, state)
     
-    await show_question(callback)
+    await show_question(callback, session, state)
     await callback.answer()
 
-async def finish_test(callback: CallbackQuery):
+async def finish_test(callback: CallbackQuery, state: FSMContext):
     """Завершение теста"""
     user_id = callback.from_user.id
-    global user_progress
-    if user_id not in user_progress:
-        await callback.message.edit_text("Сессия устарела")
-        return
-    
-    progress = user_progress[user_id]
     
     # Рекомендации на основе теста
     recommendations = "🚲 Рекомендуем:\n• Городской велосипед - 25,000₽\n• Горный велосипед - 35,000₽"
@@ -445,7 +367,7 @@ async def finish_test(callback: CallbackQuery):
         reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
     )
     
-    del user_progress[user_id]
+    await quiz_sessions.drop(user_id, state)
 
 @router.callback_query(F.data == "catalog")
 async def handle_catalog(callback: CallbackQuery):
@@ -0,0 +1,172 @@
+import asyncio
+import heapq
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# Отменённые заказы не считаются продажами
+CANCELLED_STATUSES = ("Отменен",)
+
+
+def _day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+
+
+class _Counter:
+    __slots__ = ("count", "revenue")
+
+    def __init__(self):
+        self.count = 0
+        self.revenue = 0
+
+    def add(self, count: int, revenue: float) -> None:
+        self.count += count
+        self.revenue += revenue
+
+    def as_tuple(self) -> Tuple[int, float]:
+        return self.count, self.revenue
+
+
+class SalesAnalytics:
+    """
+    Агрегаты продаж, обновляемые на каждом заказе и смене статуса
+    Хранятся готовые счётчики (количество, выручка) по дню, статусу,
+    способу доставки, дню и доставке, а также по товарам, поэтому
+    ответ на вопрос вида "выручка сегодня по способам доставки" не
+    требует обхода заказов.
+    """
+
+    def __init__(self, cancelled: Tuple[str, ...] = CANCELLED_STATUSES):
+        # Заказы в этих статусах остаются только в by_status
+        self.cancelled = cancelled
+        self.by_day: Dict[str, _Counter] = {}
+        self.by_status: Dict[str, _Counter] = {}
+        self.by_delivery: Dict[str, _Counter] = {}
+        self.by_day_delivery: Dict[Tuple[str, str], _Counter] = {}
+        # product_id -> [количество штук, выручка]
+        self.by_product: Dict[int, List[float]] = {}
+        self.names: Dict[int, str] = {}
+
+    @staticmethod
+    def _bump(table: Dict[Any, _Counter], key: Any, count: int, revenue: float) -> None:
+        counter = table.get(key)
+        if counter is None:
+            counter = table[key] = _Counter()
+        counter.add(count, revenue)
+
+    def _sales(self, order: dict, sign: int) -> None:
+        """Добавить заказ в счётчики продаж (sign=1) или убрать из них (sign=-1)"""
+        day = _day(order['created_ts'])
+        revenue = sign * order['total']
+        delivery = order['delivery_type']
+        self._bump(self.by_day, day, sign, revenue)
+        self._bump(self.by_delivery, delivery, sign, revenue)
+        self._bump(self.by_day_delivery, (day, delivery), sign, revenue)
+        for item in order['items']:
+            product_id = item.get('product_id')
+            totals = self.by_product.setdefault(product_id, [0, 0])
+            totals[0] += sign * item['quantity']
+            totals[1] += sign * item['total']
+            self.names[product_id] = item['name']
+
+    def order_created(self, order: dict) -> None:
+        self._bump(self.by_status, order['status'], 1, order['total'])
+        if order['status'] not in self.cancelled:
+            self._sales(order, 1)
+
+    def status_changed(self, order: dict, old_status: str) -> None:
+        """Перенести заказ из счётчика old_status в счётчик текущего статуса (отмена снимает продажу)"""
+        if old_status == order['status']:
+            return
+        self._bump(self.by_status, old_status, -1, -order['total'])
+        self._bump(self.by_status, order['status'], 1, order['total'])
+        was_cancelled, cancelled = old_status in self.cancelled, order['status'] in self.cancelled
+        if cancelled and not was_cancelled:
+            self._sales(order, -1)
+        elif was_cancelled and not cancelled:
+            self._sales(order, 1)
+
+    def day(self, day: Optional[str] = None) -> Tuple[int, float]:
+        counter = self.by_day.get(day or _day(datetime.now().timestamp()))
+        return counter.as_tuple() if counter else (0, 0.0)
+
+    def day_by_delivery(self, day: Optional[str] = None) -> Dict[str, Tuple[int, float]]:
+        day = day or _day(datetime.now().timestamp())
+        return {
+            delivery: self.by_day_delivery[(day, delivery)].as_tuple()
+            for delivery in self.by_delivery
+            if (day, delivery) in self.by_day_delivery
+        }
+
+    def statuses(self) -> Dict[str, Tuple[int, float]]:
+        return {status: counter.as_tuple() for status, counter in self.by_status.items() if counter.count}
+
+    def top_products(self, limit: int = 5) -> List[Tuple[str, int, float]]:
+        """Товары с наибольшей выручкой: (название, штук, выручка)"""
+        top = heapq.nlargest(limit, self.by_product.items(), key=lambda item: item[1][1])
+        return [(self.names.get(product_id, f"#{product_id}"), int(quantity), revenue)
+                for product_id, (quantity, revenue) in top]
+
+
+def build_report(orders: List[Tuple[float, int, float, str, str]]) -> Dict[str, Any]:
+    """
+    Подробный отчёт за период (выполняется в отдельном процессе)
+    orders: (created_ts, user_id, total, delivery_type, status); отменённые не учитываются
+    """
+    orders = [order for order in orders if order[4] not in CANCELLED_STATUSES]
+    if not orders:
+        return {"orders": 0}
+
+    totals = sorted(order[2] for order in orders)
+    per_user: Dict[int, int] = {}
+    per_weekday = [0] * 7
+    per_hour = [0] * 24
+    per_delivery: Dict[str, float] = {}
+    for created_ts, user_id, total, delivery, _ in orders:
+        per_user[user_id] = per_user.get(user_id, 0) + 1
+        moment = datetime.fromtimestamp(created_ts)
+        per_weekday[moment.weekday()] += total
+        per_hour[moment.hour] += 1
+        per_delivery[delivery] = per_delivery.get(delivery, 0) + total
+
+    quantiles = statistics.quantiles(totals, n=10) if len(totals) > 1 else [totals[0]] * 9
+    return {
+        "orders": len(orders),
+        "revenue": sum(totals),
+        "average": statistics.fmean(totals),
+        "median": statistics.median(totals),
+        "p90": quantiles[-1],
+        "customers": len(per_user),
+        "repeat_rate": sum(1 for count in per_user.values() if count > 1) / len(per_user),
+        "busiest_hour": max(range(24), key=per_hour.__getitem__),
+        "best_weekday": max(range(7), key=per_weekday.__getitem__),
+        "by_delivery": per_delivery
+    }
+
+
+class ReportRunner:
+    """Тяжёлые отчёты в пуле процессов, чтобы не блокировать цикл событий бота"""
+
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    async def run(self, function: Callable[..., Any], *args: Any) -> Any:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return await asyncio.get_running_loop().run_in_executor(self._pool, function, *args)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def report_rows(orders: Iterable[dict]) -> List[Tuple[float, int, float, str, str]]:
+    """Компактные строки заказов для передачи в процесс отчёта"""
+    return [
+        (order['created_ts'], order['user_id'], order['total'], order['delivery_type'], order['status'])
+        for order in orders
+    ]
@@ -0,0 +1,240 @@
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, Iterator, Optional, Union
+
+CHUNK_BITS = 16
+LOW_MASK = (1 << CHUNK_BITS) - 1
+# Контейнер до ARRAY_LIMIT значений - отсортированный массив (2 байта на значение),
+# больше - битовая карта на 65536 бит (8 КБ). На этой границе размеры равны
+ARRAY_LIMIT = 4096
+BITSET_BYTES = (1 << CHUNK_BITS) // 8
+
+MAGIC = b"RBM1"
+_HEADER = struct.Struct("<4sI")
+_CONTAINER = struct.Struct("<qBI")
+_KIND_ARRAY = 0
+_KIND_BITSET = 1
+
+Container = Union[array, int]
+
+
+def _array_to_bits(values: array) -> int:
+    buffer = bytearray(BITSET_BYTES)
+    for value in values:
+        buffer[value >> 3] |= 1 << (value & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def _bits_to_array(bits: int) -> array:
+    values = array("H")
+    for index, byte in enumerate(bits.to_bytes(BITSET_BYTES, "little")):
+        if byte:
+            base = index << 3
+            for bit in range(8):
+                if byte >> bit & 1:
+                    values.append(base | bit)
+    return values
+
+
+def _normalize(container: Container) -> Optional[Container]:
+    """Пустой контейнер -> None, маленькую битовую карту - обратно в массив"""
+    if isinstance(container, int):
+        count = container.bit_count()
+        if count == 0:
+            return None
+        return _bits_to_array(container) if count <= ARRAY_LIMIT else container
+    return container if len(container) else None
+
+
+def _contains(container: Container, low: int) -> bool:
+    if isinstance(container, int):
+        return bool(container >> low & 1)
+    position = bisect_left(container, low)
+    return position < len(container) and container[position] == low
+
+
+def _and(left: Container, right: Container) -> Optional[Container]:
+    if isinstance(left, int) and isinstance(right, int):
+        return _normalize(left & right)
+    if isinstance(left, int):
+        left, right = right, left
+    if isinstance(right, int):
+        bits = right.to_bytes(BITSET_BYTES, "little")
+        return _normalize(array("H", (value for value in left if bits[value >> 3] >> (value & 7) & 1)))
+    # Два массива: пересечение множеств в C вместо поиска каждого значения
+    return _normalize(array("H", sorted(set(left).intersection(right))))
+
+
+def _or(left: Container, right: Container) -> Container:
+    if isinstance(left, array) and isinstance(right, array) and len(left) + len(right) <= ARRAY_LIMIT:
+        return array("H", sorted(set(left).union(right)))
+    left_bits = left if isinstance(left, int) else _array_to_bits(left)
+    right_bits = right if isinstance(right, int) else _array_to_bits(right)
+    return _normalize(left_bits | right_bits)
+
+
+def _andnot(left: Container, right: Container) -> Optional[Container]:
+    if isinstance(left, int):
+        right_bits = right if isinstance(right, int) else _array_to_bits(right)
+        return _normalize(left & ~right_bits)
+    if isinstance(right, int):
+        bits = right.to_bytes(BITSET_BYTES, "little")
+        return _normalize(array("H", (value for value in left if not bits[value >> 3] >> (value & 7) & 1)))
+    return _normalize(array("H", sorted(set(left).difference(right))))
+
+
+class RoaringBitmap:
+    """
+    Сжатое множество неотрицательных целых (user_id) в стиле Roaring
+    Значения делятся на блоки по старшим битам; каждый блок хранится
+    либо отсортированным массивом (разреженный), либо битовой картой
+    (плотный). Пересечение, объединение и разность считаются поблочно.
+    """
+
+    __slots__ = ("_containers",)
+
+    def __init__(self, values: Iterable[int] = ()):
+        self._containers: Dict[int, Container] = {}
+        for value in values:
+            self.add(value)
+
+    def add(self, value: int) -> None:
+        key, low = value >> CHUNK_BITS, value & LOW_MASK
+        container = self._containers.get(key)
+        if container is None:
+            self._containers[key] = array("H", (low,))
+        elif isinstance(container, int):
+            self._containers[key] = container | (1 << low)
+        else:
+            position = bisect_left(container, low)
+            if position < len(container) and container[position] == low:
+                return
+            container.insert(position, low)
+            if len(container) > ARRAY_LIMIT:
+                self._containers[key] = _array_to_bits(container)
+
+    def discard(self, value: int) -> None:
+        key, low = value >> CHUNK_BITS, value & LOW_MASK
+        container = self._containers.get(key)
+        if container is None:
+            return
+        if isinstance(container, int):
+            container = _normalize(container & ~(1 << low))
+        else:
+            position = bisect_left(container, low)
+            if position < len(container) and container[position] == low:
+                del container[position]
+            container = _normalize(container)
+        if container is None:
+            del self._containers[key]
+        else:
+            self._containers[key] = container
+
+    def __contains__(self, value: int) -> bool:
+        container = self._containers.get(value >> CHUNK_BITS)
+        return container is not None and _contains(container, value & LOW_MASK)
+
+    def __len__(self) -> int:
+        return sum(
+            container.bit_count() if isinstance(container, int) else len(container)
+            for container in self._containers.values()
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self._containers)
+
+    def __iter__(self) -> Iterator[int]:
+        return self.iter_from(None)
+
+    def iter_from(self, after: Optional[int] = None) -> Iterator[int]:
+        """Значения больше after по возрастанию"""
+        for key in sorted(self._containers):
+            if after is not None and key < after >> CHUNK_BITS:
+                continue
+            container = self._containers[key]
+            values = _bits_to_array(container) if isinstance(container, int) else container
+            start = 0
+            if after is not None and key == after >> CHUNK_BITS:
+                start = bisect_right(values, after & LOW_MASK)
+            base = key << CHUNK_BITS
+            for index in range(start, len(values)):
+                yield base | values[index]
+
+    def __and__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        result = RoaringBitmap()
+        small, large = sorted((self._containers, other._containers), key=len)
+        for key, container in small.items():
+            if key in large:
+                merged = _and(container, large[key])
+                if merged is not None:
+                    result._containers[key] = merged
+        return result
+
+    def __or__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        result = self.copy()
+        for key, container in other._containers.items():
+            existing = result._containers.get(key)
+            result._containers[key] = _or(existing, container) if existing is not None else _copy(container)
+        return result
+
+    def __sub__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        result = RoaringBitmap()
+        for key, container in self._containers.items():
+            if key in other._containers:
+                container = _andnot(container, other._containers[key])
+                if container is None:
+                    continue
+            result._containers[key] = _copy(container)
+        return result
+
+    def copy(self) -> "RoaringBitmap":
+        result = RoaringBitmap()
+        result._containers = {key: _copy(container) for key, container in self._containers.items()}
+        return result
+
+    def to_bytes(self) -> bytes:
+        parts = [_HEADER.pack(MAGIC, len(self._containers))]
+        for key in sorted(self._containers):
+            container = self._containers[key]
+            if isinstance(container, int):
+                parts.append(_CONTAINER.pack(key, _KIND_BITSET, BITSET_BYTES))
+                parts.append(container.to_bytes(BITSET_BYTES, "little"))
+            else:
+                parts.append(_CONTAINER.pack(key, _KIND_ARRAY, len(container)))
+                parts.append(_little_endian(container).tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: Union[bytes, memoryview]) -> "RoaringBitmap":
+        data = memoryview(data)
+        magic, count = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("Неизвестный формат битовой карты")
+        result = cls()
+        offset = _HEADER.size
+        for _ in range(count):
+            key, kind, size = _CONTAINER.unpack_from(data, offset)
+            offset += _CONTAINER.size
+            if kind == _KIND_BITSET:
+                result._containers[key] = int.from_bytes(data[offset:offset + size], "little")
+                offset += size
+            else:
+                values = array("H")
+                values.frombytes(data[offset:offset + 2 * size])
+                result._containers[key] = _little_endian(values)
+                offset += 2 * size
+        return result
+
+
+def _copy(container: Container) -> Container:
+    return container if isinstance(container, int) else array("H", container)
+
+
+def _little_endian(values: array) -> array:
+    if sys.byteorder == "little":
+        return values
+    swapped = array("H", values)
+    swapped.byteswap()
+    return swapped
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from services.notifications import NotificationPipeline, PRIORITY_PROMO
+
+logger = logging.getLogger(__name__)
+
+
+class Campaign:
+    """Состояние рассылки; сохраняется в файл контрольной точки"""
+
+    FIELDS = ("id", "promotion", "audience", "status", "total", "sent", "failed",
+              "removed", "checkpoint", "started_at", "finished_at")
+
+    def __init__(self, campaign_id: str, promotion: dict, audience: str, total: int):
+        self.id = campaign_id
+        self.promotion = promotion
+        self.audience = audience
+        self.status = "running"
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.removed = 0
+        # Все получатели с user_id <= checkpoint уже обработаны
+        self.checkpoint: Optional[int] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed + self.removed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Campaign":
+        campaign = cls(data["id"], data["promotion"], data["audience"], data["total"])
+        for field in cls.FIELDS:
+            setattr(campaign, field, data[field])
+        return campaign
+
+
+class BroadcastEngine:
+    """
+    Рассылка акций с ограничением скорости и возобновлением
+    Получатели читаются из аудитории потоком по возрастанию user_id.
+    Отправка идёт через очередь уведомлений с низким приоритетом, поэтому
+    уведомления о заказах не ждут рассылку. Прогресс периодически
+    сохраняется, и после падения рассылка продолжается с места остановки.
+    Пользователи, заблокировавшие бота, удаляются из аудитории. Если Telegram
+    просит подождать, пауза берётся рассылкой, а отправка повторяется один раз.
+
+    Аудитория регистрируется по имени в audiences или создаётся
+    audience_factory(name) на каждую рассылку и должна уметь:
+        iter_from(after_user_id) - user_id по возрастанию, больше after_user_id
+        discard(user_id) - убрать пользователя
+        __len__()
+    """
+
+    def __init__(self, pipeline: NotificationPipeline, directory: str,
+                 rate: float = 25, max_in_flight: int = 50, checkpoint_every: int = 200,
+                 audience_factory: Optional[Callable[[str], Any]] = None):
+        self.pipeline = pipeline
+        self.directory = directory
+        self.rate = rate
+        self.max_in_flight = max_in_flight
+        self.checkpoint_every = checkpoint_every
+        self.audiences: Dict[str, Any] = {}
+        self.audience_factory = audience_factory
+        self.campaigns: Dict[str, Campaign] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _path(self, campaign_id: str) -> str:
+        return os.path.join(self.directory, f"{campaign_id}.json")
+
+    def _save(self, campaign: Campaign) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self._path(campaign.id)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(campaign.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(campaign.id))
+
+    def _audience(self, name: str) -> Any:
+        if name in self.audiences:
+            return self.audiences[name]
+        if self.audience_factory is None:
+            raise KeyError(f"Неизвестная аудитория {name}")
+        return self.audience_factory(name)
+
+    def start(self, campaign_id: str, promotion: dict, audience: str,
+              send: Callable[[Bot, int, dict], Awaitable[Any]]) -> Campaign:
+        """Запустить новую рассылку"""
+        if campaign_id in self._tasks:
+            raise ValueError(f"Рассылка {campaign_id} уже идёт")
+        members = self._audience(audience)
+        campaign = Campaign(campaign_id, promotion, audience, len(members))
+        self._save(campaign)
+        self._launch(campaign, send, members)
+        return campaign
+
+    def resume(self, send: Callable[[Bot, int, dict], Awaitable[Any]]) -> int:
+        """Продолжить рассылки, прерванные перезапуском. Возвращает их количество"""
+        if not os.path.isdir(self.directory):
+            return 0
+
+        resumed = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                campaign = Campaign.from_dict(json.load(f))
+            self.campaigns[campaign.id] = campaign
+            if campaign.status != "running":
+                continue
+            try:
+                members = self._audience(campaign.audience)
+            except (KeyError, ValueError) as e:
+                logger.error(f"❌ Рассылку {campaign.id} не продолжить: {e}")
+                continue
+            logger.info(f"📣 Возобновление рассылки {campaign.id} после user_id {campaign.checkpoint}")
+            self._launch(campaign, send, members)
+            resumed += 1
+        return resumed
+
+    def _launch(self, campaign: Campaign, send: Callable[[Bot, int, dict], Awaitable[Any]],
+                audience: Any) -> None:
+        self.campaigns[campaign.id] = campaign
+        task = asyncio.create_task(self._run(campaign, send, audience))
+        self._tasks[campaign.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(campaign.id, None))
+
+    async def stop(self) -> None:
+        """Остановить рассылки (прогресс сохранён - продолжатся после перезапуска)"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        for task in list(self._tasks.values()):
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def progress(self, campaign_id: str) -> Optional[Dict[str, Any]]:
+        campaign = self.campaigns.get(campaign_id)
+        if campaign is None:
+            return None
+        remaining = max(0, campaign.total - campaign.processed)
+        return {
+            "status": campaign.status,
+            "sent": campaign.sent,
+            "failed": campaign.failed,
+            "removed": campaign.removed,
+            "remaining": remaining,
+            "eta_seconds": remaining / self.rate if campaign.status == "running" else 0
+        }
+
+    @staticmethod
+    def _deliver(send, user_id: int, promotion: dict) -> Callable[[Bot], Awaitable[Any]]:
+        async def deliver(bot: Bot):
+            await send(bot, user_id, promotion)
+        return deliver
+
+    async def _run(self, campaign: Campaign, send, audience: Any) -> None:
+        interval = 1 / self.rate
+        # (user_id, future, повторная ли это попытка)
+        in_flight: deque = deque()
+        next_send_at = time.monotonic()
+        since_checkpoint = 0
+
+        def submit(user_id: int, retry: bool = False) -> None:
+            deliver = self._deliver(send, user_id, campaign.promotion)
+            future = self.pipeline.submit(f"promo:{campaign.id}:{user_id}", deliver, PRIORITY_PROMO, chat_id=user_id)
+            if retry:
+                in_flight[0] = (user_id, future, True)
+            else:
+                in_flight.append((user_id, future, False))
+
+        def settle(user_id: int, outcome: Dict[str, Any]) -> None:
+            if outcome["status"] == "sent":
+                campaign.sent += 1
+            elif isinstance(outcome["error"], TelegramForbiddenError):
+                audience.discard(user_id)
+                campaign.removed += 1
+            else:
+                campaign.failed += 1
+
+        async def drain(limit: int) -> None:
+            # Контрольная точка двигается только по непрерывному префиксу завершённых
+            nonlocal since_checkpoint, next_send_at
+            while in_flight and (len(in_flight) > limit or in_flight[0][1].done()):
+                user_id, future, retried = in_flight[0]
+                outcome = await future
+                error = outcome["error"]
+                if isinstance(error, TelegramRetryAfter) and not retried:
+                    # Telegram просит подождать: пауза у рассылки, а не у воркера
+                    # уведомлений - уведомления о заказах идут без задержки
+                    next_send_at = max(next_send_at, time.monotonic() + error.retry_after)
+                    await asyncio.sleep(next_send_at - time.monotonic())
+                    submit(user_id, retry=True)
+                    continue
+                in_flight.popleft()
+                settle(user_id, outcome)
+                campaign.checkpoint = user_id
+                since_checkpoint += 1
+            if since_checkpoint >= self.checkpoint_every:
+                self._save(campaign)
+                since_checkpoint = 0
+
+        try:
+            recipients: Iterator[int] = audience.iter_from(campaign.checkpoint)
+            for user_id in recipients:
+                delay = next_send_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                next_send_at = max(next_send_at + interval, time.monotonic() - 1)
+
+                submit(user_id)
+                await drain(self.max_in_flight - 1)
+
+            await drain(0)
+            campaign.status = "finished"
+            campaign.finished_at = time.time()
+            logger.info(
+                f"📣 Рассылка {campaign.id} завершена: отправлено {campaign.sent}, "
+                f"ошибок {campaign.failed}, удалено {campaign.removed}"
+            )
+        except asyncio.CancelledError:
+            # Дожидаемся уже отправленных, чтобы после перезапуска не слать их повторно
+            try:
+                await asyncio.wait_for(drain(0), 5)
+            except asyncio.TimeoutError:
+                pass
+            logger.info(f"⏸ Рассылка {campaign.id} приостановлена на user_id {campaign.checkpoint}")
+            raise
+        except Exception as e:
+            campaign.status = "failed"
+            logger.error(f"❌ Рассылка {campaign.id} прервана: {e}")
+        finally:
+            self._save(campaign)
@@ -0,0 +1,217 @@
+import base64
+import inspect
+import struct
+from collections import namedtuple
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import Router
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.types import CallbackQuery
+
+from .metrics import set_handler_name
+
+# Упакованные callback_data начинаются с этого символа (в текстовых его нет)
+PACKED_PREFIX = "~"
+# Ограничение Telegram на callback_data
+MAX_LENGTH = 64
+# Типы полей: формат struct для чисел, "s" - строка до 255 байт
+FIELD_TYPES = {"B": int, "b": int, "H": int, "I": int, "i": int, "q": int, "Q": int, "s": str}
+
+Handler = Callable[..., Awaitable[Any]]
+# Ключ данных обработчика, под которым лежит уже найденный маршрут апдейта
+ROUTE_KEY = "callback_route"
+
+
+class CallbackSchema:
+    """Типизированная схема callback_data: тег (1 байт) и поля фиксированного порядка"""
+
+    def __init__(self, name: str, tag: int, fields: Dict[str, str]):
+        for field, kind in fields.items():
+            if kind not in FIELD_TYPES:
+                raise ValueError(f"Неизвестный тип поля {name}.{field}: {kind}")
+        self.name = name
+        self.tag = tag
+        self.fields = fields
+        self.record = namedtuple(name, list(fields))
+        # Числовые поля пакуются одним struct, строки - следом с байтом длины
+        self._numbers = [index for index, kind in enumerate(fields.values()) if kind != "s"]
+        self._strings = [index for index, kind in enumerate(fields.values()) if kind == "s"]
+        self._struct = struct.Struct("<B" + "".join(kind for kind in fields.values() if kind != "s"))
+
+    def pack(self, *values: Any) -> str:
+        if len(values) != len(self.fields):
+            raise ValueError(f"{self.name}: ожидается полей {len(self.fields)}, передано {len(values)}")
+        raw = self._struct.pack(self.tag, *(values[index] for index in self._numbers))
+        for index in self._strings:
+            encoded = str(values[index]).encode("utf-8")
+            raw += bytes([len(encoded)]) + encoded
+        data = PACKED_PREFIX + base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+        if len(data) > MAX_LENGTH:
+            raise ValueError(f"{self.name}: callback_data длиннее {MAX_LENGTH} символов")
+        return data
+
+    def unpack(self, raw: bytes) -> Tuple:
+        values = [None] * len(self.fields)
+        numbers = self._struct.unpack_from(raw)
+        for index, value in zip(self._numbers, numbers[1:]):
+            values[index] = value
+        offset = self._struct.size
+        for index in self._strings:
+            length = raw[offset]
+            values[index] = raw[offset + 1:offset + 1 + length].decode("utf-8")
+            offset += 1 + length
+        return self.record(*values)
+
+    def from_text(self, text: str) -> Tuple:
+        """Запись из старого текстового формата ("значение_значение")"""
+        parts = text.split("_", len(self.fields) - 1)
+        return self.record(*(FIELD_TYPES[kind](part) for kind, part in zip(self.fields.values(), parts)))
+
+
+class CallbackCodec:
+    """Реестр схем: упаковка по схеме, распаковка по тегу"""
+
+    def __init__(self):
+        self._by_tag: Dict[int, CallbackSchema] = {}
+
+    def schema(self, name: str, tag: int, **fields: str) -> CallbackSchema:
+        if tag in self._by_tag:
+            raise ValueError(f"Тег {tag} уже занят схемой {self._by_tag[tag].name}")
+        schema = self._by_tag[tag] = CallbackSchema(name, tag, fields)
+        return schema
+
+    def unpack(self, data: str) -> Optional[Tuple[CallbackSchema, Tuple]]:
+        """(схема, запись) или None, если данные не упакованы или повреждены"""
+        if not data.startswith(PACKED_PREFIX):
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(data[1:] + "=" * (-(len(data) - 1) % 4))
+            schema = self._by_tag.get(raw[0])
+            return (schema, schema.unpack(raw)) if schema else None
+        except (ValueError, IndexError, struct.error):
+            return None
+
+
+class _Route:
+    __slots__ = ("handler", "params", "varkw", "parse", "flags")
+
+    def __init__(self, handler: Handler, parse: Optional[Callable[[str], Any]] = None,
+                 flags: Optional[Dict[str, Any]] = None):
+        signature = inspect.signature(handler)
+        self.handler = handler
+        self.params = frozenset(signature.parameters)
+        self.varkw = any(param.kind is param.VAR_KEYWORD for param in signature.parameters.values())
+        self.parse = parse
+        self.flags = flags or {}
+
+    async def call(self, callback: CallbackQuery, cb: Any, data: Dict[str, Any]) -> Any:
+        # Как aiogram: обработчик получает только те данные, которые объявил
+        kwargs = dict(data, cb=cb) if self.varkw else \
+            {key: value for key, value in data.items() if key in self.params}
+        if not self.varkw and "cb" in self.params:
+            kwargs["cb"] = cb
+        return await self.handler(callback, **kwargs)
+
+
+class _Node:
+    __slots__ = ("children", "exact", "prefix")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.exact: Optional[_Route] = None
+        self.prefix: Optional[_Route] = None
+
+
+class CallbackRouter:
+    """
+    Маршрутизация callback_query без перебора фильтров
+    На роутер aiogram ставится один обработчик: упакованные данные
+    разбираются один раз и уходят обработчику схемы по тегу, текстовые -
+    проходом по префиксному дереву (точное совпадение или самый длинный
+    префикс). Стоимость выбора обработчика зависит от длины callback_data,
+    а не от числа обработчиков. Разобранные данные передаются аргументом cb.
+    Если маршрута нет, апдейт уходит дальше (в следующие роутеры).
+    flags маршрута - как флаги обработчиков aiogram; middleware читает их
+    из найденного маршрута (route).
+    """
+
+    def __init__(self, codec: CallbackCodec):
+        self.codec = codec
+        self._root = _Node()
+        self._packed: Dict[int, _Route] = {}
+
+    def _node(self, text: str) -> _Node:
+        node = self._root
+        for char in text:
+            node = node.children.setdefault(char, _Node())
+        return node
+
+    def exact(self, *values: str, flags: Optional[Dict[str, Any]] = None) -> Callable[[Handler], Handler]:
+        def decorator(handler: Handler) -> Handler:
+            for value in values:
+                self._node(value).exact = _Route(handler, flags=flags)
+            return handler
+        return decorator
+
+    def prefix(self, prefix: str, parse: Callable[[str], Any] = str,
+               flags: Optional[Dict[str, Any]] = None) -> Callable[[Handler], Handler]:
+        """Текстовые данные с префиксом; cb = parse(остаток строки)"""
+        def decorator(handler: Handler) -> Handler:
+            self._node(prefix).prefix = _Route(handler, parse, flags)
+            return handler
+        return decorator
+
+    def packed(self, schema: CallbackSchema, flags: Optional[Dict[str, Any]] = None) -> Callable[[Handler], Handler]:
+        def decorator(handler: Handler) -> Handler:
+            self._packed[schema.tag] = _Route(handler, flags=flags)
+            return handler
+        return decorator
+
+    def resolve(self, data: str) -> Optional[Tuple[_Route, Any]]:
+        """Маршрут и разобранные данные (None - маршрута нет)"""
+        unpacked = self.codec.unpack(data)
+        if unpacked is not None:
+            route = self._packed.get(unpacked[0].tag)
+            return (route, unpacked[1]) if route else None
+
+        node, best, best_length = self._root, None, 0
+        for length, char in enumerate(data, 1):
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.prefix is not None:
+                best, best_length = node.prefix, length
+        else:
+            if node.exact is not None:
+                return node.exact, None
+        if best is None:
+            return None
+        try:
+            return best, best.parse(data[best_length:])
+        except (ValueError, TypeError):
+            return None
+
+    def route(self, callback: CallbackQuery, data: Dict[str, Any]) -> Optional[Tuple[_Route, Any]]:
+        """
+        Маршрут апдейта с кэшем в данных обработчика: middleware и dispatch
+        разбирают callback_data один раз
+        """
+        cached = data.get(ROUTE_KEY)
+        if cached is not None and cached[0] is self:
+            return cached[1]
+        resolved = self.resolve(callback.data or "")
+        data[ROUTE_KEY] = (self, resolved)
+        return resolved
+
+    async def dispatch(self, callback: CallbackQuery, **data: Any) -> Any:
+        resolved = self.route(callback, data)
+        del data[ROUTE_KEY]
+        if resolved is None:
+            raise SkipHandler()
+        route, cb = resolved
+        # В метриках - обработчик маршрута, а не общий dispatch
+        set_handler_name(route.handler.__name__)
+        return await route.call(callback, cb, data)
+
+    def attach(self, router: Router) -> None:
+        router.callback_query.register(self.dispatch)
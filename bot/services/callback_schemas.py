@@ -0,0 +1,22 @@
+"""
+Схемы упакованных callback_data
+Кнопки с параметрами (ID пользователя, товара, заказа) кодируются
+компактно: тег схемы и поля в двоичном виде, base64. Тег схемы менять
+нельзя - по нему распознаются кнопки в уже отправленных сообщениях.
+Экраны каталога (cat_, product_) и кнопки теста остаются текстовыми:
+по ним работает предзагрузка экранов.
+Схемы общие для support_bot и routers/ticket.py.
+"""
+from .callback_data import CallbackCodec
+
+codec = CallbackCodec()
+
+SUPPORT_REPLY = codec.schema("support_reply", 1, user_id="q")
+SUPPORT_RESOLVE = codec.schema("support_resolve", 2, user_id="q")
+ADD_TO_CART = codec.schema("add_to_cart", 3, product_id="I")
+# delta: +1 / -1
+CART_QUANTITY = codec.schema("cart_quantity", 4, product_id="I", delta="b")
+ORDERS_MORE = codec.schema("orders_more", 5, cursor="s")
+ORDER_STATUS = codec.schema("order_status", 6, order_id="s")
+SIMULATE_PROGRESS = codec.schema("simulate_progress", 7, order_id="s")
+PROMOTION = codec.schema("promotion", 8, promo_id="s")
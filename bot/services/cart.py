@@ -0,0 +1,198 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+
+class Cart:
+    """
+    Корзина с поддерживаемыми итогами
+    Сумма товаров, суммы по категориям, скидка и доставка пересчитываются
+    на каждом изменении позиции, поэтому итог корзины берётся за O(1).
+    Для остальных модулей корзина ведёт себя как словарь {product_id: количество}.
+    pricer(cart) -> PromoResult считает скидку по промокоду корзины.
+    """
+
+    __slots__ = ("user_id", "quantities", "prices", "categories", "category_totals", "subtotal",
+                 "promo", "promo_error", "discount", "free_delivery", "delivery_price", "_pricer")
+
+    def __init__(self, user_id: int, pricer: Optional[Callable[["Cart"], Any]] = None):
+        self.user_id = user_id
+        self.quantities: Dict[int, int] = {}
+        self.prices: Dict[int, float] = {}
+        self.categories: Dict[int, Optional[str]] = {}
+        self.category_totals: Dict[Optional[str], float] = {}
+        self.subtotal: float = 0
+        self.promo: Optional[str] = None
+        self.promo_error: Optional[str] = None
+        self.discount: float = 0
+        self.free_delivery = False
+        self.delivery_price: float = 0
+        self._pricer = pricer
+
+    # Доступ как к словарю {product_id: количество}
+    def __len__(self) -> int:
+        return len(self.quantities)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.quantities)
+
+    def __contains__(self, product_id: int) -> bool:
+        return product_id in self.quantities
+
+    def __getitem__(self, product_id: int) -> int:
+        return self.quantities[product_id]
+
+    def get(self, product_id: int, default: int = 0) -> int:
+        return self.quantities.get(product_id, default)
+
+    def items(self):
+        return self.quantities.items()
+
+    @property
+    def delivery_cost(self) -> float:
+        return 0 if self.free_delivery else self.delivery_price
+
+    @property
+    def total(self) -> float:
+        return self.subtotal - self.discount + self.delivery_cost
+
+    def lines(self) -> List[Tuple[int, int, float, float]]:
+        """Позиции: (product_id, количество, цена, сумма)"""
+        return [
+            (product_id, quantity, self.prices[product_id], self.prices[product_id] * quantity)
+            for product_id, quantity in self.quantities.items()
+        ]
+
+    def _shift(self, product_id: int, delta_total: float) -> None:
+        self.subtotal += delta_total
+        category = self.categories[product_id]
+        self.category_totals[category] = self.category_totals.get(category, 0) + delta_total
+
+    def set_quantity(self, product_id: int, quantity: int, price: float, category: Optional[str]) -> None:
+        """Задать количество товара (0 - убрать из корзины)"""
+        if product_id in self.quantities:
+            self._shift(product_id, -self.prices[product_id] * self.quantities[product_id])
+        if quantity > 0:
+            self.quantities[product_id] = quantity
+            self.prices[product_id] = price
+            self.categories[product_id] = category
+            self._shift(product_id, price * quantity)
+        elif product_id in self.quantities:
+            del self.quantities[product_id]
+            del self.prices[product_id]
+            del self.categories[product_id]
+        self.refresh_discount()
+
+    def reprice(self, product_id: int, price: float) -> None:
+        """Новая цена товара из каталога"""
+        self.reprice_many({product_id: price})
+
+    def reprice_many(self, prices: Dict[int, float]) -> None:
+        """Новые цены нескольких товаров; скидка пересчитывается один раз"""
+        changed = False
+        for product_id, price in prices.items():
+            quantity = self.quantities.get(product_id)
+            if quantity is not None:
+                self._shift(product_id, (price - self.prices[product_id]) * quantity)
+                self.prices[product_id] = price
+                changed = True
+        if changed:
+            self.refresh_discount()
+
+    def set_promo(self, code: Optional[str]) -> None:
+        self.promo = code
+        self.refresh_discount()
+
+    def set_delivery(self, price: float) -> None:
+        self.delivery_price = price
+
+    def refresh_discount(self) -> None:
+        """Пересчитать скидку по промокоду (по суммам корзины, без обхода позиций)"""
+        self.discount = 0
+        self.free_delivery = False
+        self.promo_error = None
+        if not self.promo or self._pricer is None:
+            return
+        result = self._pricer(self)
+        if result.ok:
+            self.discount = result.discount
+            self.free_delivery = result.free_delivery
+        else:
+            self.promo_error = result.message
+
+
+class CartStore:
+    """
+    Корзины пользователей с индексом товар -> корзины
+    Индекс нужен для пересчёта: при смене цены обновляются только
+    корзины, где этот товар есть.
+    """
+
+    def __init__(self, pricer: Optional[Callable[[Cart], Any]] = None):
+        self.pricer = pricer
+        self._carts: Dict[int, Cart] = {}
+        self._by_product: Dict[int, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._carts)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._carts
+
+    def get(self, user_id: int, default: Any = None) -> Optional[Cart]:
+        return self._carts.get(user_id, default)
+
+    def items(self):
+        return self._carts.items()
+
+    def cart(self, user_id: int) -> Cart:
+        """Корзина пользователя (создаётся при первом обращении)"""
+        cart = self._carts.get(user_id)
+        if cart is None:
+            cart = self._carts[user_id] = Cart(user_id, self.pricer)
+        return cart
+
+    def set_quantity(self, user_id: int, product_id: int, quantity: int,
+                     price: float, category: Optional[str]) -> Cart:
+        cart = self.cart(user_id)
+        cart.set_quantity(product_id, quantity, price, category)
+        if quantity > 0:
+            self._by_product.setdefault(product_id, set()).add(user_id)
+        else:
+            self._unindex(product_id, user_id)
+        return cart
+
+    def add(self, user_id: int, product_id: int, quantity: int,
+            price: float, category: Optional[str]) -> Cart:
+        current = self._carts[user_id].get(product_id) if user_id in self._carts else 0
+        return self.set_quantity(user_id, product_id, current + quantity, price, category)
+
+    def clear(self, user_id: int) -> None:
+        cart = self._carts.pop(user_id, None)
+        if cart is not None:
+            for product_id in cart:
+                self._unindex(product_id, user_id)
+
+    def _unindex(self, product_id: int, user_id: int) -> None:
+        users = self._by_product.get(product_id)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self._by_product[product_id]
+
+    def reprice(self, product_id: int, price: float) -> int:
+        """Обновить цену товара во всех корзинах. Возвращает число корзин"""
+        users = self._by_product.get(product_id, ())
+        for user_id in users:
+            self._carts[user_id].reprice(product_id, price)
+        return len(users)
+
+    def reprice_all(self, prices: Dict[int, float]) -> int:
+        """
+        Пакетный пересчёт после смены цен в каталоге: {product_id: цена}
+        Каждая затронутая корзина пересчитывается один раз. Возвращает число корзин
+        """
+        touched: Set[int] = set()
+        for product_id in prices:
+            touched.update(self._by_product.get(product_id, ()))
+        for user_id in touched:
+            self._carts[user_id].reprice_many(prices)
+        return len(touched)
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import struct
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, NamedTuple, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from .ttl_store import TTLStore
+
+logger = logging.getLogger(__name__)
+
+# Корзина пользователя: токены, время последнего обновления, предупреждён ли
+BUCKET = struct.Struct("<fdB")
+
+DROP = "drop"
+MERGE = "merge"
+
+
+class FloodLimit(NamedTuple):
+    """rate - токенов в секунду, burst - ёмкость корзины; mode - drop или merge"""
+    rate: float
+    burst: float
+    mode: str = DROP
+
+
+class FloodControl:
+    """
+    Ограничение частоты апдейтов по пользователю (token bucket)
+    Для каждого класса обработчиков своё ограничение и своё хранилище:
+    запись пользователя - 13 байт в TTLStore. Срок записи - время полного
+    восполнения корзины, поэтому истёкшая запись равна полной корзине и
+    удаляется без потерь; сверх max_entries вытесняются самые давние.
+    """
+
+    def __init__(self, limits: Dict[str, FloodLimit], default: Optional[str] = None,
+                 max_entries: int = 1_000_000, exempt: Iterable[int] = ()):
+        for name, limit in limits.items():
+            if limit.rate <= 0 or limit.burst < 1 or limit.mode not in (DROP, MERGE):
+                raise ValueError(f"Неверное ограничение {name}: {limit}")
+        if default is not None and default not in limits:
+            raise ValueError(f"Нет ограничения по умолчанию {default}")
+        self.limits = limits
+        self.default = default
+        self.exempt = frozenset(exempt)
+        self.stores = {
+            name: TTLStore(limit.burst / limit.rate + 1, max_entries)
+            for name, limit in limits.items()
+        }
+        self.dropped: Counter = Counter()
+        self.merged: Counter = Counter()
+
+    def take(self, name: str, user_id: int) -> Tuple[float, bool]:
+        """
+        Списать токен. Возвращает (секунды до следующего токена - 0, если
+        списан; нужно ли предупредить - первый отказ после успешного апдейта)
+        """
+        limit = self.limits[name]
+        store = self.stores[name]
+        now = store.clock()
+        record = store.get(user_id)
+        if record is None:
+            tokens, notified = limit.burst, 0
+        else:
+            tokens, last, notified = BUCKET.unpack(record)
+            tokens = min(limit.burst, tokens + (now - last) * limit.rate)
+        if tokens >= 1:
+            tokens, wait, notify = tokens - 1, 0.0, False
+            notified = 0
+        else:
+            wait, notify = (1 - tokens) / limit.rate, not notified
+            notified = 1
+        # Истёкшие записи снимаются с начала очереди попутно
+        store.expire(now)
+        store.set(user_id, BUCKET.pack(tokens, now, notified))
+        return wait, notify
+
+    def stats(self) -> Dict[str, Tuple[int, int, int]]:
+        """{класс: (пользователей в памяти, отброшено, объединено)}"""
+        return {name: (len(store), self.dropped[name], self.merged[name]) for name, store in self.stores.items()}
+
+
+class FloodControlMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware: ограничение частоты по классу обработчика
+    Класс - флаг обработчика flood (flags={"flood": "cart"}), для маршрутов
+    CallbackRouter - флаг маршрута, иначе класс по умолчанию. Лишние апдейты
+    в режиме drop отбрасываются (пользователь предупреждается один раз), в
+    режиме merge откладываются до появления токена, причём отложенный апдейт
+    заменяется более новым - обработан будет только последний; отложенные
+    и заменённые нажатия кнопок подтверждаются сразу.
+    """
+
+    def __init__(self, flood: FloodControl, callback_routers: Iterable[Any] = ()):
+        self.flood = flood
+        self.callback_routers = tuple(callback_routers)
+        self._pending: Dict[Hashable, Tuple[Callable, TelegramObject, Dict[str, Any]]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _limit_name(self, event: TelegramObject, data: Dict[str, Any]) -> Optional[str]:
+        """Класс ограничения; None - апдейт не списывается (обработчик его пропустит)"""
+        name = get_flag(data, "flood")
+        if name is None and isinstance(event, CallbackQuery):
+            callback = data["handler"].callback
+            for router in self.callback_routers:
+                if callback == router.dispatch:
+                    # Апдейт проходит через dispatch каждого роутера по очереди;
+                    # списывает только тот, чей маршрут совпал с callback_data
+                    resolved = router.route(event, data)
+                    if resolved is None:
+                        return None
+                    name = resolved[0].flags.get("flood")
+                    break
+        return name if name in self.flood.limits else self.flood.default
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or user.id in self.flood.exempt:
+            return await handler(event, data)
+        name = self._limit_name(event, data)
+        if name is None:
+            return await handler(event, data)
+
+        key = (name, user.id)
+        if key in self._pending:
+            # Уже ждёт отложенный апдейт этого класса - новый его заменяет
+            self._pending[key] = (handler, event, data)
+            self.flood.merged[name] += 1
+            await self._acknowledge(event)
+            return None
+
+        wait, notify = self.flood.take(name, user.id)
+        if not wait:
+            return await handler(event, data)
+
+        if self.flood.limits[name].mode == MERGE:
+            self._pending[key] = (handler, event, data)
+            task = asyncio.create_task(self._run_pending(key, wait))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            await self._acknowledge(event)
+            return None
+
+        self.flood.dropped[name] += 1
+        if notify:
+            await self._warn(event)
+        return None
+
+    async def _run_pending(self, key: Tuple[str, int], wait: float) -> None:
+        while wait:
+            await asyncio.sleep(wait)
+            wait, _ = self.flood.take(*key)
+        handler, event, data = self._pending.pop(key)
+        try:
+            await handler(event, data)
+        except TelegramBadRequest as e:
+            # Нажатие уже подтверждено при откладывании - повторный answer() отклоняется
+            logger.debug(f"Отложенный апдейт {key[0]}: {e}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка в отложенном апдейте {key[0]}: {e}")
+
+    async def close(self) -> None:
+        """Отменить отложенные апдейты (при остановке бота)"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._pending.clear()
+
+    @staticmethod
+    async def _acknowledge(event: TelegramObject) -> None:
+        # Отложенное или заменённое нажатие подтверждается сразу, иначе кнопка
+        # "крутится", пока не придёт токен, а заменённое не подтвердится никогда
+        if isinstance(event, CallbackQuery):
+            try:
+                await event.answer()
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось подтвердить нажатие: {e}")
+
+    @staticmethod
+    async def _warn(event: TelegramObject) -> None:
+        try:
+            if isinstance(event, CallbackQuery):
+                await event.answer("⏳ Не так быстро, подождите немного")
+            elif isinstance(event, Message):
+                await event.answer("⏳ Слишком много сообщений подряд, подождите немного")
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось предупредить о лимите: {e}")
@@ -0,0 +1,181 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Атрибуты LogRecord; всё остальное (extra=...) попадает в JSON отдельными полями
+_RECORD_FIELDS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+# Предел числа различных шаблонов, по которым считается прореживание
+_MAX_TEMPLATES = 10_000
+
+
+def parse_pairs(text: str) -> Dict[str, str]:
+    """Настройка вида "aiogram=WARNING,ticket_service=10" -> словарь"""
+    pairs = {}
+    for item in (text or "").split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            pairs[name.strip()] = value.strip()
+    return pairs
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Прореживание повторяющихся записей ниже WARNING
+    Для логгеров из rates (с дочерними) из записей одного шаблона (record.msg)
+    проходит первая и затем каждая rate-я; у прошедшей sampled = rate.
+    Предупреждения и ошибки проходят всегда. Шаблон один на много записей
+    только при ленивых аргументах: logger.info("... %s", value).
+    """
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        self.rates = dict(rates)
+        self._by_logger: Dict[str, int] = {}
+        self._seen: Dict[Tuple[str, str], int] = {}
+
+    def _rate(self, name: str) -> int:
+        rate = self._by_logger.get(name)
+        if rate is None:
+            # Ближайший настроенный предок: "a.b.c" -> "a.b" -> "a"
+            probe = name
+            while probe and probe not in self.rates:
+                probe = probe.rpartition(".")[0]
+            rate = self._by_logger[name] = self.rates.get(probe, 1)
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate <= 1:
+            return True
+        key = (record.name, str(record.msg))
+        seen = self._seen.get(key, 0)
+        if seen == 0 and len(self._seen) >= _MAX_TEMPLATES:
+            self._seen.clear()
+        self._seen[key] = seen + 1
+        if seen % rate:
+            return False
+        record.sampled = rate
+        return True
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Постановка записи в очередь без форматирования
+    Сообщение собирается (getMessage) уже в потоке слушателя, поэтому
+    аргументы записи не должны меняться после вызова логгера. Если очередь
+    переполнена, запись отбрасывается - вызывающий код не ждёт никогда.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    """Обычная строка лога; у прореженных записей - пометка [1/N]"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        sampled = getattr(record, "sampled", None)
+        return f"{text} [1/{sampled}]" if sampled else text
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись одной строкой JSON: время, уровень, логгер, сообщение и поля extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class LogPipeline:
+    """
+    Неблокирующее логирование
+    Обработчик корневого логгера только кладёт запись в очередь; форматирование
+    и запись в поток вывода - в фоновом потоке QueueListener. Повторяющиеся
+    записи прореживаются до постановки в очередь, уровни логгеров можно
+    менять на ходу (set_level, команда /loglevel).
+    """
+
+    def __init__(self, level: str = "INFO", fmt: str = "text", levels: Optional[Dict[str, str]] = None,
+                 sample: Optional[Dict[str, int]] = None, max_queue: int = 10_000, caller_info: bool = False):
+        self.level = level
+        self.caller_info = caller_info
+        self.levels = dict(levels or {})
+        self.queue: queue.Queue = queue.Queue(max_queue)
+        self.handler = _DeferredQueueHandler(self.queue)
+        self.handler.addFilter(SamplingFilter(sample or {}))
+
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter(TEXT_FORMAT))
+        self.listener = QueueListener(self.queue, output, respect_handler_level=True)
+        self._started = False
+
+    def start(self) -> None:
+        """Заменить обработчики корневого логгера очередью и запустить фоновый поток"""
+        if self._started:
+            return
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        # Поля записи, которые не выводятся: поиск места вызова по стеку - самая
+        # дорогая часть создания записи (см. Logging HOWTO, раздел Optimization)
+        if not self.caller_info:
+            logging._srcfile = None
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+        for name, level in self.levels.items():
+            logging.getLogger(name).setLevel(level)
+        self.listener.start()
+        self._started = True
+        # Записи, оставшиеся в очереди, дописываются при выходе
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        if self._started:
+            self.listener.stop()
+            self._started = False
+
+    def set_level(self, name: str, level: str) -> None:
+        """Уровень логгера (пустое имя или root - корневой); ValueError при неизвестном уровне"""
+        level = level.upper()
+        if not isinstance(logging.getLevelName(level), int):
+            raise ValueError(f"Неизвестный уровень: {level}")
+        if name in ("", "root"):
+            logging.getLogger().setLevel(level)
+            self.level = level
+        else:
+            logging.getLogger(name).setLevel(level)
+            self.levels[name] = level
+
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from aiogram.types import FSInputFile, Message
+
+logger = logging.getLogger(__name__)
+
+
+class MediaRegistry:
+    """
+    Реестр загруженных в Telegram файлов
+    Каждое фото загружается один раз, дальше отправляется по file_id.
+    Ключ записи - путь к файлу и хэш его содержимого, поэтому замена
+    файла на диске приводит к повторной загрузке.
+    """
+
+    def __init__(self, storage_path: str):
+        self.storage_path = Path(storage_path)
+        self._entries: Dict[str, Dict[str, str]] = self._load()
+        # path -> (mtime_ns, size, sha256), чтобы не перечитывать файл на каждый показ
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+
+    def _load(self) -> Dict[str, Dict[str, str]]:
+        if not self.storage_path.exists():
+            return {}
+        try:
+            with open(self.storage_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"❌ Не удалось прочитать реестр медиа {self.storage_path}: {e}")
+            return {}
+
+    def _save(self) -> None:
+        self.storage_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.storage_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.storage_path)
+
+    def _cached_hash(self, photo_path: str, stat: os.stat_result) -> Optional[str]:
+        cached = self._hashes.get(photo_path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        return None
+
+    def _content_hash(self, photo_path: str) -> Optional[str]:
+        """Хэш содержимого файла (пересчитывается только при изменении файла)"""
+        try:
+            stat = os.stat(photo_path)
+        except OSError:
+            return None
+
+        cached = self._cached_hash(photo_path, stat)
+        if cached:
+            return cached
+
+        digest = hashlib.sha256()
+        with open(photo_path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                digest.update(chunk)
+
+        content_hash = digest.hexdigest()
+        self._hashes[photo_path] = (stat.st_mtime_ns, stat.st_size, content_hash)
+        return content_hash
+
+    async def warm(self, photo_path: str) -> None:
+        """Посчитать хэш в потоке: чтение и SHA-256 большого фото не задерживают цикл событий"""
+        try:
+            stat = os.stat(photo_path)
+        except OSError:
+            return
+        if self._cached_hash(photo_path, stat) is None:
+            await asyncio.to_thread(self._content_hash, photo_path)
+
+    def _key(self, photo_path: str) -> Optional[str]:
+        content_hash = self._content_hash(photo_path)
+        if content_hash is None:
+            return None
+        return f"{photo_path}:{content_hash}"
+
+    def get_file_id(self, photo_path: str) -> Optional[str]:
+        """file_id ранее загруженного фото или None"""
+        key = self._key(photo_path)
+        if key is None:
+            return None
+        entry = self._entries.get(key)
+        return entry["file_id"] if entry else None
+
+    def get_media(self, photo_path: str) -> Optional[Union[str, FSInputFile]]:
+        """
+        Что передать в send_photo/InputMediaPhoto:
+        file_id, если фото уже загружено, иначе файл с диска.
+        None - файла нет.
+        """
+        key = self._key(photo_path)
+        if key is None:
+            return None
+
+        entry = self._entries.get(key)
+        if entry:
+            return entry["file_id"]
+        return FSInputFile(photo_path)
+
+    def remember(self, photo_path: str, message: Message) -> None:
+        """Сохранить file_id из отправленного сообщения с фото"""
+        if not isinstance(message, Message) or not message.photo:
+            return
+
+        key = self._key(photo_path)
+        if key is None or key in self._entries:
+            return
+
+        photo = message.photo[-1]
+        self._entries[key] = {
+            "file_id": photo.file_id,
+            "file_unique_id": photo.file_unique_id
+        }
+
+        try:
+            self._save()
+            logger.info(f"📸 Фото {photo_path} сохранено в реестре медиа")
+        except OSError as e:
+            logger.error(f"❌ Ошибка сохранения реестра медиа: {e}")
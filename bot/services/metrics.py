@@ -0,0 +1,249 @@
+import logging
+import time
+from array import array
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Обработчик текущего апдейта: выставляется при выборе обработчика, читается после
+_handler_name: ContextVar[Optional[str]] = ContextVar("metrics_handler_name", default=None)
+
+UNHANDLED = "unhandled"
+
+
+def set_handler_name(name: str) -> None:
+    """Имя обработчика для метрик текущего апдейта (для своих диспетчеров вроде CallbackRouter)"""
+    _handler_name.set(name)
+
+
+def current_handler_name() -> Optional[str]:
+    """Обработчик текущего апдейта (после его выбора; None - не найден или учёт не подключён)"""
+    return _handler_name.get()
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: наблюдение - поиск корзины и два сложения"""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        # Последний элемент - значения больше верхней границы (+Inf)
+        self.counts = array("Q", bytes(8 * (len(bounds) + 1)))
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+
+
+class Metrics:
+    """
+    Метрики бота в памяти процесса
+    Задержки обработчиков апдейтов и внешних зависимостей (Telegram API,
+    API тикетов) - гистограммы по имени, ошибки - счётчики, апдейты в
+    обработке - по типу апдейта. Запись - несколько операций со словарём
+    и массивом без блокировок (всё в одном цикле событий); текст в формате
+    Prometheus собирается только при запросе /metrics.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.handlers: Dict[str, Histogram] = {}
+        self.handler_errors: Dict[str, int] = {}
+        self.in_flight: Dict[str, int] = {}
+        # (зависимость, операция) -> гистограмма / число ошибок
+        self.dependencies: Dict[Tuple[str, str], Histogram] = {}
+        self.dependency_errors: Dict[Tuple[str, str], int] = {}
+
+    def observe_handler(self, handler: str, seconds: float, failed: bool = False) -> None:
+        histogram = self.handlers.get(handler)
+        if histogram is None:
+            histogram = self.handlers[handler] = Histogram(self.buckets)
+        histogram.observe(seconds)
+        if failed:
+            self.handler_errors[handler] = self.handler_errors.get(handler, 0) + 1
+
+    def observe_dependency(self, dependency: str, operation: str, seconds: float, failed: bool = False) -> None:
+        key = (dependency, operation)
+        histogram = self.dependencies.get(key)
+        if histogram is None:
+            histogram = self.dependencies[key] = Histogram(self.buckets)
+        histogram.observe(seconds)
+        if failed:
+            self.dependency_errors[key] = self.dependency_errors.get(key, 0) + 1
+
+    def instrument(self, dispatcher: Dispatcher) -> None:
+        """
+        Подключить учёт апдейтов к диспетчеру
+        Внутренние middleware диспетчера наследуются всеми вложенными
+        роутерами, в том числе подключёнными позже
+        """
+        dispatcher.update.outer_middleware(MetricsMiddleware(self))
+        naming = HandlerNameMiddleware()
+        for name, observer in dispatcher.observers.items():
+            if name not in ("update", "error"):
+                observer.middleware(naming)
+
+    # Экспорт
+    @staticmethod
+    def _histogram_lines(name: str, series: List[Tuple[str, Histogram]]) -> List[str]:
+        lines = [f"# TYPE {name} histogram"]
+        for labels, histogram in series:
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += histogram.counts[-1]
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+        return lines
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = ["# HELP bot_handler_seconds Время обработки апдейта по обработчику"]
+        lines += self._histogram_lines("bot_handler_seconds", [
+            (_labels(handler=handler), histogram) for handler, histogram in sorted(self.handlers.items())
+        ])
+        lines.append("# HELP bot_handler_errors_total Исключения в обработчиках")
+        lines.append("# TYPE bot_handler_errors_total counter")
+        lines += [f"bot_handler_errors_total{{{_labels(handler=handler)}}} {count}"
+                  for handler, count in sorted(self.handler_errors.items())]
+        lines.append("# HELP bot_updates_in_flight Апдейты в обработке")
+        lines.append("# TYPE bot_updates_in_flight gauge")
+        lines += [f"bot_updates_in_flight{{{_labels(type=update_type)}}} {count}"
+                  for update_type, count in sorted(self.in_flight.items())]
+        lines.append("# HELP bot_dependency_seconds Время запросов к внешним сервисам")
+        lines += self._histogram_lines("bot_dependency_seconds", [
+            (_labels(dependency=dependency, operation=operation), histogram)
+            for (dependency, operation), histogram in sorted(self.dependencies.items())
+        ])
+        lines.append("# HELP bot_dependency_errors_total Ошибки запросов к внешним сервисам")
+        lines.append("# TYPE bot_dependency_errors_total counter")
+        lines += [f"bot_dependency_errors_total{{{_labels(dependency=dependency, operation=operation)}}} {count}"
+                  for (dependency, operation), count in sorted(self.dependency_errors.items())]
+        return "\n".join(lines) + "\n"
+
+
+def _update_type(update: Any) -> str:
+    # Update.event_type перебирает все поля апдейта (десятки мкс) - частые типы проверяем сами
+    if update.message is not None:
+        return "message"
+    if update.callback_query is not None:
+        return "callback_query"
+    return update.event_type
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Внешний middleware апдейтов: задержка и ошибки по обработчику, апдейты в обработке"""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        in_flight = self.metrics.in_flight
+        update_type = _update_type(event)
+        in_flight[update_type] = in_flight.get(update_type, 0) + 1
+        _handler_name.set(None)
+        failed = False
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.metrics.observe_handler(_handler_name.get() or UNHANDLED, time.perf_counter() - started, failed)
+            in_flight[update_type] -= 1
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Внутренний middleware: запоминает, какой обработчик выбран для апдейта"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        _handler_name.set(data["handler"].callback.__name__)
+        return await handler(event, data)
+
+
+class TelegramMetrics(BaseRequestMiddleware):
+    """Middleware сессии бота: время и ошибки запросов к Telegram Bot API по методу"""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(self, make_request, bot, method):
+        failed = False
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.metrics.observe_dependency("telegram", method.__api_method__,
+                                            time.perf_counter() - started, failed)
+
+
+class MetricsServer:
+    """Локальный HTTP-эндпоинт /metrics для Prometheus"""
+
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9108):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"📈 Метрики: http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# Общий реестр процесса: в него пишут middleware и клиенты внешних сервисов
+metrics = Metrics()
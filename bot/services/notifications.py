@@ -0,0 +1,116 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+# Чем меньше число, тем раньше отправляется
+PRIORITY_STATUS = 0
+PRIORITY_PROMO = 10
+
+
+class NotificationPipeline:
+    """
+    Асинхронная очередь уведомлений с приоритетами
+    Обработчики только ставят уведомление в очередь, отправку делают
+    фоновые воркеры. Уведомления о статусах заказов идут раньше акций.
+    Уведомления с одинаковым ключом схлопываются: если в очереди несколько
+    статусов одного заказа, отправится только последний.
+    У каждого воркера своя очередь; уведомления одного чата (или ключа,
+    если чат не указан) всегда попадают к одному воркеру и отправляются
+    по порядку.
+    """
+
+    def __init__(self, workers: int = 4, history_size: int = 20, max_keys: int = 100_000):
+        self.workers = workers
+        self.history_size = history_size
+        self.max_keys = max_keys
+        self._queues: List[asyncio.PriorityQueue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._bot: Optional[Bot] = None
+        self._counter = itertools.count()
+        # ключ -> номер последней поставленной версии
+        self._latest: Dict[str, int] = {}
+        # История доставки по ключам, самые давние ключи вытесняются
+        self._outcomes: "OrderedDict[str, Deque[Dict[str, Any]]]" = OrderedDict()
+
+    async def start(self, bot: Bot) -> None:
+        self._bot = bot
+        self._queues = [asyncio.PriorityQueue() for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    async def stop(self, timeout: float = 5) -> None:
+        """Дождаться отправки очереди (не дольше timeout) и остановить воркеры"""
+        if self._queues:
+            try:
+                await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Не отправлено уведомлений: {self.pending()}")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def submit(self, key: str, send: Callable[[Bot], Awaitable[Any]],
+               priority: int = PRIORITY_STATUS, chat_id: Optional[int] = None) -> asyncio.Future:
+        """
+        Поставить уведомление в очередь
+        chat_id выбирает воркера: уведомления одного чата не обгоняют друг друга
+        Возвращает future с итогом доставки: {"status": sent|failed|collapsed, "error": ...}
+        """
+        version = next(self._counter)
+        self._latest[key] = version
+        future = asyncio.get_running_loop().create_future()
+        if not self._queues:
+            future.set_result(self._record(key, "failed", RuntimeError("Очередь уведомлений не запущена")))
+            return future
+        shard = hash(key if chat_id is None else chat_id) % len(self._queues)
+        self._queues[shard].put_nowait((priority, version, key, send, future))
+        return future
+
+    def outcomes(self, key: str) -> List[Dict[str, Any]]:
+        """История доставки уведомлений по ключу (например, по заказу)"""
+        return [
+            {**outcome, "error": str(outcome["error"]) if outcome["error"] else None}
+            for outcome in self._outcomes.get(key, ())
+        ]
+
+    def pending(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def _record(self, key: str, status: str, error: Optional[BaseException] = None) -> Dict[str, Any]:
+        outcome = {"status": status, "error": error, "at": time.time()}
+        history = self._outcomes.get(key)
+        if history is None:
+            history = self._outcomes[key] = deque(maxlen=self.history_size)
+            if len(self._outcomes) > self.max_keys:
+                self._outcomes.popitem(last=False)
+        else:
+            self._outcomes.move_to_end(key)
+        history.append(outcome)
+        return outcome
+
+    async def _worker(self, queue: asyncio.PriorityQueue) -> None:
+        while True:
+            priority, version, key, send, future = await queue.get()
+            try:
+                if self._latest.get(key) != version:
+                    # Есть более свежее уведомление с тем же ключом
+                    outcome = self._record(key, "collapsed")
+                else:
+                    try:
+                        await send(self._bot)
+                        outcome = self._record(key, "sent")
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка отправки уведомления {key}: {e}")
+                        outcome = self._record(key, "failed", e)
+                    if self._latest.get(key) == version:
+                        del self._latest[key]
+                if not future.done():
+                    future.set_result(outcome)
+            finally:
+                queue.task_done()
@@ -0,0 +1,92 @@
+import threading
+import time
+
+# Алфавит Crockford base32: без I, L, O, U и без "_" (разделитель в callback_data)
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_DECODE = {char: index for index, char in enumerate(ALPHABET)}
+
+# Начало отсчёта времени в ID - 2024-01-01 00:00:00 UTC
+EPOCH_MS = 1704067200000
+
+TIMESTAMP_BITS = 41
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+ID_LENGTH = 13  # 63 бита в base32
+
+
+def _encode(value: int) -> str:
+    chars = []
+    for _ in range(ID_LENGTH):
+        chars.append(ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def _decode(order_id: str) -> int:
+    value = 0
+    for char in order_id:
+        value = (value << 5) | _DECODE[char]
+    return value
+
+
+def id_timestamp(order_id: str) -> float:
+    """Unix-время создания, зашитое в ID"""
+    return ((_decode(order_id) >> (WORKER_BITS + SEQUENCE_BITS)) + EPOCH_MS) / 1000
+
+
+def is_generated_id(order_id: str) -> bool:
+    return len(order_id) == ID_LENGTH and all(char in _DECODE for char in order_id)
+
+
+class OrderIdGenerator:
+    """
+    Генератор ID заказов в стиле Snowflake
+    41 бит - миллисекунды от EPOCH_MS, 10 бит - номер процесса (worker_id),
+    12 бит - счётчик внутри миллисекунды. ID записывается фиксированными
+    13 символами base32, поэтому строковый порядок совпадает с порядком
+    создания, а ID нескольких процессов с разными worker_id не пересекаются.
+    """
+
+    def __init__(self, worker_id: int = 0):
+        if not 0 <= worker_id < (1 << WORKER_BITS):
+            raise ValueError(f"worker_id должен быть от 0 до {(1 << WORKER_BITS) - 1}")
+        self.worker_id = worker_id
+        self._last_ms = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def observe(self, order_id: str) -> None:
+        """
+        Учесть ранее выданный ID (после перезапуска),
+        чтобы при отставании часов новые ID не ушли назад
+        """
+        if not is_generated_id(order_id):
+            return
+        value = _decode(order_id)
+        if (value >> SEQUENCE_BITS) & ((1 << WORKER_BITS) - 1) != self.worker_id:
+            return
+        issued_ms = value >> (WORKER_BITS + SEQUENCE_BITS)
+        with self._lock:
+            if issued_ms > self._last_ms:
+                self._last_ms = issued_ms
+                self._sequence = value & ((1 << SEQUENCE_BITS) - 1)
+
+    def next_id(self) -> str:
+        with self._lock:
+            now_ms = int(time.time() * 1000) - EPOCH_MS
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                # Та же миллисекунда или часы ушли назад - продолжаем от последнего ID
+                self._sequence += 1
+                if self._sequence >> SEQUENCE_BITS:
+                    self._last_ms += 1
+                    self._sequence = 0
+
+            value = (
+                (self._last_ms << (WORKER_BITS + SEQUENCE_BITS))
+                | (self.worker_id << SEQUENCE_BITS)
+                | self._sequence
+            )
+        return _encode(value)
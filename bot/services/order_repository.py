@@ -0,0 +1,101 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class OrderRepository:
+    """
+    Хранилище заказов с индексом по пользователю и по времени
+    Для каждого пользователя держится список (время создания, id заказа),
+    упорядоченный по времени, поэтому страница истории стоит O(размер страницы)
+    независимо от общего числа заказов. Курсор страницы - ID заказа.
+    """
+
+    def __init__(self):
+        self._orders: Dict[str, dict] = {}
+        self._by_user: Dict[int, List[Tuple[float, str]]] = {}
+        # Все заказы по времени - для выборок за период
+        self._by_time: List[Tuple[float, str]] = []
+        # ID пользователей с заказами по возрастанию - для рассылок с продолжением
+        self._user_ids: List[int] = []
+
+    def __contains__(self, order_id: str) -> bool:
+        return order_id in self._orders
+
+    def __getitem__(self, order_id: str) -> dict:
+        return self._orders[order_id]
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def get(self, order_id: str) -> Optional[dict]:
+        return self._orders.get(order_id)
+
+    def values(self) -> Iterator[dict]:
+        return iter(self._orders.values())
+
+    def add(self, order: dict) -> None:
+        """Сохранить заказ (order['created_ts'] - unix-время создания)"""
+        order_id = order['id']
+        if order_id in self._orders:
+            raise KeyError(f"Заказ {order_id} уже существует")
+
+        self._orders[order_id] = order
+        key = (order['created_ts'], order_id)
+        if order['user_id'] not in self._by_user:
+            insort(self._user_ids, order['user_id'])
+        self._insert(self._by_user.setdefault(order['user_id'], []), key)
+        self._insert(self._by_time, key)
+
+    @staticmethod
+    def _insert(entries: List[Tuple[float, str]], key: Tuple[float, str]) -> None:
+        # ID растут со временем, поэтому почти всегда это дописывание в конец
+        if not entries or entries[-1] <= key:
+            entries.append(key)
+        else:
+            insort(entries, key)
+
+    def user_ids(self):
+        """ID пользователей, у которых есть заказы"""
+        return self._by_user.keys()
+
+    def user_ids_after(self, after_user_id: Optional[int] = None) -> Iterator[int]:
+        """
+        ID пользователей с заказами по возрастанию, начиная после after_user_id
+        Позиция ищется бинарным поиском на каждом шаге, поэтому новые
+        покупатели, появившиеся во время обхода, не сбивают его
+        """
+        user_ids = self._user_ids
+        position = bisect_right(user_ids, after_user_id) if after_user_id is not None else 0
+        while position < len(user_ids):
+            user_id = user_ids[position]
+            yield user_id
+            position = bisect_right(user_ids, user_id)
+
+    def count_for_user(self, user_id: int) -> int:
+        return len(self._by_user.get(user_id, ()))
+
+    def page(self, user_id: int, cursor: Optional[str] = None,
+             limit: int = 5) -> Tuple[List[dict], Optional[str]]:
+        """
+        Заказы пользователя от новых к старым
+        cursor - ID последнего показанного заказа; возвращает (заказы, курсор следующей страницы)
+        """
+        entries = self._by_user.get(user_id, [])
+        end = len(entries)
+        if cursor:
+            cursor_order = self._orders.get(cursor)
+            if cursor_order is None or cursor_order['user_id'] != user_id:
+                return [], None
+            end = bisect_left(entries, (cursor_order['created_ts'], cursor))
+
+        start = max(0, end - limit)
+        orders = [self._orders[order_id] for _, order_id in reversed(entries[start:end])]
+        next_cursor = orders[-1]['id'] if start > 0 else None
+        return orders, next_cursor
+
+    def between(self, start_ts: float, end_ts: float) -> Iterator[dict]:
+        """Заказы, созданные в интервале [start_ts, end_ts), по времени"""
+        position = bisect_left(self._by_time, (start_ts, ""))
+        while position < len(self._by_time) and self._by_time[position][0] < end_ts:
+            yield self._orders[self._by_time[position][1]]
+            position += 1
@@ -0,0 +1,199 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value: Any) -> Any:
+    # Цены с копейками - Decimal: пишем строкой, без потери точности
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class StateJournal:
+    """
+    Журнал предзаписи (WAL) со снимками состояния
+    Каждое изменение состояния дописывается в журнал. Записи копятся и
+    сбрасываются на диск пачками - один fsync на пачку (group commit).
+    Каждые snapshot_every записей состояние целиком пишется в снимок,
+    а старые сегменты журнала удаляются. При старте загружается снимок
+    и проигрывается только хвост журнала после него.
+
+    apply(op, data) - применить запись к состоянию (используется при восстановлении)
+    dump() -> dict - снять состояние для снимка
+    restore(dict) - загрузить состояние из снимка
+    """
+
+    def __init__(self, directory: str,
+                 apply: Callable[[str, Dict[str, Any]], None],
+                 dump: Callable[[], Dict[str, Any]],
+                 restore: Callable[[Dict[str, Any]], None],
+                 flush_interval: float = 0.005,
+                 snapshot_every: int = 10000):
+        self.directory = directory
+        self.apply = apply
+        self.dump = dump
+        self.restore = restore
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+
+        self._seq = 0
+        self._snapshot_seq = 0
+        self._buffer: List[Tuple[int, str, asyncio.Future]] = []
+        self._wal_file = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.directory, "snapshot.json")
+
+    def _segment_path(self, first_seq: int) -> str:
+        return os.path.join(self.directory, f"wal-{first_seq:012d}.log")
+
+    def _segments(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, "wal-*.log")))
+
+    def recover(self) -> int:
+        """Восстановить состояние: снимок + хвост журнала. Возвращает число проигранных записей"""
+        os.makedirs(self.directory, exist_ok=True)
+        started = time.perf_counter()
+
+        if os.path.exists(self._snapshot_path):
+            with open(self._snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self.restore(snapshot["state"])
+            self._snapshot_seq = self._seq = snapshot["seq"]
+
+        replayed = 0
+        for segment in self._segments():
+            with open(segment, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Оборванная последняя запись - процесс упал посреди записи
+                        logger.warning(f"⚠️ Повреждённая запись в {segment}, хвост пропущен")
+                        break
+                    if record["seq"] <= self._seq:
+                        continue
+                    self.apply(record["op"], record["data"])
+                    self._seq = record["seq"]
+                    replayed += 1
+
+        logger.info(
+            f"💾 Состояние восстановлено за {time.perf_counter() - started:.3f} с: "
+            f"снимок #{self._snapshot_seq}, записей из журнала: {replayed}"
+        )
+        return replayed
+
+    async def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._wal_file = open(self._segment_path(self._seq + 1), "a", encoding="utf-8")
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flusher:
+            # Не отменяем: отмена посреди записи в потоке оставила бы пачку
+            # без ответа, а снимок переоткрыл бы файл, в который ещё пишут
+            self._stopping = True
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+        await self._flush()
+        await self._snapshot()
+        if self._wal_file:
+            self._wal_file.close()
+            self._wal_file = None
+
+    def append(self, op: str, data: Dict[str, Any]) -> asyncio.Future:
+        """
+        Добавить запись в журнал
+        Возвращает future, который завершится, когда запись будет на диске
+        """
+        line = json.dumps({"seq": self._seq + 1, "op": op, "data": data}, ensure_ascii=False, default=_json_default)
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        self._buffer.append((self._seq, line, future))
+        if self._wakeup:
+            self._wakeup.set()
+        return future
+
+    async def _flush_loop(self) -> None:
+        while not self._stopping:
+            await self._wakeup.wait()
+            if not self._stopping:
+                # Небольшая пауза, чтобы собрать в пачку записи от одновременных апдейтов
+                await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self._flush()
+                if self._seq - self._snapshot_seq >= self.snapshot_every:
+                    await self._snapshot()
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи журнала: {e}")
+
+    async def _flush(self) -> None:
+        if not self._buffer or not self._wal_file:
+            return
+
+        batch, self._buffer = self._buffer, []
+        payload = "".join(line + "\n" for _, line, _ in batch)
+        try:
+            await asyncio.to_thread(self._write_and_sync, self._wal_file, payload)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            raise
+
+        for _, _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    @staticmethod
+    def _write_and_sync(wal_file, payload: str) -> None:
+        wal_file.write(payload)
+        wal_file.flush()
+        os.fsync(wal_file.fileno())
+
+    async def _snapshot(self) -> None:
+        """Записать снимок и начать новый сегмент журнала"""
+        # Записи, ещё не сброшенные в журнал, уже отражены в состоянии - их покроет снимок
+        pending, self._buffer = self._buffer, []
+        seq = self._seq
+        state = self.dump()
+
+        await asyncio.to_thread(self._write_snapshot, state, seq)
+        self._snapshot_seq = seq
+
+        old_segments = self._segments()
+        if self._wal_file:
+            self._wal_file.close()
+            self._wal_file = open(self._segment_path(seq + 1), "a", encoding="utf-8")
+        for segment in old_segments:
+            if segment != self._segment_path(seq + 1):
+                os.remove(segment)
+
+        for _, _, future in pending:
+            if not future.done():
+                future.set_result(None)
+        logger.info(f"💾 Снимок состояния #{seq} записан")
+
+    def _write_snapshot(self, state: Dict[str, Any], seq: int) -> None:
+        tmp_path = f"{self._snapshot_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"seq": seq, "state": state}, f, ensure_ascii=False, default=_json_default)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._snapshot_path)
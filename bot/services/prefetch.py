@@ -0,0 +1,244 @@
+import asyncio
+import inspect
+import logging
+import sys
+import time
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject
+
+logger = logging.getLogger(__name__)
+
+# Результат последнего обращения к кэшу экранов в рамках текущего апдейта
+_lookup_outcome: ContextVar[Optional[str]] = ContextVar("prefetch_lookup_outcome", default=None)
+
+
+def _estimate_size(value: Any) -> int:
+    """Грубая оценка памяти отрендеренного экрана (текст + кнопки)"""
+    if isinstance(value, tuple):
+        return sum(_estimate_size(item) for item in value)
+    if isinstance(value, str):
+        return sys.getsizeof(value)
+    markup = getattr(value, "inline_keyboard", None)
+    if markup is not None:
+        return sum(200 + sys.getsizeof(button.text) for row in markup for button in row)
+    return sys.getsizeof(value)
+
+
+class ScreenCache:
+    """LRU-кэш отрендеренных экранов с ограничением по памяти"""
+
+    def __init__(self, memory_budget: int):
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        # ключ -> (значение, размер, положен ли упреждающе и ещё не использован)
+        self._entries: "OrderedDict[str, Tuple[Any, int, bool]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.prefetch_used = 0
+        self.prefetch_evicted = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, size, prefetched = entry
+        self.hits += 1
+        if prefetched:
+            self.prefetch_used += 1
+            self._entries[key] = (value, size, False)
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Any, prefetched: bool = False) -> None:
+        size = _estimate_size(value)
+        if size > self.memory_budget:
+            return
+
+        self.invalidate(key)
+        self._entries[key] = (value, size, prefetched)
+        self.memory_used += size
+
+        while self.memory_used > self.memory_budget:
+            _, (_, evicted_size, evicted_prefetched) = self._entries.popitem(last=False)
+            self.memory_used -= evicted_size
+            if evicted_prefetched:
+                self.prefetch_evicted += 1
+
+    def invalidate(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.memory_used -= entry[1]
+
+
+class NavigationModel:
+    """
+    Частоты переходов между экранами по callback_data
+    Хранит ограниченное число исходных экранов и переходов из каждого.
+    """
+
+    def __init__(self, max_sources: int = 5000, max_targets: int = 20):
+        self.max_sources = max_sources
+        self.max_targets = max_targets
+        self._transitions: "OrderedDict[str, Counter]" = OrderedDict()
+        self._last_screen: "OrderedDict[int, str]" = OrderedDict()
+
+    def observe(self, user_id: int, screen: str) -> None:
+        previous = self._last_screen.pop(user_id, None)
+        self._last_screen[user_id] = screen
+        if len(self._last_screen) > self.max_sources * 10:
+            self._last_screen.popitem(last=False)
+
+        if previous is None:
+            return
+
+        counter = self._transitions.get(previous)
+        if counter is None:
+            counter = self._transitions[previous] = Counter()
+            if len(self._transitions) > self.max_sources:
+                self._transitions.popitem(last=False)
+        else:
+            self._transitions.move_to_end(previous)
+
+        counter[screen] += 1
+        if len(counter) > self.max_targets:
+            # Отбрасываем самый редкий переход
+            del counter[min(counter, key=counter.get)]
+
+    def predict(self, screen: str, k: int) -> List[str]:
+        counter = self._transitions.get(screen)
+        if not counter:
+            return []
+        return [target for target, _ in counter.most_common(k)]
+
+
+class Prefetcher:
+    """
+    Упреждающий рендер экранов, на которые пользователь вероятнее всего перейдёт
+    renderers: префикс callback_data -> функция(callback_data) -> экран или None.
+    warmers: функции(callback_data), прогревающие прочие кэши (например, фото);
+    могут быть корутинами - тогда ожидаются.
+    latency - время от входа апдейта в PrefetchMiddleware до возврата из
+    обработчика, включая его запросы к Telegram. Ожидание апдейта в polling
+    и внешние middleware сюда не входят.
+    """
+
+    def __init__(self, memory_budget: int = 2_000_000, top_k: int = 3):
+        self.cache = ScreenCache(memory_budget)
+        self.model = NavigationModel()
+        self.top_k = top_k
+        self.renderers: Dict[str, Callable[[str], Any]] = {}
+        self.warmers: List[Callable[[str], Any]] = []
+        self._tasks = set()
+        # Время обработки нажатий: обслуженных из кэша и отрендеренных заново
+        self.latency = {"hit": [0, 0.0], "miss": [0, 0.0]}
+
+    def _renderer(self, screen: str) -> Optional[Callable[[str], Any]]:
+        for prefix, render in self.renderers.items():
+            if screen.startswith(prefix):
+                return render
+        return None
+
+    def get_screen(self, screen: str) -> Any:
+        """Экран из кэша или свежий рендер"""
+        value = self.cache.get(screen)
+        if value is not None:
+            _lookup_outcome.set("hit")
+            return value
+
+        _lookup_outcome.set("miss")
+        render = self._renderer(screen)
+        value = render(screen) if render else None
+        if value is not None:
+            self.cache.put(screen, value)
+        return value
+
+    def invalidate(self, screen: str) -> None:
+        self.cache.invalidate(screen)
+
+    def schedule(self, screen: str) -> None:
+        """Прогреть в фоне top-k вероятных следующих экранов"""
+        candidates = [
+            target for target in self.model.predict(screen, self.top_k)
+            if target not in self.cache and self._renderer(target)
+        ]
+        if not candidates:
+            return
+        task = asyncio.create_task(self._warm(candidates))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _warm(self, screens: List[str]) -> None:
+        for screen in screens:
+            # Отдаём управление между экранами, чтобы не задерживать живые апдейты
+            await asyncio.sleep(0)
+            try:
+                value = self._renderer(screen)(screen)
+                if value is not None and screen not in self.cache:
+                    self.cache.put(screen, value, prefetched=True)
+                for warm in self.warmers:
+                    result = warm(screen)
+                    if inspect.isawaitable(result):
+                        await result
+            except Exception as e:
+                logger.error(f"❌ Ошибка упреждающего рендера {screen}: {e}")
+
+    def record_latency(self, seconds: float) -> None:
+        outcome = _lookup_outcome.get()
+        if outcome:
+            stats = self.latency[outcome]
+            stats[0] += 1
+            stats[1] += seconds
+
+    def stats(self) -> dict:
+        cache = self.cache
+        lookups = cache.hits + cache.misses
+
+        def average_ms(outcome: str) -> float:
+            count, total = self.latency[outcome]
+            return total / count * 1000 if count else 0.0
+
+        return {
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "hit_rate": cache.hits / lookups if lookups else 0.0,
+            "prefetch_used": cache.prefetch_used,
+            "prefetch_evicted": cache.prefetch_evicted,
+            "memory_used": cache.memory_used,
+            "memory_budget": cache.memory_budget,
+            "hit_latency_ms": average_ms("hit"),
+            "miss_latency_ms": average_ms("miss")
+        }
+
+
+class PrefetchMiddleware(BaseMiddleware):
+    """Учит модель переходов на нажатиях и запускает прогрев после обработки"""
+
+    def __init__(self, prefetcher: Prefetcher):
+        self.prefetcher = prefetcher
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, CallbackQuery) or not event.data:
+            return await handler(event, data)
+
+        self.prefetcher.model.observe(event.from_user.id, event.data)
+        _lookup_outcome.set(None)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.prefetcher.record_latency(time.perf_counter() - started)
+            self.prefetcher.schedule(event.data)
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+from .metrics import UNHANDLED, current_handler_name
+
+logger = logging.getLogger(__name__)
+
+# Стек: кортеж кадров от обработчика к вершине, кадр - "файл:функция"
+Stack = Tuple[str, ...]
+
+
+class _Span:
+    """Апдейт под профилированием; имя обработчика известно после обработки"""
+
+    __slots__ = ("name",)
+
+    def __init__(self):
+        self.name: Optional[str] = None
+
+
+class ProfileSession:
+    """Один сеанс профилирования: до max_updates апдейтов или seconds секунд"""
+
+    def __init__(self, max_updates: Optional[int], seconds: Optional[float], interval: float):
+        self.max_updates = max_updates
+        self.seconds = seconds
+        self.interval = interval
+        self.started = time.time()
+        self.updates: Counter = Counter()
+        # (апдейт, стек); дописывается потоком-сэмплером
+        self.samples: List[Tuple[_Span, Stack]] = []
+
+    def stacks(self) -> Dict[str, Counter]:
+        """Число сэмплов по стекам для каждого обработчика"""
+        result: Dict[str, Counter] = {}
+        for span, stack in self.samples:
+            result.setdefault(span.name or UNHANDLED, Counter())[stack] += 1
+        return result
+
+
+class HandlerProfiler:
+    """
+    Статистическое профилирование обработчиков по запросу
+    На время сеанса к диспетчеру подключается внешний middleware, а фоновый
+    поток раз в interval секунд снимает стек основного потока. Сэмпл
+    относится к апдейту, кадр middleware которого есть в стеке, и после
+    обработки - к выбранному обработчику (имя из учёта метрик). По окончании
+    (N апдейтов или T секунд) middleware снимается, поток останавливается,
+    стеки пишутся в формате collapsed stacks (flamegraph.pl, speedscope).
+    Вне сеанса профилировщик не участвует в обработке апдейтов.
+    """
+
+    def __init__(self, output_dir: str, interval: float = 0.005):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.session: Optional[ProfileSession] = None
+        self._dispatcher: Optional[Dispatcher] = None
+        self._middleware: Optional[ProfilerMiddleware] = None
+        # Кадр вызова middleware -> апдейт (чтение из потока-сэмплера)
+        self._spans: Dict[Any, _Span] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._timer: Optional[asyncio.Task] = None
+        self._done: Optional[asyncio.Future] = None
+
+    @property
+    def active(self) -> bool:
+        return self.session is not None
+
+    def start(self, dispatcher: Dispatcher, max_updates: Optional[int] = None,
+              seconds: Optional[float] = None) -> asyncio.Future:
+        """Начать сеанс; возвращает future с отчётом (результат stop())"""
+        if self.session is not None:
+            raise RuntimeError("Профилирование уже запущено")
+        if not max_updates and not seconds:
+            raise ValueError("Нужно число апдейтов или длительность")
+        self.session = ProfileSession(max_updates, seconds, self.interval)
+        self._done = asyncio.get_running_loop().create_future()
+        self._dispatcher = dispatcher
+        self._middleware = ProfilerMiddleware(self)
+        dispatcher.update.outer_middleware(self._middleware)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, args=(threading.main_thread().ident,),
+                                        name="handler-profiler", daemon=True)
+        self._thread.start()
+        if seconds:
+            self._timer = asyncio.create_task(self._stop_later(seconds))
+        logger.info(f"🔬 Профилирование: апдейтов {max_updates or '-'}, секунд {seconds or '-'}")
+        return self._done
+
+    async def _stop_later(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+        self._timer = None
+        await self.stop()
+
+    def _update_done(self) -> None:
+        """Вызывается middleware после каждого апдейта"""
+        session = self.session
+        if session.max_updates and sum(session.updates.values()) >= session.max_updates:
+            asyncio.create_task(self.stop())
+
+    def _sample(self, thread_id: int) -> None:
+        """Поток-сэмплер: стек основного потока от обработчика до вершины"""
+        spans = self._spans
+        session = self.session
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                span = spans.get(frame)
+                if span is not None:
+                    stack.reverse()
+                    session.samples.append((span, tuple(stack)))
+                    break
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            # Кадра middleware нет - цикл событий простаивает или занят не апдейтом
+            del frame
+
+    async def stop(self) -> Optional[Dict[str, Any]]:
+        """Снять middleware, остановить сэмплер, записать стеки; None - сеанса нет"""
+        session = self.session
+        if session is None:
+            return None
+        self.session = None
+        self._dispatcher.update.outer_middleware.unregister(self._middleware)
+        self._dispatcher = self._middleware = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._stop.set()
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+        self._spans.clear()
+
+        report = await asyncio.to_thread(self._write, session)
+        logger.info(f"🔬 Профилирование завершено: {report['path']}")
+        if not self._done.done():
+            self._done.set_result(report)
+        return report
+
+    def _write(self, session: ProfileSession) -> Dict[str, Any]:
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(session.started))
+        path = os.path.join(self.output_dir, stamp)
+        os.makedirs(path, exist_ok=True)
+        stacks = session.stacks()
+        handlers = []
+        with open(os.path.join(path, "all.folded"), "w", encoding="utf-8") as combined:
+            # Обработчики без сэмплов (быстрее интервала) тоже попадают в отчёт
+            for name in sorted(set(stacks) | set(session.updates)):
+                counts = stacks.get(name, Counter())
+                with open(os.path.join(path, f"{name}.folded"), "w", encoding="utf-8") as f:
+                    for stack, count in counts.most_common():
+                        f.write(f"{';'.join(stack) or name} {count}\n")
+                        combined.write(f"{';'.join((name,) + stack)} {count}\n")
+                # Самые частые верхние кадры - где обработчик проводит время
+                leaves: Counter = Counter()
+                for stack, count in counts.items():
+                    leaves[stack[-1] if stack else name] += count
+                handlers.append((name, session.updates[name], sum(counts.values()), leaves.most_common(3)))
+        handlers.sort(key=lambda item: -item[2])
+        return {
+            "path": path,
+            "updates": sum(session.updates.values()),
+            "duration": time.time() - session.started,
+            "interval": session.interval,
+            "handlers": handlers,
+        }
+
+
+class ProfilerMiddleware(BaseMiddleware):
+    """Внешний middleware на время сеанса: отмечает кадр апдейта для сэмплера"""
+
+    def __init__(self, profiler: HandlerProfiler):
+        self.profiler = profiler
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        session = self.profiler.session
+        if session is None:
+            return await handler(event, data)
+        span = _Span()
+        frame = sys._getframe()
+        self.profiler._spans[frame] = span
+        try:
+            return await handler(event, data)
+        finally:
+            self.profiler._spans.pop(frame, None)
+            span.name = current_handler_name() or UNHANDLED
+            session.updates[span.name] += 1
+            if self.profiler.session is session:
+                self.profiler._update_done()
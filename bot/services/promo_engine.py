@@ -0,0 +1,158 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_Check = Callable[[int, float], Optional[str]]
+# (сумма корзины, суммы по категориям) -> (ошибка, скидка, бесплатная доставка)
+_Pricing = Callable[[float, Dict[Optional[str], float]], Tuple[Optional[str], float, bool]]
+
+
+class PromoResult:
+    __slots__ = ("code", "ok", "discount", "free_delivery", "message")
+
+    def __init__(self, code: str, ok: bool, discount: float = 0, free_delivery: bool = False, message: str = ""):
+        self.code = code
+        self.ok = ok
+        self.discount = discount
+        self.free_delivery = free_delivery
+        self.message = message
+
+
+class CompiledPromo:
+    """Правило промокода, собранное в функции проверки и расчёта"""
+
+    __slots__ = ("code", "title", "message", "global_limit", "per_user_limit", "checks", "pricing")
+
+    def __init__(self, code: str, rule: Dict[str, Any]):
+        self.code = code
+        self.title = rule.get("title", code)
+        self.message = rule.get("message", f"✅ Промокод {code} применён")
+        self.global_limit: Optional[int] = rule.get("global_limit")
+        self.per_user_limit: Optional[int] = rule.get("per_user_limit")
+        self.checks: List[_Check] = []
+
+        valid_from = _parse_date(rule.get("valid_from"))
+        valid_until = _parse_date(rule.get("valid_until"))
+        if valid_from is not None:
+            self.checks.append(lambda user_id, now: None if now >= valid_from else "Промокод ещё не действует")
+        if valid_until is not None:
+            # valid_until - последний день действия включительно
+            self.checks.append(lambda user_id, now: None if now < valid_until + 86400 else "Срок действия промокода истёк")
+
+        self.pricing = self._compile_pricing(rule)
+
+    @staticmethod
+    def _compile_pricing(rule: Dict[str, Any]) -> _Pricing:
+        kind = rule["type"]
+        value = rule.get("value", 0)
+        min_basket = rule.get("min_basket", 0)
+        categories = frozenset(rule["categories"]) if rule.get("categories") else None
+
+        if kind not in ("percent", "fixed", "free_delivery"):
+            raise ValueError(f"Неизвестный тип промокода: {kind}")
+
+        def pricing(basket: float, category_totals: Dict[Optional[str], float]) -> Tuple[Optional[str], float, bool]:
+            if categories is None:
+                eligible = basket
+            else:
+                eligible = sum(category_totals.get(category, 0) for category in categories)
+
+            if basket < min_basket:
+                return f"Минимальная сумма заказа для промокода - {min_basket}₽", 0, False
+            if not eligible:
+                return "В корзине нет товаров, на которые действует промокод", 0, False
+            if kind == "percent":
+                return None, round(eligible * value / 100, 2), False
+            if kind == "fixed":
+                return None, min(value, eligible), False
+            return None, 0, True
+
+        return pricing
+
+
+def _parse_date(value: Optional[str]) -> Optional[float]:
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+class PromoEngine:
+    """
+    Промокоды: правила из JSON-файла, собранные в функции один раз
+    Типы: percent, fixed, free_delivery. Условия: categories, min_basket,
+    valid_from/valid_until, per_user_limit, global_limit.
+    Счётчики использований меняются под блокировкой: redeem проверяет
+    лимиты и увеличивает счётчик атомарно, поэтому одновременные
+    оформления не превысят лимит. Расчёт идёт по суммам корзины, а не по
+    позициям; результат хранит сама корзина (Cart) и пересчитывает его
+    только при изменении корзины.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.promos: Dict[str, CompiledPromo] = {}
+        self.redemptions: Dict[str, int] = {}
+        self.user_redemptions: Dict[Tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            rules = json.load(f)
+        self.promos = {code.upper(): CompiledPromo(code.upper(), rule) for code, rule in rules.items()}
+        logger.info(f"🎁 Загружено промокодов: {len(self.promos)}")
+
+    def evaluate(self, code: str, user_id: int, basket: float,
+                 category_totals: Dict[Optional[str], float], now: Optional[float] = None) -> PromoResult:
+        """Проверить промокод для корзины (сумма и суммы по категориям) и посчитать скидку"""
+        code = code.upper().strip()
+        promo = self.promos.get(code)
+        if promo is None:
+            return PromoResult(code, False, message="Неверный промокод")
+
+        error = self._check_limits(promo, user_id, time.time() if now is None else now)
+        if error:
+            return PromoResult(code, False, message=error)
+
+        error, discount, free_delivery = promo.pricing(basket, category_totals)
+        if error:
+            return PromoResult(code, False, message=error)
+        return PromoResult(code, True, discount, free_delivery, promo.message)
+
+    def _check_limits(self, promo: CompiledPromo, user_id: int, now: float) -> Optional[str]:
+        for check in promo.checks:
+            error = check(user_id, now)
+            if error:
+                return error
+        if promo.global_limit is not None and self.redemptions.get(promo.code, 0) >= promo.global_limit:
+            return "Промокод больше не действует"
+        if promo.per_user_limit is not None and \
+                self.user_redemptions.get((promo.code, user_id), 0) >= promo.per_user_limit:
+            return "Вы уже использовали этот промокод"
+        return None
+
+    def redeem(self, code: str, user_id: int, now: Optional[float] = None) -> Optional[str]:
+        """Атомарно проверить лимиты и засчитать использование. Возвращает ошибку или None"""
+        promo = self.promos.get(code)
+        if promo is None:
+            return "Неверный промокод"
+        with self._lock:
+            error = self._check_limits(promo, user_id, time.time() if now is None else now)
+            if error:
+                return error
+            self.record_redemption(code, user_id)
+        return None
+
+    def record_redemption(self, code: str, user_id: int, count: int = 1) -> None:
+        """Учесть использование без проверок (восстановление из журнала)"""
+        self.redemptions[code] = self.redemptions.get(code, 0) + count
+        self.user_redemptions[(code, user_id)] = self.user_redemptions.get((code, user_id), 0) + count
+
+    def dump(self) -> List[List[Any]]:
+        return [[code, user_id, count] for (code, user_id), count in self.user_redemptions.items() if count]
+
+    def restore(self, rows: List[List[Any]]) -> None:
+        for code, user_id, count in rows:
+            self.record_redemption(code, user_id, count)
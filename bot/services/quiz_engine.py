@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+
+class QuizAnswer:
+    __slots__ = ("id", "key", "value", "text", "question", "slot")
+
+    def __init__(self, data: Dict[str, Any], question: "QuizQuestion"):
+        self.id: int = data["id"]
+        self.key: str = data["key"]
+        self.value = data.get("value", 0)
+        self.text: str = data["text"]
+        self.question = question
+        # Плотный номер ответа среди всех ответов (индекс в массивах счётчиков)
+        self.slot = -1
+
+
+class QuizQuestion:
+    """Вопрос с заранее собранными текстом экрана и клавиатурой"""
+
+    __slots__ = ("id", "index", "text", "feature", "answers", "quiz", "screen", "markup", "slot")
+
+    def __init__(self, data: Dict[str, Any], index: int, quiz: "Quiz"):
+        self.id: int = data["id"]
+        self.index = index
+        self.text: str = data["text"]
+        # Признак, который уточняет вопрос (purpose, skill, budget) - для подбора товаров
+        self.feature: Optional[str] = data.get("feature")
+        self.quiz = quiz
+        self.answers: List[QuizAnswer] = [QuizAnswer(answer, self) for answer in data["answers"]]
+        self.screen = ""
+        self.markup: Optional[InlineKeyboardMarkup] = None
+        self.slot = -1
+
+    def _render(self, total: int) -> None:
+        self.screen = f"📊 Вопрос {self.index + 1}/{total}\n\n{self.text}"
+        keyboard = [
+            [InlineKeyboardButton(text=answer.text, callback_data=f"answer_{answer.id}")]
+            for answer in self.answers
+        ]
+        if self.index > 0:
+            keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back")])
+        keyboard.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_test")])
+        self.markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+class Quiz:
+    __slots__ = ("id", "name", "title", "questions", "slot")
+
+    def __init__(self, data: Dict[str, Any]):
+        self.id: int = data["id"]
+        self.name: str = data.get("name", "")
+        self.title: str = data.get("title", "")
+        self.slot = -1
+        self.questions = [QuizQuestion(question, index, self) for index, question in enumerate(data["questions"])]
+        for question in self.questions:
+            question._render(len(self.questions))
+
+    def question(self, index: int) -> Optional[QuizQuestion]:
+        return self.questions[index] if 0 <= index < len(self.questions) else None
+
+
+class QuizEngine:
+    """
+    Тесты из JSON-файла, собранные в таблицы поиска
+    При загрузке строятся словари test_id -> тест и answer_id -> ответ
+    (ответ знает свой вопрос и тест), а экраны вопросов с клавиатурами
+    собираются заранее - шаг теста не зависит от размера теста.
+    Файл перечитывается при изменении (проверка mtime не чаще раза в
+    check_interval секунд); если новый файл с ошибкой, остаются
+    прежние тесты.
+    """
+
+    def __init__(self, path: str, check_interval: float = 5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.quizzes: Dict[int, Quiz] = {}
+        self.answers: Dict[int, QuizAnswer] = {}
+        self.question_count = 0
+        # Вызываются после каждой (пере)загрузки: функция(engine)
+        self.listeners: List[Callable[["QuizEngine"], Any]] = []
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+
+    def load(self) -> None:
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        quizzes: Dict[int, Quiz] = {}
+        answers: Dict[int, QuizAnswer] = {}
+        question_count = 0
+        for item in data:
+            quiz = Quiz(item)
+            if quiz.id in quizzes:
+                raise ValueError(f"Повторяющийся ID теста: {quiz.id}")
+            quiz.slot = len(quizzes)
+            quizzes[quiz.id] = quiz
+            for question in quiz.questions:
+                question.slot = question_count
+                question_count += 1
+                for answer in question.answers:
+                    if answer.id in answers:
+                        raise ValueError(f"Повторяющийся ID ответа: {answer.id}")
+                    answer.slot = len(answers)
+                    answers[answer.id] = answer
+
+        self.quizzes, self.answers, self.question_count = quizzes, answers, question_count
+        self._mtime = mtime
+        logger.info(f"📝 Загружено тестов: {len(quizzes)}, ответов: {len(answers)}")
+        for listener in self.listeners:
+            listener(self)
+
+    def maybe_reload(self) -> bool:
+        """Перечитать файл, если он изменился. Возвращает True при перезагрузке"""
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            logger.error(f"❌ Файл тестов {self.path} недоступен: {e}")
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            self.load()
+            return True
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"❌ Не удалось загрузить тесты из {self.path}: {e}")
+            # Тот же файл повторно не разбираем - ждём следующего изменения
+            self._mtime = mtime
+            return False
+
+    def quiz(self, test_id: int) -> Optional[Quiz]:
+        self.maybe_reload()
+        return self.quizzes.get(test_id)
+
+    def answer(self, answer_id: int) -> Optional[QuizAnswer]:
+        return self.answers.get(answer_id)
+
+    def features(self, answer_ids: Iterable[int]) -> Dict[str, Any]:
+        """Признаки пользователя по выбранным ответам: {feature вопроса: value ответа}"""
+        features = {}
+        for answer_id in answer_ids:
+            answer = self.answers.get(answer_id)
+            if answer is not None and answer.question.feature:
+                features[answer.question.feature] = answer.value
+        return features
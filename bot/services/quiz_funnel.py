@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import os
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _counters(size: int) -> array:
+    return array("Q", bytes(8 * size))
+
+
+class QuizFunnel:
+    """
+    Воронка тестов: старты, показы вопросов, выбор ответов, "Назад",
+    отмены и завершения
+    Счётчики - заранее выделенные массивы, индексы - номера (slot),
+    присвоенные тестам, вопросам и ответам при сборке QuizEngine, поэтому
+    учёт события - одно увеличение элемента массива без поиска по словарям.
+    Счётчики меняются только из цикла событий, блокировки не нужны. При
+    перезагрузке тестов массивы пересобираются с переносом накопленного по
+    постоянным ID. На диск сбрасываются раз в flush_interval секунд.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 60):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.starts = _counters(0)
+        self.completions = _counters(0)
+        self.views = _counters(0)
+        self.backs = _counters(0)
+        self.cancels = _counters(0)
+        self.picks = _counters(0)
+        # slot -> постоянный ключ (для переноса при перезагрузке и записи на диск)
+        self._quiz_keys: List[str] = []
+        self._question_keys: List[str] = []
+        self._answer_keys: List[str] = []
+        # Накопленное по ключам, которых нет в текущих тестах (или до bind)
+        self._stash: Dict[str, Dict[str, List[int]]] = {"quizzes": {}, "questions": {}, "answers": {}}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    # События (горячий путь)
+    def start(self, quiz: Any) -> None:
+        self.starts[quiz.slot] += 1
+
+    def complete(self, quiz: Any) -> None:
+        self.completions[quiz.slot] += 1
+
+    def view(self, question: Any) -> None:
+        self.views[question.slot] += 1
+
+    def back(self, question: Any) -> None:
+        self.backs[question.slot] += 1
+
+    def cancel(self, question: Any) -> None:
+        self.cancels[question.slot] += 1
+
+    def pick(self, answer: Any) -> None:
+        self.picks[answer.slot] += 1
+
+    # Привязка к собранным тестам
+    def _export(self) -> Dict[str, Dict[str, List[int]]]:
+        """Все счётчики по постоянным ключам"""
+        data = {section: dict(values) for section, values in self._stash.items()}
+        for slot, key in enumerate(self._quiz_keys):
+            data["quizzes"][key] = [self.starts[slot], self.completions[slot]]
+        for slot, key in enumerate(self._question_keys):
+            data["questions"][key] = [self.views[slot], self.backs[slot], self.cancels[slot]]
+        for slot, key in enumerate(self._answer_keys):
+            data["answers"][key] = [self.picks[slot]]
+        return data
+
+    def bind(self, engine: Any) -> None:
+        """Пересобрать массивы под тесты engine (слушатель перезагрузки QuizEngine)"""
+        data = self._export()
+        quizzes = sorted(engine.quizzes.values(), key=lambda quiz: quiz.slot)
+        questions = sorted((question for quiz in quizzes for question in quiz.questions),
+                           key=lambda question: question.slot)
+        answers = sorted(engine.answers.values(), key=lambda answer: answer.slot)
+
+        self._quiz_keys = [str(quiz.id) for quiz in quizzes]
+        self._question_keys = [f"{question.quiz.id}:{question.id}" for question in questions]
+        self._answer_keys = [str(answer.id) for answer in answers]
+
+        def take(section: str, keys: List[str], width: int) -> List[array]:
+            columns = [_counters(len(keys)) for _ in range(width)]
+            for slot, key in enumerate(keys):
+                values = data[section].pop(key, None)
+                if values:
+                    for column, value in zip(columns, values):
+                        column[slot] = value
+            return columns
+
+        self.starts, self.completions = take("quizzes", self._quiz_keys, 2)
+        self.views, self.backs, self.cancels = take("questions", self._question_keys, 3)
+        self.picks, = take("answers", self._answer_keys, 1)
+        self._stash = data
+
+    # Хранение
+    def load(self) -> None:
+        """Загрузить счётчики с диска (вызывается до bind)"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            saved = json.load(f)
+        self._stash = {section: dict(saved.get(section, {})) for section in self._stash}
+
+    def _write(self, data: Dict[str, Dict[str, List[int]]]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def save(self) -> None:
+        self._write(self._export())
+
+    async def _flush_loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                # Снимок счётчиков - в цикле событий, запись файла - в потоке
+                await asyncio.to_thread(self._write, self._export())
+            except OSError as e:
+                logger.error(f"❌ Не удалось сохранить воронку тестов: {e}")
+
+    def start_flushing(self) -> None:
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            # Не отменяем: поток продолжил бы писать тот же .tmp, что и save() ниже
+            self._stopping.set()
+            await self._task
+            self._task = None
+        self.save()
+
+    # Отчёт
+    def report(self, quiz: Any) -> Tuple[int, int, List[Tuple[Any, int, int, int, List[Tuple[Any, int]]]]]:
+        """(старты, завершения, [(вопрос, показы, назад, отмены, [(ответ, выборы)])])"""
+        rows = [
+            (question, self.views[question.slot], self.backs[question.slot], self.cancels[question.slot],
+             [(answer, self.picks[answer.slot]) for answer in question.answers])
+            for question in quiz.questions
+        ]
+        return self.starts[quiz.slot], self.completions[quiz.slot], rows
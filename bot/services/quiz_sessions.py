@@ -0,0 +1,88 @@
+import struct
+import time
+from array import array
+from typing import Any, Optional
+
+# Относительный импорт: модуль используется и из support_bot, и из пакета bot (routers)
+from .ttl_store import TTLStore
+
+# test_id, номер текущего вопроса; за ними - ID выбранных ответов по uint16
+HEADER = struct.Struct("<HB")
+# Ключ записи в данных FSM: [упакованная сессия в hex, срок unix-время]
+FSM_KEY = "quiz"
+
+
+class QuizSession:
+    """Прохождение теста: ID теста, номер вопроса и ответы на предыдущие вопросы"""
+
+    __slots__ = ("test_id", "index", "answers")
+
+    def __init__(self, test_id: int, index: int = 0, answers: Optional[array] = None):
+        self.test_id = test_id
+        self.index = index
+        self.answers = answers if answers is not None else array("H")
+
+    def answer(self, answer_id: int) -> None:
+        """Ответ на текущий вопрос; ответы после него (после "Назад") отбрасываются"""
+        del self.answers[self.index:]
+        self.answers.append(answer_id)
+        self.index += 1
+
+    def back(self) -> bool:
+        if self.index == 0:
+            return False
+        self.index -= 1
+        return True
+
+    def pack(self) -> bytes:
+        return HEADER.pack(self.test_id, self.index) + self.answers.tobytes()
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "QuizSession":
+        test_id, index = HEADER.unpack_from(data)
+        answers = array("H")
+        answers.frombytes(data[HEADER.size:])
+        return cls(test_id, index, answers)
+
+
+class QuizSessionStore:
+    """
+    Сессии тестов в памяти с истечением срока и копией в хранилище FSM
+    В памяти - упакованная запись на пользователя (несколько десятков
+    байт), брошенные тесты удаляются через ttl секунд, а при наплыве
+    вытесняются самые давние сверх max_entries. Каждый шаг пишется и в
+    данные FSM, поэтому с постоянным хранилищем FSM (Redis) сессия
+    переживает перезапуск бота и вытеснение из памяти.
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 100_000):
+        self.ttl = ttl
+        self.store = TTLStore(ttl, max_entries)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    async def load(self, user_id: int, state: Any) -> Optional[QuizSession]:
+        """Сессия пользователя из памяти, иначе из данных FSM (state: FSMContext)"""
+        payload = self.store.get(user_id)
+        if payload is None:
+            saved = (await state.get_data()).get(FSM_KEY)
+            if not saved or saved[1] <= time.time():
+                return None
+            payload = bytes.fromhex(saved[0])
+            self.store.set(user_id, payload)
+        return QuizSession.unpack(payload)
+
+    async def save(self, user_id: int, session: QuizSession, state: Any) -> None:
+        payload = session.pack()
+        # Брошенные тесты снимаются с начала очереди попутно - без отдельной задачи
+        self.store.expire()
+        self.store.set(user_id, payload)
+        await state.update_data({FSM_KEY: [payload.hex(), int(time.time() + self.ttl)]})
+
+    async def drop(self, user_id: int, state: Any) -> None:
+        self.store.pop(user_id)
+        await state.update_data({FSM_KEY: None})
+
+    def expire(self) -> int:
+        return self.store.expire()
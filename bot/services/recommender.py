@@ -0,0 +1,188 @@
+"""
+Подбор велосипедов по ответам теста
+Каждый товар-основа семейства (без вариантов) описывается вектором
+признаков: назначение, покрытие, уровень подготовки, ценовой диапазон.
+Ответы теста превращаются в вектор предпочтений, а оценка всех товаров
+считается одним матричным умножением; лучшие k берутся argpartition
+без полной сортировки. Матрица строится один раз из колонок каталога,
+остатки и цены обновляются точечно.
+"""
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+PURPOSES = ("city", "sport", "tourism", "offroad")
+TERRAINS = ("asphalt", "mixed", "rough")
+# Границы ценовых диапазонов в копейках: до 20 000₽, 20 000-50 000₽, дороже
+BUDGET_EDGES = np.array([20000_00, 50000_00], dtype=np.int64)
+
+# Колонки матрицы признаков
+PURPOSE_COLUMNS = slice(0, 4)
+TERRAIN_COLUMNS = slice(4, 7)
+SKILL_COLUMNS = slice(7, 10)
+BUDGET_COLUMNS = slice(10, 13)
+FEATURES = 13
+# Предел глубины цепочек parent_id (защита от циклов в данных)
+MAX_DEPTH = 16
+
+# Профиль категории: насколько товар подходит под каждое назначение, покрытие и уровень
+CATEGORY_PROFILES: Dict[str, Dict[str, Tuple[float, ...]]] = {
+    "mountain": {"purpose": (0.2, 0.7, 0.5, 1.0), "terrain": (0.2, 0.6, 1.0), "skill": (0.5, 0.9, 1.0)},
+    "folding": {"purpose": (1.0, 0.1, 0.3, 0.0), "terrain": (1.0, 0.3, 0.0), "skill": (1.0, 0.7, 0.3)},
+    "hybrid": {"purpose": (0.8, 0.5, 1.0, 0.3), "terrain": (0.8, 1.0, 0.3), "skill": (1.0, 0.9, 0.6)}
+}
+DEFAULT_PROFILE = {"purpose": (0.5,) * 4, "terrain": (0.5,) * 3, "skill": (0.5,) * 3}
+
+# Предпочтения пользователя по значению ответа (value из quizzes.json, с 1)
+PURPOSE_TERRAIN = ((1.0, 0.3, 0.0), (0.8, 0.6, 0.1), (0.3, 1.0, 0.5), (0.0, 0.4, 1.0))
+SKILL_PREFS = ((1.0, 0.3, 0.0), (0.3, 1.0, 0.3), (0.0, 0.4, 1.0))
+BUDGET_PREFS = ((1.0, 0.2, 0.0), (0.6, 1.0, 0.1), (0.3, 0.8, 1.0))
+WEIGHTS = {"purpose": 1.0, "terrain": 0.5, "skill": 0.7, "budget": 1.2}
+
+
+def _budget_tiers(prices: np.ndarray) -> np.ndarray:
+    return np.searchsorted(BUDGET_EDGES, prices, side="left")
+
+
+def _answer(features: Dict[str, int], name: str, count: int) -> Optional[int]:
+    """value ответа от 1 до count; иное значение (ошибка в quizzes.json) не учитывается"""
+    value = features.get(name)
+    if isinstance(value, int) and 1 <= value <= count:
+        return value
+    return None
+
+
+class Recommender:
+    """
+    Матрица признаков каталога и выбор top-k товаров в наличии
+    Строки матрицы - основы семейств; остаток строки - сумма остатков
+    вариантов, цена - минимальная цена варианта.
+    """
+
+    def __init__(self):
+        self.matrix = np.zeros((0, FEATURES), dtype=np.float32)
+        self.candidate_ids = np.zeros(0, dtype=np.int64)
+        self.candidate_stock = np.zeros(0, dtype=np.int64)
+        self.candidate_price = np.zeros(0, dtype=np.int64)
+        # Все строки каталога (включая варианты), по возрастанию id
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._stock = np.zeros(0, dtype=np.int64)
+        self._prices = np.zeros(0, dtype=np.int64)
+        self._candidate_of = np.zeros(0, dtype=np.int64)
+        # Строки каталога, сгруппированные по семействам: строки семейства c -
+        # _family_rows[_family_starts[c]:_family_starts[c + 1]]
+        self._family_rows = np.zeros(0, dtype=np.int64)
+        self._family_starts = np.zeros(1, dtype=np.int64)
+        self.built = False
+
+    def __len__(self) -> int:
+        return len(self.candidate_ids)
+
+    def build(self, columns: Tuple[Sequence[int], Sequence[int], Sequence[int], List[str], Sequence[int], Sequence[int]],
+              available: Optional[Callable[[int], int]] = None) -> None:
+        """
+        Построить матрицу по колонкам каталога (catalog.feature_columns)
+        available(product_id) - актуальный остаток, если он отличается от каталожного
+        """
+        ids, parents, codes, category_keys, prices, stock = columns
+        self._ids = np.asarray(ids, dtype=np.int64)
+        self._prices = np.asarray(prices, dtype=np.int64).copy()
+        if available is not None:
+            self._stock = np.fromiter((available(int(product_id)) for product_id in self._ids),
+                                      dtype=np.int64, count=len(self._ids))
+        else:
+            self._stock = np.asarray(stock, dtype=np.int64).copy()
+
+        # Корень семейства каждой строки: поднимаемся по parent_id всеми строками сразу
+        roots = np.arange(len(self._ids))
+        parent_rows = self._rows(np.asarray(parents, dtype=np.int64))
+        for _ in range(MAX_DEPTH):
+            step = np.where(parent_rows[roots] >= 0, parent_rows[roots], roots)
+            if np.array_equal(step, roots):
+                break
+            roots = step
+
+        candidate_rows, self._candidate_of = np.unique(roots, return_inverse=True)
+        count = len(candidate_rows)
+        self._family_rows = np.argsort(self._candidate_of, kind="stable")
+        self._family_starts = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self._candidate_of, minlength=count), out=self._family_starts[1:])
+        self.candidate_ids = self._ids[candidate_rows]
+        self.candidate_stock = np.zeros(count, dtype=np.int64)
+        np.add.at(self.candidate_stock, self._candidate_of, self._stock)
+        self.candidate_price = np.full(count, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(self.candidate_price, self._candidate_of, self._prices)
+
+        profiles = np.zeros((len(category_keys), BUDGET_COLUMNS.start), dtype=np.float32)
+        for code, key in enumerate(category_keys):
+            profile = CATEGORY_PROFILES.get(key, DEFAULT_PROFILE)
+            profiles[code] = profile["purpose"] + profile["terrain"] + profile["skill"]
+        self.matrix = np.zeros((count, FEATURES), dtype=np.float32)
+        self.matrix[:, :BUDGET_COLUMNS.start] = profiles[np.asarray(codes, dtype=np.int64)[candidate_rows]]
+        self.matrix[np.arange(count), BUDGET_COLUMNS.start + _budget_tiers(self.candidate_price)] = 1
+        self.built = True
+
+    def _rows(self, product_ids: np.ndarray) -> np.ndarray:
+        """Номера строк по id (-1 - нет в каталоге)"""
+        if not len(self._ids):
+            return np.full(len(product_ids), -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self._ids, product_ids), len(self._ids) - 1)
+        return np.where(self._ids[rows] == product_ids, rows, -1)
+
+    def _row(self, product_id: int) -> Optional[int]:
+        row = int(np.searchsorted(self._ids, product_id))
+        if row < len(self._ids) and self._ids[row] == product_id:
+            return row
+        return None
+
+    def invalidate(self) -> None:
+        """Каталог изменился целиком - матрица перестроится при следующем подборе"""
+        self.built = False
+
+    def set_stock(self, product_id: int, available: int) -> None:
+        """Подписчик на изменение остатка"""
+        row = self._row(product_id) if self.built else None
+        if row is None:
+            return
+        self.candidate_stock[self._candidate_of[row]] += available - self._stock[row]
+        self._stock[row] = available
+
+    def set_price(self, product_id: int, price) -> None:
+        """Подписчик на изменение цены (в рублях): пересчитывает ценовой диапазон семейства"""
+        row = self._row(product_id) if self.built else None
+        if row is None:
+            return
+        self._prices[row] = int(price * 100)
+        candidate = self._candidate_of[row]
+        family = self._family_rows[self._family_starts[candidate]:self._family_starts[candidate + 1]]
+        family_price = self._prices[family].min()
+        self.candidate_price[candidate] = family_price
+        self.matrix[candidate, BUDGET_COLUMNS] = 0
+        self.matrix[candidate, BUDGET_COLUMNS.start + _budget_tiers(family_price)] = 1
+
+    @staticmethod
+    def user_vector(features: Dict[str, int]) -> np.ndarray:
+        """Вектор предпочтений по ответам: {признак вопроса: value ответа}"""
+        vector = np.zeros(FEATURES, dtype=np.float32)
+        purpose = _answer(features, "purpose", len(PURPOSES))
+        if purpose:
+            vector[PURPOSE_COLUMNS.start + purpose - 1] = WEIGHTS["purpose"]
+            vector[TERRAIN_COLUMNS] = np.array(PURPOSE_TERRAIN[purpose - 1]) * WEIGHTS["terrain"]
+        skill = _answer(features, "skill", len(SKILL_PREFS))
+        if skill:
+            vector[SKILL_COLUMNS] = np.array(SKILL_PREFS[skill - 1]) * WEIGHTS["skill"]
+        budget = _answer(features, "budget", len(BUDGET_PREFS))
+        if budget:
+            vector[BUDGET_COLUMNS] = np.array(BUDGET_PREFS[budget - 1]) * WEIGHTS["budget"]
+        return vector
+
+    def top(self, features: Dict[str, int], k: int = 3) -> List[Tuple[int, float]]:
+        """Лучшие k товаров в наличии: [(product_id, оценка)] по убыванию оценки"""
+        scores = self.matrix @ self.user_vector(features)
+        scores[self.candidate_stock <= 0] = -np.inf
+        k = min(k, int(np.count_nonzero(self.candidate_stock > 0)))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(self.candidate_ids[row]), float(scores[row])) for row in best]
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+
+
+class Timer:
+    __slots__ = ("key", "tick", "due", "kind", "data", "group", "level", "slot")
+
+    def __init__(self, key: str, due: float, kind: str, data: Optional[dict], group: Optional[str]):
+        self.key = key
+        self.due = due
+        self.kind = kind
+        self.data = data
+        self.group = group
+        self.tick = 0
+        self.level = -1
+        self.slot = -1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"key": self.key, "due": self.due, "kind": self.kind, "data": self.data, "group": self.group}
+
+
+class TimerWheel:
+    """
+    Иерархическое колесо таймеров
+    levels колёс по 64 слота: первое колесо - шаг resolution секунд,
+    каждое следующее - в 64 раза крупнее (при шаге 1 с и 5 колёсах
+    горизонт ~34 года). Таймер кладётся в слот за O(1) и отменяется
+    за O(1); когда время доходит до слота крупного колеса, его таймеры
+    раскладываются по мелким колёсам. Ключ таймера уникален - повторная
+    постановка с тем же ключом переносит таймер. group объединяет
+    таймеры (например, все таймеры заказа) для отмены разом.
+    """
+
+    def __init__(self, resolution: float = 1.0, levels: int = 5, now: Optional[float] = None):
+        self.resolution = resolution
+        self.levels = levels
+        self._wheels: List[List[Dict[str, Timer]]] = [[{} for _ in range(SLOTS)] for _ in range(levels)]
+        self._timers: Dict[str, Timer] = {}
+        self._groups: Dict[str, Dict[str, Timer]] = {}
+        self._ready: List[Timer] = []
+        self._tick = self._to_tick(time.time() if now is None else now)
+
+    def _to_tick(self, moment: float) -> int:
+        return int(moment // self.resolution)
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._timers
+
+    def get(self, key: str) -> Optional[Timer]:
+        return self._timers.get(key)
+
+    def timers(self) -> Iterator[Timer]:
+        return iter(self._timers.values())
+
+    def group(self, group: str) -> List[Timer]:
+        return list(self._groups.get(group, {}).values())
+
+    def schedule(self, key: str, due: float, kind: str,
+                 data: Optional[dict] = None, group: Optional[str] = None) -> Timer:
+        """Поставить (или перенести) таймер на момент due (unix-время)"""
+        self.cancel(key)
+        timer = Timer(key, due, kind, data, group)
+        timer.tick = self._to_tick(due)
+        self._timers[key] = timer
+        if group is not None:
+            self._groups.setdefault(group, {})[key] = timer
+        self._place(timer)
+        return timer
+
+    def _place(self, timer: Timer) -> None:
+        delta = timer.tick - self._tick
+        if delta <= 0:
+            timer.level = -1
+            self._ready.append(timer)
+            return
+        level = 0
+        while level < self.levels - 1 and delta >= 1 << (SLOT_BITS * (level + 1)):
+            level += 1
+        timer.level = level
+        timer.slot = (timer.tick >> (SLOT_BITS * level)) & SLOT_MASK
+        self._wheels[level][timer.slot][timer.key] = timer
+
+    def cancel(self, key: str) -> bool:
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        if timer.level >= 0:
+            del self._wheels[timer.level][timer.slot][key]
+        # Таймер из списка готовых пропускается при выдаче (его нет в _timers)
+        if timer.group is not None:
+            group = self._groups[timer.group]
+            del group[key]
+            if not group:
+                del self._groups[timer.group]
+        return True
+
+    def cancel_group(self, group: str) -> int:
+        keys = list(self._groups.get(group, ()))
+        for key in keys:
+            self.cancel(key)
+        return len(keys)
+
+    def advance(self, now: Optional[float] = None) -> List[Timer]:
+        """Продвинуть время до now и вернуть сработавшие таймеры"""
+        target = self._to_tick(time.time() if now is None else now)
+        while self._tick < target:
+            self._tick += 1
+            # Сначала раскладываем крупные колёса: их таймеры могут попасть в текущий слот
+            for level in range(self.levels - 1, 0, -1):
+                if self._tick & ((1 << (SLOT_BITS * level)) - 1):
+                    continue
+                index = (self._tick >> (SLOT_BITS * level)) & SLOT_MASK
+                slot, self._wheels[level][index] = self._wheels[level][index], {}
+                for timer in slot.values():
+                    self._place(timer)
+            index = self._tick & SLOT_MASK
+            slot, self._wheels[0][index] = self._wheels[0][index], {}
+            for timer in slot.values():
+                timer.level = -1
+                self._ready.append(timer)
+
+        fired = []
+        ready, self._ready = self._ready, []
+        for timer in ready:
+            if self._timers.get(timer.key) is timer:
+                self.cancel(timer.key)
+                fired.append(timer)
+        return fired
+
+
+class Scheduler:
+    """
+    Фоновый запуск таймеров колеса
+    handlers: вид таймера -> async функция(timer). Ошибка обработчика
+    логируется и не останавливает остальные таймеры.
+    on_fired(timer) вызывается после обработки - например, чтобы
+    отметить срабатывание в журнале.
+    """
+
+    def __init__(self, wheel: TimerWheel,
+                 handlers: Optional[Dict[str, Callable[[Timer], Awaitable[Any]]]] = None,
+                 on_fired: Optional[Callable[[Timer], Any]] = None):
+        self.wheel = wheel
+        self.handlers = handlers or {}
+        self.on_fired = on_fired
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            for timer in self.wheel.advance():
+                await self._fire(timer)
+            # Спим до начала следующего шага колеса
+            resolution = self.wheel.resolution
+            await asyncio.sleep(resolution - time.time() % resolution)
+
+    async def _fire(self, timer: Timer) -> None:
+        handler = self.handlers.get(timer.kind)
+        if handler is None:
+            logger.warning(f"⚠️ Нет обработчика таймера {timer.kind} ({timer.key})")
+        else:
+            try:
+                await handler(timer)
+            except Exception as e:
+                logger.error(f"❌ Ошибка таймера {timer.key}: {e}")
+        if self.on_fired:
+            self.on_fired(timer)
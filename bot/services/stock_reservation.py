@@ -0,0 +1,253 @@
+import heapq
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class _ShardedStock:
+    """
+    Остаток одного товара, разбитый на шарды
+    Каждый шард со своей блокировкой, поэтому одновременные резервы
+    одного популярного товара не выстраиваются в очередь за одним локом.
+    """
+
+    def __init__(self, quantity: int, shards: int):
+        self.counts = [quantity // shards] * shards
+        for i in range(quantity % shards):
+            self.counts[i] += 1
+        self.locks = [threading.Lock() for _ in range(shards)]
+
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def take(self, quantity: int, start: int) -> bool:
+        """Списать quantity единиц, начиная с шарда start. Всё или ничего"""
+        taken: List[Tuple[int, int]] = []
+        need = quantity
+        shards = len(self.counts)
+
+        for step in range(shards):
+            index = (start + step) % shards
+            with self.locks[index]:
+                portion = min(self.counts[index], need)
+                self.counts[index] -= portion
+            if portion:
+                taken.append((index, portion))
+                need -= portion
+            if not need:
+                return True
+
+        # Не хватило - возвращаем то, что успели взять
+        for index, portion in taken:
+            self.put(portion, index)
+        return False
+
+    def put(self, quantity: int, index: int) -> None:
+        with self.locks[index]:
+            self.counts[index] += quantity
+
+
+class StockReservations:
+    """
+    Резервирование остатков под корзины
+    Товар списывается из остатка в момент добавления в корзину и держится
+    за пользователем ttl секунд с последнего изменения корзины.
+    commit() превращает резерв в продажу, release() и истечение ttl
+    возвращают товар в остаток.
+    Шарды товара создаются при первом резерве: начальный остаток берётся
+    из load_stock(product_id) (None - товара нет), поэтому при старте не
+    нужно обходить весь каталог.
+    """
+
+    def __init__(self, ttl: float = 900, shards: int = 8,
+                 on_change: Optional[Callable[[int, int], None]] = None,
+                 load_stock: Optional[Callable[[int], Optional[int]]] = None):
+        self.ttl = ttl
+        self.shards = shards
+        # Вызывается как on_change(product_id, свободный остаток) после каждого изменения остатка
+        self.on_change = on_change
+        self.load_stock = load_stock
+        self._stock: Dict[int, _ShardedStock] = {}
+        self._stock_lock = threading.Lock()
+        # user_id -> {product_id: quantity}
+        self._reservations: Dict[int, Dict[int, int]] = {}
+        self._deadlines: Dict[int, float] = {}
+        self._expiry_heap: List[Tuple[float, int]] = []
+        self._user_locks = [threading.Lock() for _ in range(shards)]
+        self._expiry_lock = threading.Lock()
+
+    def set_stock(self, product_id: int, quantity: int) -> None:
+        """Задать свободный остаток товара (без учёта текущих резервов)"""
+        with self._stock_lock:
+            self._stock[product_id] = _ShardedStock(quantity, self.shards)
+
+    def _sharded(self, product_id: int) -> Optional[_ShardedStock]:
+        stock = self._stock.get(product_id)
+        if stock is None and self.load_stock is not None:
+            with self._stock_lock:
+                stock = self._stock.get(product_id)
+                if stock is None:
+                    quantity = self.load_stock(product_id)
+                    if quantity is not None:
+                        stock = self._stock[product_id] = _ShardedStock(quantity, self.shards)
+        return stock
+
+    def available(self, product_id: int) -> int:
+        stock = self._stock.get(product_id)
+        if stock is not None:
+            return stock.total()
+        # Резервов по товару ещё не было - шарды не нужны
+        quantity = self.load_stock(product_id) if self.load_stock is not None else None
+        return quantity or 0
+
+    def _notify(self, product_id: int) -> None:
+        if self.on_change:
+            self.on_change(product_id, self.available(product_id))
+
+    def reserved(self, user_id: int) -> Dict[int, int]:
+        with self._user_lock(user_id):
+            return dict(self._reservations.get(user_id, {}))
+
+    def _user_lock(self, user_id: int) -> threading.Lock:
+        return self._user_locks[user_id % self.shards]
+
+    def _touch(self, user_id: int) -> None:
+        deadline = time.monotonic() + self.ttl
+        self._deadlines[user_id] = deadline
+        with self._expiry_lock:
+            heapq.heappush(self._expiry_heap, (deadline, user_id))
+
+    def reserve(self, user_id: int, product_id: int, quantity: int = 1) -> bool:
+        """Зарезервировать товар за пользователем. False - товара нет в наличии"""
+        stock = self._sharded(product_id)
+        if stock is None or not stock.take(quantity, user_id % self.shards):
+            return False
+        self._notify(product_id)
+
+        with self._user_lock(user_id):
+            cart = self._reservations.setdefault(user_id, {})
+            cart[product_id] = cart.get(product_id, 0) + quantity
+            self._touch(user_id)
+        return True
+
+    def reserve_cart(self, user_id: int, cart: Dict[int, int], atomic: bool = False) -> List[int]:
+        """
+        Довести резервы до количеств в корзине (например, после истечения ttl)
+        Возвращает товары, которых не хватило. atomic - если хватило не всего,
+        взятое этим вызовом возвращается в остаток (резервы до вызова остаются)
+        """
+        held = self.reserved(user_id)
+        unavailable = []
+        taken: Dict[int, int] = {}
+        for product_id, quantity in cart.items():
+            missing = quantity - held.get(product_id, 0)
+            if missing <= 0:
+                continue
+            if self.reserve(user_id, product_id, missing):
+                taken[product_id] = missing
+            else:
+                unavailable.append(product_id)
+        if atomic and unavailable:
+            for product_id, quantity in taken.items():
+                self.release(user_id, product_id, quantity)
+        return unavailable
+
+    def release(self, user_id: int, product_id: Optional[int] = None,
+                quantity: Optional[int] = None) -> Dict[int, int]:
+        """Вернуть резерв пользователя в остаток (весь, по одному товару или quantity единиц товара)"""
+        with self._user_lock(user_id):
+            cart = self._reservations.get(user_id)
+            if not cart:
+                return {}
+            if product_id is None:
+                released = self._reservations.pop(user_id)
+                self._deadlines.pop(user_id, None)
+            elif product_id not in cart:
+                released = {}
+            elif quantity is not None and quantity < cart[product_id]:
+                cart[product_id] -= quantity
+                released = {product_id: quantity}
+            else:
+                released = {product_id: cart.pop(product_id)}
+                if not cart:
+                    del self._reservations[user_id]
+                    self._deadlines.pop(user_id, None)
+
+        for released_id, quantity in released.items():
+            stock = self._sharded(released_id)
+            if stock:
+                stock.put(quantity, user_id % self.shards)
+                self._notify(released_id)
+        return released
+
+    def restock(self, product_id: int, quantity: int) -> None:
+        """Вернуть проданный товар в остаток (например, заказ отменён)"""
+        stock = self._sharded(product_id)
+        if stock:
+            stock.put(quantity, product_id % self.shards)
+            self._notify(product_id)
+
+    def commit(self, user_id: int) -> Dict[int, int]:
+        """Оформить резерв как продажу - товар больше не вернётся в остаток"""
+        with self._user_lock(user_id):
+            self._deadlines.pop(user_id, None)
+            return self._reservations.pop(user_id, {})
+
+    def expire(self) -> List[Tuple[int, Dict[int, int]]]:
+        """Освободить просроченные резервы. Возвращает [(user_id, {product_id: quantity})]"""
+        now = time.monotonic()
+        expired = []
+        while True:
+            with self._expiry_lock:
+                if not self._expiry_heap or self._expiry_heap[0][0] > now:
+                    break
+                deadline, user_id = heapq.heappop(self._expiry_heap)
+
+            # В куче могут лежать устаревшие дедлайны - сверяемся с актуальным
+            with self._user_lock(user_id):
+                if self._deadlines.get(user_id) != deadline:
+                    continue
+                del self._deadlines[user_id]
+                released = self._reservations.pop(user_id, {})
+
+            for product_id, quantity in released.items():
+                stock = self._sharded(product_id)
+                if stock:
+                    stock.put(quantity, user_id % self.shards)
+                    self._notify(product_id)
+            if released:
+                expired.append((user_id, released))
+        return expired
+
+
+if __name__ == "__main__":
+    # Бенчмарк: конкурентные резервы одного товара
+    from concurrent.futures import ThreadPoolExecutor
+
+    STOCK = 5000
+    ATTEMPTS = 50000
+    WORKERS = 16
+
+    reservations = StockReservations()
+    reservations.set_stock(1, STOCK)
+
+    def worker(offset: int) -> int:
+        success = 0
+        for user_id in range(offset, ATTEMPTS, WORKERS):
+            if reservations.reserve(user_id, 1):
+                if user_id % 3 == 0:
+                    reservations.release(user_id)
+                else:
+                    reservations.commit(user_id)
+                    success += 1
+        return success
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        sold = sum(pool.map(worker, range(WORKERS)))
+    elapsed = time.perf_counter() - started
+
+    print(f"Попыток: {ATTEMPTS}, потоков: {WORKERS}")
+    print(f"Продано: {sold} из {STOCK}, остаток: {reservations.available(1)}")
+    print(f"Скорость: {ATTEMPTS / elapsed:,.0f} резервов/с")
+    assert sold + reservations.available(1) == STOCK, "перепродажа!"
@@ -0,0 +1,281 @@
+import logging
+import os
+import re
+import struct
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from services.bitmap import RoaringBitmap
+
+logger = logging.getLogger(__name__)
+
+MAGIC_V1 = b"SUBS1"
+# Версия 2: после сигнатуры - номер последнего изменения, вошедшего в файл
+MAGIC = b"SUBS2"
+_VERSION = struct.Struct("<Q")
+_SEGMENT = struct.Struct("<HI")
+
+SUBSCRIBED = "subscribed"
+ORDERED_PREFIX = "ordered:"
+# ordered:30d - заказывали за последние 30 дней
+_ORDERED_WITHIN = re.compile(r"^ordered:(\d+)d$")
+_TOKEN = re.compile(r"[()]|[^\s()]+")
+_OPERATORS = ("&", "|", "-")
+
+
+class SubscriberRegistry:
+    """
+    Подписчики и сегменты пользователей на сжатых битовых картах
+    Каждый сегмент - RoaringBitmap из user_id:
+        subscribed - подписаны на акции
+        bought:<категория> - покупали товар категории
+        delivery:pickup / delivery:courier - способ получения
+        quiz:<ответ> - ответ в тесте подбора
+        ordered:<ГГГГ-ММ-ДД> - заказывали в этот день
+    Аудитории задаются выражениями над сегментами:
+        "subscribed & bought:mountain - ordered:30d"
+    (& - пересечение, | - объединение, - - разность; операторы отделяются
+    пробелами, потому что "-" встречается в датах; скобки группируют)
+    Файл пишется периодически, а каждое изменение нумеруется и уходит в
+    on_change (журнал состояния). Изменения новее файла проигрываются
+    из журнала через apply_change, поэтому падение их не теряет.
+    """
+
+    def __init__(self, path: str, order_days: int = 90):
+        self.path = path
+        self.order_days = order_days
+        self.segments: Dict[str, RoaringBitmap] = {}
+        # Номер последнего изменения; растёт монотонно и между перезапусками
+        self.version = 0
+        self.saved_version = 0
+        # Вызывается с каждым изменением {version, segment, user_id, added} - для журнала
+        self.on_change: Optional[Callable[[Dict[str, Any]], Any]] = None
+        # Изменения, которых ещё нет в файле (попадают в снимок журнала)
+        self._unsaved: List[Dict[str, Any]] = []
+
+    @property
+    def dirty(self) -> bool:
+        return self.version != self.saved_version
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = memoryview(f.read())
+        magic = bytes(data[:len(MAGIC)])
+        if magic == MAGIC:
+            self.version, = _VERSION.unpack_from(data, len(MAGIC))
+            offset = len(MAGIC) + _VERSION.size
+        elif magic == MAGIC_V1:
+            offset = len(MAGIC_V1)
+        else:
+            raise ValueError(f"Неизвестный формат файла подписчиков {self.path}")
+        self.saved_version = self.version
+
+        while offset < len(data):
+            name_size, blob_size = _SEGMENT.unpack_from(data, offset)
+            offset += _SEGMENT.size
+            name = bytes(data[offset:offset + name_size]).decode("utf-8")
+            offset += name_size
+            self.segments[name] = RoaringBitmap.from_bytes(data[offset:offset + blob_size])
+            offset += blob_size
+        logger.info(f"🔔 Загружено сегментов: {len(self.segments)}, подписчиков: {len(self.segment(SUBSCRIBED))}")
+
+    def snapshot(self) -> Tuple[int, Dict[str, RoaringBitmap]]:
+        """Копия сегментов для записи в другом потоке (снимается в цикле событий)"""
+        return self.version, {name: bitmap.copy() for name, bitmap in self.segments.items()}
+
+    def write(self, snapshot: Tuple[int, Dict[str, RoaringBitmap]]) -> None:
+        """Записать снимок в файл; живые сегменты не читаются - можно из потока"""
+        version, segments = snapshot
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        parts = [MAGIC, _VERSION.pack(version)]
+        for name, bitmap in sorted(segments.items()):
+            encoded_name = name.encode("utf-8")
+            blob = bitmap.to_bytes()
+            parts.append(_SEGMENT.pack(len(encoded_name), len(blob)))
+            parts.append(encoded_name)
+            parts.append(blob)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(parts))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def mark_saved(self, version: int) -> None:
+        """Файл содержит изменения по version включительно"""
+        self.saved_version = max(self.saved_version, version)
+        self._unsaved = [change for change in self._unsaved if change["version"] > version]
+
+    def save(self) -> None:
+        snapshot = self.snapshot()
+        self.write(snapshot)
+        self.mark_saved(snapshot[0])
+
+    def unsaved(self) -> List[Dict[str, Any]]:
+        """Изменения после последней записи файла"""
+        return list(self._unsaved)
+
+    def segment(self, name: str) -> RoaringBitmap:
+        return self.segments.get(name) or RoaringBitmap()
+
+    def _set(self, name: str, user_id: int, added: bool) -> bool:
+        bitmap = self.segments.get(name)
+        if added:
+            if bitmap is None:
+                bitmap = self.segments[name] = RoaringBitmap()
+            if user_id in bitmap:
+                return False
+            bitmap.add(user_id)
+        else:
+            if bitmap is None or user_id not in bitmap:
+                return False
+            bitmap.discard(user_id)
+            if not bitmap:
+                del self.segments[name]
+        return True
+
+    def _change(self, name: str, user_id: int, added: bool) -> None:
+        # Сначала журнал (on_change), потом память: без записи в журнал сегмент не меняется
+        change = {"version": self.version + 1, "segment": name, "user_id": user_id, "added": added}
+        if self.on_change is not None:
+            self.on_change(change)
+        self._set(name, user_id, added)
+        self.version = change["version"]
+        self._unsaved.append(change)
+
+    def add(self, name: str, user_id: int) -> None:
+        bitmap = self.segments.get(name)
+        if bitmap is None or user_id not in bitmap:
+            self._change(name, user_id, True)
+
+    def discard(self, name: str, user_id: int) -> None:
+        bitmap = self.segments.get(name)
+        if bitmap is not None and user_id in bitmap:
+            self._change(name, user_id, False)
+
+    def apply_change(self, change: Dict[str, Any]) -> None:
+        """Проиграть изменение из журнала (уже попавшие в файл пропускаются)"""
+        if change["version"] <= self.version:
+            return
+        self._set(change["segment"], change["user_id"], change["added"])
+        self.version = change["version"]
+        self._unsaved.append(change)
+
+    def subscribe(self, user_id: int) -> None:
+        self.add(SUBSCRIBED, user_id)
+
+    def unsubscribe(self, user_id: int) -> None:
+        self.discard(SUBSCRIBED, user_id)
+
+    def is_subscribed(self, user_id: int) -> bool:
+        return user_id in self.segment(SUBSCRIBED)
+
+    def record_order(self, user_id: int, created_ts: float,
+                     categories: Iterable[str], delivery: str) -> None:
+        """Отметить заказ пользователя в сегментах"""
+        self.add(f"{ORDERED_PREFIX}{datetime.fromtimestamp(created_ts):%Y-%m-%d}", user_id)
+        for category in categories:
+            self.add(f"bought:{category}", user_id)
+        self.add(f"delivery:{delivery}", user_id)
+
+    def ordered_within(self, days: int, now: Optional[float] = None) -> RoaringBitmap:
+        """Заказывали за последние days дней (включая сегодня)"""
+        today = datetime.fromtimestamp(now or time.time()).date()
+        result = RoaringBitmap()
+        for offset in range(days):
+            bitmap = self.segments.get(f"{ORDERED_PREFIX}{today - timedelta(days=offset):%Y-%m-%d}")
+            if bitmap:
+                result = result | bitmap
+        return result
+
+    def prune(self, now: Optional[float] = None) -> None:
+        """Удалить дневные сегменты заказов старше order_days"""
+        oldest = f"{ORDERED_PREFIX}{datetime.fromtimestamp(now or time.time()).date() - timedelta(days=self.order_days):%Y-%m-%d}"
+        stale = [name for name in self.segments if name.startswith(ORDERED_PREFIX) and name < oldest]
+        for name in stale:
+            del self.segments[name]
+        if stale:
+            # Не журналируется: после перезапуска сегменты отсекутся снова
+            self.version += 1
+
+    def select(self, expression: str) -> RoaringBitmap:
+        """
+        Вычислить аудиторию по выражению над сегментами
+        Результат всегда новая битовая карта: выражение из одного сегмента
+        не должно отдавать сам сегмент, который меняют подписки и отписки
+        """
+        tokens = _TOKEN.findall(expression)
+        result, position = self._parse(tokens, 0)
+        if position != len(tokens):
+            raise ValueError(f"Лишний токен {tokens[position]!r} в выражении {expression!r}")
+        if any(result is bitmap for bitmap in self.segments.values()):
+            result = result.copy()
+        return result
+
+    def _parse(self, tokens, position: int):
+        # Операторы равноправны и применяются слева направо, скобки группируют
+        result, position = self._operand(tokens, position)
+        while position < len(tokens) and tokens[position] in _OPERATORS:
+            operator = tokens[position]
+            operand, position = self._operand(tokens, position + 1)
+            if operator == "&":
+                result = result & operand
+            elif operator == "|":
+                result = result | operand
+            else:
+                result = result - operand
+        return result, position
+
+    def _operand(self, tokens, position: int):
+        if position >= len(tokens):
+            raise ValueError("Выражение обрывается")
+        token = tokens[position]
+        if token == "(":
+            result, position = self._parse(tokens, position + 1)
+            if position >= len(tokens) or tokens[position] != ")":
+                raise ValueError("Не закрыта скобка")
+            return result, position + 1
+        if token in _OPERATORS or token == ")" or any(operator in token for operator in "&|"):
+            raise ValueError(f"Ожидался сегмент, а не {token!r}")
+        within = _ORDERED_WITHIN.match(token)
+        if within:
+            return self.ordered_within(int(within.group(1))), position + 1
+        return self.segment(token), position + 1
+
+    def stats(self) -> Dict[str, int]:
+        return {name: len(bitmap) for name, bitmap in sorted(self.segments.items())}
+
+
+class SegmentAudience:
+    """
+    Аудитория рассылки по выражению над сегментами
+    Множество получателей - снимок на момент первого обращения, чтобы
+    подписки и отписки во время рассылки не сдвигали её обход.
+    Заблокировавшие бота отписываются в реестре и запоминаются в blocked,
+    снимок при этом не меняется.
+    """
+
+    def __init__(self, registry: SubscriberRegistry, expression: str):
+        self.registry = registry
+        self.expression = expression
+        self._members: Optional[RoaringBitmap] = None
+        self.blocked: Set[int] = set()
+
+    def members(self) -> RoaringBitmap:
+        if self._members is None:
+            self._members = self.registry.select(self.expression)
+        return self._members
+
+    def iter_from(self, after_user_id: Optional[int] = None) -> Iterator[int]:
+        return self.members().iter_from(after_user_id)
+
+    def discard(self, user_id: int) -> None:
+        self.blocked.add(user_id)
+        self.registry.unsubscribe(user_id)
+
+    def __len__(self) -> int:
+        return len(self.members())
@@ -1,4 +1,3 @@
-from sqlmodel import Session, select
 from uuid import uuid4, UUID
 from datetime import datetime
 from typing import List, Optional, Dict, Any
@@ -0,0 +1,72 @@
+import struct
+import sys
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+# Срок жизни записи: целые секунды unix-времени в первых 4 байтах записи
+DEADLINE = struct.Struct("<I")
+
+
+class TTLStore:
+    """
+    Компактное хранилище записей bytes со сроком жизни
+    Срок хранится в самой записи (4 байта), поэтому запись - один объект
+    bytes без обёрток. Записи упорядочены по последнему обновлению: самые
+    старые в начале, и истёкшие снимаются с начала за O(1) на запись.
+    При превышении max_entries вытесняются самые давно обновлённые.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, clock: Callable[[], float] = time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """Запись без срока (None - нет или истекла)"""
+        record = self._entries.get(key)
+        if record is None:
+            return None
+        if DEADLINE.unpack_from(record)[0] <= self.clock():
+            del self._entries[key]
+            self.expired += 1
+            return None
+        return record[DEADLINE.size:]
+
+    def set(self, key: Hashable, payload: bytes) -> None:
+        """Сохранить запись и продлить её срок"""
+        self._entries[key] = DEADLINE.pack(int(self.clock() + self.ttl) + 1) + payload
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    def pop(self, key: Hashable) -> Optional[bytes]:
+        record = self._entries.pop(key, None)
+        return record[DEADLINE.size:] if record is not None else None
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Удалить истёкшие записи. Возвращает их количество"""
+        now = self.clock() if now is None else now
+        count = 0
+        while self._entries:
+            key, record = next(iter(self._entries.items()))
+            if DEADLINE.unpack_from(record)[0] > now:
+                break
+            del self._entries[key]
+            count += 1
+        self.expired += count
+        return count
+
+    def memory_size(self) -> int:
+        """Память записей (без учёта самого словаря)"""
+        return sum(sys.getsizeof(record) for record in self._entries.values())
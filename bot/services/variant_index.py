@@ -0,0 +1,129 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+Row = Tuple[int, Optional[int], object, int, str]
+
+
+class FamilyAggregate:
+    """Сводка по семейству вариантов товара"""
+
+    __slots__ = ("min_price", "total_stock", "members")
+
+    def __init__(self, members: List[int]):
+        self.members = members
+        self.min_price = None
+        self.total_stock = 0
+
+
+class VariantIndex:
+    """
+    Индекс вариантов товаров (размеры рамы, цвета) по parent_product_id
+    Замыкание строится один раз: корень -> все варианты, вариант -> корень.
+    Минимальная цена, общий остаток и доступные размеры семейства
+    обновляются точечно при изменении цены или остатка одного варианта.
+    Индекс, созданный через lazy(), строится при первом обращении.
+    """
+
+    def __init__(self):
+        self._root_of: Dict[int, int] = {}
+        self._families: Dict[int, FamilyAggregate] = {}
+        self._labels: Dict[int, str] = {}
+        self._prices: Dict[int, object] = {}
+        self._stock: Dict[int, int] = {}
+        self._pending_rows: Optional[Callable[[], Iterable[Row]]] = None
+
+    @classmethod
+    def build(cls, rows: Iterable[Row]) -> "VariantIndex":
+        """rows: (id, parent_id, price, in_stock, метка варианта)"""
+        index = cls()
+        index._fill(rows)
+        return index
+
+    @classmethod
+    def lazy(cls, rows: Callable[[], Iterable[Row]]) -> "VariantIndex":
+        """Индекс, который строится из rows() при первом обращении"""
+        index = cls()
+        index._pending_rows = rows
+        return index
+
+    def _load(self) -> None:
+        if self._pending_rows is not None:
+            rows, self._pending_rows = self._pending_rows, None
+            self._fill(rows())
+
+    def _fill(self, rows: Iterable[Row]) -> None:
+        parents: Dict[int, Optional[int]] = {}
+        for product_id, parent_id, price, in_stock, label in rows:
+            parents[product_id] = parent_id
+            self._prices[product_id] = price
+            self._stock[product_id] = in_stock
+            self._labels[product_id] = label
+
+        # Корни ищем с запоминанием, чтобы многоуровневые цепочки проходились один раз
+        for product_id in parents:
+            path = []
+            current = product_id
+            while current not in self._root_of:
+                parent_id = parents.get(current)
+                if parent_id is None or parent_id not in parents or parent_id in path:
+                    self._root_of[current] = current
+                    break
+                path.append(current)
+                current = parent_id
+            root = self._root_of[current]
+            for node in path:
+                self._root_of[node] = root
+
+        members: Dict[int, List[int]] = {}
+        for product_id in parents:
+            members.setdefault(self._root_of[product_id], []).append(product_id)
+
+        for root, family in members.items():
+            family.sort(key=lambda product_id: (product_id != root, product_id))
+            aggregate = FamilyAggregate(family)
+            aggregate.min_price = min(self._prices[product_id] for product_id in family)
+            aggregate.total_stock = sum(self._stock[product_id] for product_id in family)
+            for product_id in family:
+                self._families[product_id] = aggregate
+
+    def root(self, product_id: int) -> int:
+        self._load()
+        return self._root_of.get(product_id, product_id)
+
+    def family(self, product_id: int) -> Optional[FamilyAggregate]:
+        """Семейство товара; None - у товара нет вариантов"""
+        self._load()
+        aggregate = self._families.get(product_id)
+        if aggregate is None or len(aggregate.members) < 2:
+            return None
+        return aggregate
+
+    def variants(self, product_id: int) -> List[Tuple[int, str, int]]:
+        """Варианты семейства для выбора: [(id, метка, остаток)]"""
+        aggregate = self.family(product_id)
+        if aggregate is None:
+            return []
+        return [(member, self._labels[member], self._stock[member]) for member in aggregate.members]
+
+    def available_labels(self, product_id: int) -> List[str]:
+        return [label for _, label, in_stock in self.variants(product_id) if in_stock > 0]
+
+    def update_stock(self, product_id: int, in_stock: int) -> None:
+        self._load()
+        aggregate = self._families.get(product_id)
+        if aggregate is None:
+            return
+        aggregate.total_stock += in_stock - self._stock[product_id]
+        self._stock[product_id] = in_stock
+
+    def update_price(self, product_id: int, price) -> None:
+        self._load()
+        aggregate = self._families.get(product_id)
+        if aggregate is None:
+            return
+        old_price = self._prices[product_id]
+        self._prices[product_id] = price
+        if price <= aggregate.min_price:
+            aggregate.min_price = price
+        elif old_price == aggregate.min_price:
+            # Подорожал самый дешёвый вариант - пересчитываем только его семейство
+            aggregate.min_price = min(self._prices[member] for member in aggregate.members)
@@ -1,6 +1,8 @@
+import asyncio
 import logging
+import os
 from aiogram import Bot, Dispatcher, Router, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
 from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -8,76 +10,104 @@ from typing import Dict, List
 
 from config import config
 from ticket_service import APITicketService
-from order_system import router as order_router 
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from order_system import (
+    router as order_router, callbacks as order_callbacks, stock_listeners, price_listeners, change_prices,
+    PROMOTIONS, broadcasts, notify_user_about_promotion, subscribers, stock_reservations
 )
+from catalog import CATEGORIES, format_price, get_product, get_category_products, get_neighbours, variant_index, feature_columns
+from services.media_registry import MediaRegistry
+from services.prefetch import Prefetcher, PrefetchMiddleware
+from services.quiz_engine import QuizEngine
+from services.callback_data import CallbackRouter
+from services.callback_schemas import codec, SUPPORT_REPLY, SUPPORT_RESOLVE, ADD_TO_CART, CART_QUANTITY, ORDERS_MORE
+from services.quiz_sessions import QuizSession, QuizSessionStore
+from services.quiz_funnel import QuizFunnel
+from services.recommender import Recommender
+from services.metrics import metrics, MetricsServer, TelegramMetrics
+from services.log_pipeline import LogPipeline, parse_pairs
+from services.profiler import HandlerProfiler
+from services.flood_control import FloodControl, FloodControlMiddleware, FloodLimit, MERGE
+
 logger = logging.getLogger(__name__)
 
+# Логирование через очередь и фоновый поток (запускается в __main__)
+log_pipeline = LogPipeline(
+    level=config.LOG_LEVEL,
+    fmt=config.LOG_FORMAT,
+    levels=parse_pairs(config.LOG_LEVELS),
+    sample={name: int(rate) for name, rate in parse_pairs(config.LOG_SAMPLE).items()},
+)
+
 # Инициализация API сервиса
 ticket_service = APITicketService(
     api_base_url=config.API_URL,
     api_token=config.API_TOKEN
 )
 
+# Реестр загруженных фото товаров
+media_registry = MediaRegistry(os.path.join(config.DATA_DIR, "media_registry.json"))
+
+# Упреждающий рендер экранов каталога
+prefetcher = Prefetcher(memory_budget=2_000_000, top_k=3)
+
 # Роутер
 router = Router()
+router.callback_query.outer_middleware(PrefetchMiddleware(prefetcher))
+# Все callback_query роутера - через префиксное дерево (один обработчик на роутере)
+callbacks = CallbackRouter(codec)
+callbacks.attach(router)
 
 # ID администраторов/поддержки
 SUPPORT_IDS = [680614471]
 ADMIN_CHAT_ID = 680614471
 
+# Ограничение частоты по классам обработчиков (флаг flood); администраторы без ограничений
+flood_control = FloodControl({
+    "default": FloodLimit(rate=5, burst=10),
+    "cart": FloodLimit(rate=2, burst=5),
+    # Обновления экранов: лишние нажатия схлопываются в последнее
+    "refresh": FloodLimit(rate=1, burst=2, mode=MERGE),
+    # Каждое сообщение в поддержку - запросы к API тикетов
+    "support": FloodLimit(rate=0.1, burst=3),
+}, default="default", exempt=SUPPORT_IDS)
+
 # Состояния для FSM
 class SupportStates(StatesGroup):
     awaiting_support_message = State()
     replying_to_user = State()
 
-# Структура тестов
-TESTS = [
-    {
-        "id": 1,
-        "name": "bike_type_selection",
-        "title": "🚴 Подбор идеального велосипеда",
-        "questions": [
-            {
-                "id": 1,
-                "text": "Для каких целей планируете использовать велосипед?",
-                "answers": [
-                    {"id": 1, "key": "city", "value": 1, "text": "🏙️ Городские поездки"},
-                    {"id": 2, "key": "sport", "value": 2, "text": "🏁 Спорт и тренировки"},
-                    {"id": 3, "key": "tourism", "value": 3, "text": "🗺️ Туризм и походы"},
-                    {"id": 4, "key": "offroad", "value": 4, "text": "🏔️ Бездорожье и горы"}
-                ]
-            },
-            {
-                "id": 2,
-                "text": "Какой у вас уровень подготовки?",
-                "answers": [
-                    {"id": 5, "key": "beginner", "value": 1, "text": "🟢 Начинающий"},
-                    {"id": 6, "key": "intermediate", "value": 2, "text": "🟡 Продолжающий"},
-                    {"id": 7, "key": "pro", "value": 3, "text": "🔴 Профессионал"}
-                ]
-            },
-            {
-                "id": 3,
-                "text": "Какой бюджет рассматриваете?",
-                "answers": [
-                    {"id": 8, "key": "budget", "value": 1, "text": "💰 До 20,000₽"},
-                    {"id": 9, "key": "medium", "value": 2, "text": "💵 20,000-50,000₽"},
-                    {"id": 10, "key": "premium", "value": 3, "text": "💎 Свыше 50,000₽"}
-                ]
-            }
-        ]
-    }
-]
+# Тесты (перечитываются из файла при изменении)
+quiz_engine = QuizEngine(config.QUIZ_PATH)
+quiz_engine.load()
+
+# Воронка тестов; при перезагрузке тестов счётчики переносятся на новые номера
+quiz_funnel = QuizFunnel(os.path.join(config.DATA_DIR, "quiz_funnel.json"))
+quiz_funnel.load()
+quiz_funnel.bind(quiz_engine)
+quiz_engine.listeners.append(quiz_funnel.bind)
+
+# Подбор товаров по ответам теста (матрица строится при первом подборе)
+recommender = Recommender()
+RECOMMENDATIONS_COUNT = 3
+
+# Метрики для Prometheus (локальный /metrics)
+metrics_server = MetricsServer(metrics, config.METRICS_HOST, config.METRICS_PORT)
+
+# Профилирование обработчиков по команде /profile (вне сеанса не подключено)
+profiler = HandlerProfiler(os.path.join(config.DATA_DIR, "profiles"))
 
 # Хранилища данных
-user_progress = {}
+quiz_sessions = QuizSessionStore(ttl=3600, max_entries=100_000)
 user_support_messages = {}
 
+async def show_text_screen(callback: CallbackQuery, text: str, reply_markup: InlineKeyboardMarkup):
+    """Показ текстового экрана (сообщение с фото нельзя превратить в текст - заменяем его)"""
+    if callback.message.photo:
+        await callback.message.delete()
+        await callback.message.answer(text, reply_markup=reply_markup)
+    else:
+        await callback.message.edit_text(text, reply_markup=reply_markup)
+
 @router.message(Command("start"))
 async def start(message: Message):
     """Главное меню"""
@@ -99,7 +129,7 @@ async def start(message: Message):
         reply_markup=reply_markup
     )
 
-@router.callback_query(F.data == "about")
+@callbacks.exact("about")
 async def handle_about(callback: CallbackQuery):
     """Информация о магазине"""
     about_text = (
@@ -122,7 +152,7 @@ async def handle_about(callback: CallbackQuery):
     )
     await callback.answer()
 
-@router.callback_query(F.data == "support")
+@callbacks.exact("support")
 async def handle_support_request(callback: CallbackQuery, state: FSMContext):
     """Обработка запроса в поддержку"""
     keyboard = [
@@ -140,7 +170,7 @@ async def handle_support_request(callback: CallbackQuery, state: FSMContext):
     await state.set_state(SupportStates.awaiting_support_message)
     await callback.answer()
 
-@router.message(SupportStates.awaiting_support_message)
+@router.message(SupportStates.awaiting_support_message, flags={"flood": "support"})
 async def forward_to_support(message: Message, state: FSMContext, bot: Bot):
     """Пересылка сообщения в поддержку"""
     user = message.from_user
@@ -170,8 +200,8 @@ async def forward_to_support(message: Message, state: FSMContext, bot: Bot):
     )
     
     reply_keyboard = [
-        [InlineKeyboardButton(text="📝 Ответить", callback_data=f"reply_{user.id}")],
-        [InlineKeyboardButton(text="✅ Решено", callback_data=f"resolve_{user.id}")]
+        [InlineKeyboardButton(text="📝 Ответить", callback_data=SUPPORT_REPLY.pack(user.id))],
+        [InlineKeyboardButton(text="✅ Решено", callback_data=SUPPORT_RESOLVE.pack(user.id))]
     ]
     reply_markup = InlineKeyboardMarkup(inline_keyboard=reply_keyboard)
     
@@ -209,10 +239,11 @@ async def forward_to_support(message: Message, state: FSMContext, bot: Bot):
     
     await state.clear()
 
-@router.callback_query(F.data.startswith("reply_"))
-async def handle_support_reply(callback: CallbackQuery, state: FSMContext):
+@callbacks.packed(SUPPORT_REPLY)
+@callbacks.prefix("reply_", SUPPORT_REPLY.from_text)
+async def handle_support_reply(callback: CallbackQuery, state: FSMContext, cb):
     """Обработка ответа от поддержки"""
-    user_id = int(callback.data.split('_')[1])
+    user_id = cb.user_id
     
     user_name = "пользователь"
     if user_id in user_support_messages and user_support_messages[user_id]:
@@ -227,10 +258,11 @@ async def handle_support_reply(callback: CallbackQuery, state: FSMContext):
     await state.update_data(user_id=user_id, support_message_id=callback.message.message_id)
     await callback.answer()
 
-@router.callback_query(F.data.startswith("resolve_"))
-async def handle_resolve_support(callback: CallbackQuery):
+@callbacks.packed(SUPPORT_RESOLVE)
+@callbacks.prefix("resolve_", SUPPORT_RESOLVE.from_text)
+async def handle_resolve_support(callback: CallbackQuery, cb):
     """Пометить обращение как решенное"""
-    user_id = int(callback.data.split('_')[1])
+    user_id = cb.user_id
     
     try:
         if user_id in user_support_messages and user_support_messages[user_id]:
@@ -330,8 +362,8 @@ async def forward_user_reply_to_support(message: Message, bot: Bot):
         for support_id in SUPPORT_IDS:
             try:
                 keyboard = [
-                    [InlineKeyboardButton(text="📝 Ответить", callback_data=f"reply_{user.id}")],
-                    [InlineKeyboardButton(text="✅ Решено", callback_data=f"resolve_{user.id}")]
+                    [InlineKeyboardButton(text="📝 Ответить", callback_data=SUPPORT_REPLY.pack(user.id))],
+                    [InlineKeyboardButton(text="✅ Решено", callback_data=SUPPORT_RESOLVE.pack(user.id))]
                 ]
                 
                 await bot.send_message(
@@ -344,14 +376,14 @@ async def forward_user_reply_to_support(message: Message, bot: Bot):
         
         await message.answer("✅ Ваш ответ отправлен в поддержку!")
 
-@router.callback_query(F.data == "cancel_support")
+@callbacks.exact("cancel_support")
 async def handle_cancel_support(callback: CallbackQuery, state: FSMContext):
     """Отмена запроса в поддержку"""
     await state.clear()
     await start(callback.message)
     await callback.answer()
 
-@router.callback_query(F.data == "main_menu")
+@callbacks.exact("main_menu")
 async def handle_main_menu(callback: CallbackQuery):
     """Возврат в главное меню"""
     keyboard = [
@@ -373,20 +405,22 @@ async def handle_main_menu(callback: CallbackQuery):
     ]
     reply_markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
     
-    await callback.message.edit_text(
+    await show_text_screen(
+        callback,
         f"🚴‍♂️ Добро пожаловать в {config.SHOP_NAME}!\n\n"
         "Выберите опцию:",
         reply_markup=reply_markup
     )
     await callback.answer()
 
-@router.callback_query(F.data == "cart")
-async def handle_cart(callback: CallbackQuery):
-    """Показ корзины"""
+@callbacks.exact("cart")
+async def handle_cart(callback: CallbackQuery, state: FSMContext):
+    """Показ корзины (кнопка "Отмена" ввода промокода и адреса тоже ведёт сюда)"""
     from order_system import user_carts
     
+    await state.clear()
     user_id = callback.from_user.id
-    cart = user_carts.get(user_id, {})
+    cart = user_carts.get(user_id)
     
     if not cart:
         await callback.message.edit_text(
@@ -398,23 +432,28 @@ async def handle_cart(callback: CallbackQuery):
         )
         return
     
-    products = {
-        1: {"name": "Горный велосипед X1", "price": 25000},
-        2: {"name": "Городской велосипед", "price": 18000},
-    }
-    
     cart_text = "🛒 **Ваша корзина**\n\n"
-    total = 0
-    
-    for product_id, quantity in cart.items():
-        product = products.get(product_id, {"name": f"Товар #{product_id}", "price": 0})
-        item_total = product['price'] * quantity
-        total += item_total
-        cart_text += f"• {product['name']} - {product['price']}₽ x {quantity} = {item_total}₽\n"
-    
-    cart_text += f"\n💵 **Итого: {total}₽**"
+    quantity_buttons = []
+    for product_id, quantity, price, line_total in cart.lines():
+        product = get_product(product_id)
+        name = product['name'] if product else f"Товар #{product_id}"
+        cart_text += f"• {name} - {format_price(price)}₽ x {quantity} = {format_price(line_total)}₽\n"
+        quantity_buttons.append([
+            InlineKeyboardButton(text=f"➖ {name}", callback_data=CART_QUANTITY.pack(product_id, -1)),
+            InlineKeyboardButton(text="➕", callback_data=CART_QUANTITY.pack(product_id, 1))
+        ])
     
-    keyboard = [
+    # Итоги поддерживаются корзиной - здесь только выводим
+    if cart.promo:
+        if cart.promo_error:
+            cart_text += f"\n🎁 Промокод {cart.promo}: {cart.promo_error}"
+        elif cart.discount:
+            cart_text += f"\n🎁 Промокод {cart.promo}: -{format_price(cart.discount)}₽"
+        elif cart.free_delivery:
+            cart_text += f"\n🎁 Промокод {cart.promo}: бесплатная доставка"
+    cart_text += f"\n💵 **Итого: {format_price(cart.subtotal - cart.discount)}₽**"
+    
+    keyboard = quantity_buttons + [
         [InlineKeyboardButton(text="✅ Оформить заказ", callback_data="checkout")],
         [InlineKeyboardButton(text="🎁 Ввести промокод", callback_data="promo")],
         [InlineKeyboardButton(text="🗑️ Очистить корзину", callback_data="clear_cart")],
@@ -425,19 +464,20 @@ async def handle_cart(callback: CallbackQuery):
     await callback.message.edit_text(cart_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard))
     await callback.answer()
 
-@router.callback_query(F.data == "orders")
-async def show_orders(callback: CallbackQuery):
-    """История заказов"""
+ORDERS_PAGE_SIZE = 5
+
+@callbacks.exact("orders", flags={"flood": "refresh"})
+@callbacks.packed(ORDERS_MORE, flags={"flood": "refresh"})
+async def show_orders(callback: CallbackQuery, cb=None):
+    """История заказов (постранично, от новых к старым)"""
     from order_system import user_orders
     
     user_id = callback.from_user.id
+    cursor = cb.cursor if cb else None
     
-    user_orders_list = []
-    for order_id, order in user_orders.items():
-        if order['user_id'] == user_id:
-            user_orders_list.append(order)
+    orders_page, next_cursor = user_orders.page(user_id, cursor=cursor, limit=ORDERS_PAGE_SIZE)
     
-    if not user_orders_list:
+    if not orders_page:
         await callback.message.edit_text(
             "📦 У вас пока нет заказов",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
@@ -447,10 +487,8 @@ async def show_orders(callback: CallbackQuery):
         )
         return
     
-    user_orders_list.sort(key=lambda x: x['created_at'], reverse=True)
-    
-    orders_text = "📦 **Ваши заказы**\n\n"
-    for order in user_orders_list[:5]:
+    orders_text = f"📦 **Ваши заказы** (всего: {user_orders.count_for_user(user_id)})\n\n"
+    for order in orders_page:
         status_emoji = {
             "Новый": "🆕",
             "В работе": "👨‍🍳", 
@@ -462,136 +500,116 @@ async def show_orders(callback: CallbackQuery):
         
         orders_text += f"{status_emoji} Заказ #{order['id']}\n"
         orders_text += f"📅 {order['created_at']}\n"
-        orders_text += f"💵 {order['total']}₽\n"
+        orders_text += f"💵 {format_price(order['total'])}₽\n"
         orders_text += f"📊 Статус: {order['status']}\n\n"
     
-    keyboard = [
+    keyboard = []
+    if next_cursor:
+        keyboard.append([InlineKeyboardButton(text="⬇️ Ещё заказы", callback_data=ORDERS_MORE.pack(next_cursor))])
+    keyboard.extend([
         [InlineKeyboardButton(text="🛒 Новый заказ", callback_data="catalog")],
         [InlineKeyboardButton(text="📋 Главное меню", callback_data="main_menu")]
-    ]
+    ])
     
     await callback.message.edit_text(orders_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard))
     await callback.answer()
 
-@router.callback_query(F.data.startswith("test_"))
-async def handle_test_selection(callback: CallbackQuery):
+@callbacks.prefix("test_", int)
+async def handle_test_selection(callback: CallbackQuery, state: FSMContext, cb: int):
     """Обработка выбора теста"""
-    test_id = int(callback.data.split('_')[1])
+    test_id = cb
     user_id = callback.from_user.id
     
-    test = next((t for t in TESTS if t['id'] == test_id), None)
-    if not test:
+    quiz = quiz_engine.quiz(test_id)
+    if not quiz:
         await callback.message.edit_text("Тест не найден")
         return
     
-    user_progress[user_id] = {
-        'test_id': test_id,
-        'current_question': 0,
-        'answers': {},
-        'test_data': test
-    }
+    session = QuizSession(test_id)
+    await quiz_sessions.save(user_id, session, state)
+    quiz_funnel.start(quiz)
     
-    await show_question(callback)
+    await show_question(callback, session, state)
     await callback.answer()
 
-async def show_question(callback: CallbackQuery):
+async def show_question(callback: CallbackQuery, session: QuizSession, state: FSMContext):
     """Показ вопроса теста"""
-    user_id = callback.from_user.id
-    
-    if user_id not in user_progress:
+    quiz = quiz_engine.quizzes.get(session.test_id)
+    if not quiz:
         await callback.message.edit_text("Сессия устарела")
         return
     
-    progress = user_progress[user_id]
-    test = progress['test_data']
-    current_q_index = progress['current_question']
-    
-    if current_q_index >= len(test['questions']):
-        await finish_test(callback)
+    question = quiz.question(session.index)
+    if question is None:
+        quiz_funnel.complete(quiz)
+        await finish_test(callback, session, state)
         return
     
-    question = test['questions'][current_q_index]
-    
-    keyboard = []
-    for answer in question['answers']:
-        keyboard.append([InlineKeyboardButton(text=answer['text'], callback_data=f"answer_{answer['id']}")])
-    
-    if current_q_index > 0:
-        keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back")])
-    
-    keyboard.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_test")])
-    
-    reply_markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
-    
-    progress_text = f"📊 Вопрос {current_q_index + 1}/{len(test['questions'])}"
-    
-    await callback.message.edit_text(
-        f"{progress_text}\n\n{question['text']}",
-        reply_markup=reply_markup
-    )
+    quiz_funnel.view(question)
+    await callback.message.edit_text(question.screen, reply_markup=question.markup)
 
-@router.callback_query(F.data.startswith("answer_"))
-async def handle_answer(callback: CallbackQuery):
+@callbacks.prefix("answer_", int)
+async def handle_answer(callback: CallbackQuery, state: FSMContext, cb: int):
     """Обработка ответа на вопрос теста"""
     user_id = callback.from_user.id
     
-    if callback.data == "back":
-        progress = user_progress[user_id]
-        if progress['current_question'] > 0:
-            progress['current_question'] -= 1
-        await show_question(callback)
+    session = await quiz_sessions.load(user_id, state)
+    if not session:
+        await callback.answer("❌ Сессия устарела")
         return
     
-    if callback.data == "cancel_test":
-        if user_id in user_progress:
-            del user_progress[user_id]
-        await callback.message.edit_text("Тест отменен")
-        await start(callback.message)
+    answer = quiz_engine.answer(cb)
+    # Ответ должен относиться к текущему вопросу (старая кнопка или тест перезагружен)
+    if not answer or answer.question.quiz.id != session.test_id \
+            or answer.question.index != session.index:
+        await callback.answer("Ошибка: ответ не найден")
         return
     
-    answer_id = int(callback.data.split('_')[1])
-    
-    progress = user_progress[user_id]
-    test = progress['test_data']
-    current_question = test['questions'][progress['current_question']]
-    
-    selected_answer = next((a for a in current_question['answers'] if a['id'] == answer_id), None)
-    if not selected_answer:
-        await callback.message.edit_text("Ошибка: ответ не найден")
-        return
+    session.answer(answer.id)
+    await quiz_sessions.save(user_id, session, state)
+    quiz_funnel.pick(answer)
+    subscribers.add(f"quiz:{answer.key}", user_id)
     
-    progress['answers'][current_question['id']] = selected_answer['id']
-    progress['current_question'] += 1
-    
-    await show_question(callback)
+    await show_question(callback, session, state)
     await callback.answer()
 
-async def finish_test(callback: CallbackQuery):
+def recommend(features: dict) -> list:
+    """Лучшие товары в наличии под ответы теста"""
+    if not recommender.built:
+        recommender.build(feature_columns(), available=stock_reservations.available)
+    return [get_product(product_id) for product_id, _ in recommender.top(features, RECOMMENDATIONS_COUNT)]
+
+async def finish_test(callback: CallbackQuery, session: QuizSession, state: FSMContext):
     """Завершение теста"""
     user_id = callback.from_user.id
+    products = recommend(quiz_engine.features(session.answers))
     
-    if user_id not in user_progress:
-        await callback.message.edit_text("Сессия устарела")
-        return
-    
-    progress = user_progress[user_id]
-    
-    recommendations = "🚲 Рекомендуем:\n• Городской велосипед - 25,000₽\n• Горный велосипед - 35,000₽"
+    keyboard = []
+    if products:
+        lines = []
+        for product in products:
+            family = variant_index.family(product['id'])
+            price = f"от {family.min_price}" if family else product['price']
+            lines.append(f"• {product['name']} - {format_price(price)}₽")
+            keyboard.append([InlineKeyboardButton(text=f"🚲 {product['name']}", callback_data=f"product_{product['id']}")])
+        recommendations = "🚲 Рекомендуем:\n" + "\n".join(lines)
+    else:
+        recommendations = "😔 Подходящих велосипедов сейчас нет в наличии - наш консультант поможет с выбором"
     
-    keyboard = [
+    keyboard.extend([
         [InlineKeyboardButton(text="🛒 Перейти к покупкам", callback_data="catalog")],
         [InlineKeyboardButton(text="📞 Консультация", callback_data="support")],
         [InlineKeyboardButton(text="📋 Главное меню", callback_data="main_menu")]
-    ]
+    ])
     
     await callback.message.edit_text(
         f"✅ Тест завершен!\n\n{recommendations}",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
     )
     
-    del user_progress[user_id]
+    await quiz_sessions.drop(user_id, state)
 
-@router.callback_query(F.data == "catalog")
+@callbacks.exact("catalog")
 async def handle_catalog(callback: CallbackQuery):
     """Показ каталога"""
     keyboard = [
@@ -603,35 +621,45 @@ async def handle_catalog(callback: CallbackQuery):
         [InlineKeyboardButton(text="📋 Главное меню", callback_data="main_menu")]
     ]
     
-    await callback.message.edit_text(
+    await show_text_screen(
+        callback,
         "🛒 **Каталог велосипедов**\n\n"
         "Выберите категорию:",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
     )
     await callback.answer()
 
-@router.callback_query(F.data.startswith("cat_"))
-async def handle_category_products(callback: CallbackQuery):
-    """Показ товаров категории"""
-    category = callback.data.replace("cat_", "")
+def render_category(screen: str):
+    """Экран списка товаров категории (None - категория пуста)"""
+    category = screen.replace("cat_", "")
+    products = get_category_products(category)
+    if not products:
+        return None
     
-    category_products = {
-        "mountain": [
-            {"id": 1, "name": "Горный велосипед X1", "price": 25000, "desc": "21 скорость, алюминиевая рама"},
-            {"id": 2, "name": "Горный велосипед Pro", "price": 35000, "desc": "27 скоростей, гидравлические тормоза"},
-        ],
-        "folding": [
-            {"id": 3, "name": "Складной велосипед City", "price": 18000, "desc": "Компактный для города"},
-        ],
-        "hybrid": [
-            {"id": 4, "name": "Гибридный велосипед Tour", "price": 22000, "desc": "Универсальный для города и трассы"},
-        ]
-    }
+    category_name = CATEGORIES.get(category, "Категория")
+    
+    keyboard = []
+    for product in products:
+        keyboard.append([
+            InlineKeyboardButton(
+                text=f"{product['name']} - {format_price(product['price'])}₽", 
+                callback_data=f"product_{product['id']}"
+            )
+        ])
     
-    products = category_products.get(category, [])
+    keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="catalog")])
+    keyboard.append([InlineKeyboardButton(text="📋 Главное меню", callback_data="main_menu")])
     
-    if not products:
-        await callback.message.edit_text(
+    return f"{category_name}\n\nВыберите товар:", InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+@callbacks.prefix("cat_")
+async def handle_category_products(callback: CallbackQuery):
+    """Показ товаров категории"""
+    screen = prefetcher.get_screen(callback.data)
+    
+    if not screen:
+        await show_text_screen(
+            callback,
             "😔 В этой категории пока нет товаров",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="⬅️ Назад", callback_data="catalog")],
@@ -640,87 +668,150 @@ async def handle_category_products(callback: CallbackQuery):
         )
         return
     
-    category_names = {
-        "mountain": "🏔️ Горные велосипеды",
-        "folding": "📦 Складные велосипеды",
-        "hybrid": "🚴 Гибридные велосипеды"
-    }
-    
-    category_name = category_names.get(category, "Категория")
+    text, reply_markup = screen
+    await show_text_screen(callback, text, reply_markup=reply_markup)
+    await callback.answer()
+
+def render_product_card(product: dict) -> tuple:
+    """Текст и клавиатура карточки товара"""
+    keyboard = [
+        [InlineKeyboardButton(text="🛒 Добавить в корзину", callback_data=ADD_TO_CART.pack(product['id']))]
+    ]
     
-    keyboard = []
-    for product in products:
+    # Выбор варианта (размер, цвет) - одно обращение к индексу семейства
+    variants = variant_index.variants(product['id'])
+    if variants:
         keyboard.append([
             InlineKeyboardButton(
-                text=f"{product['name']} - {product['price']}₽", 
-                callback_data=f"product_{product['id']}"
+                text=f"{'✅ ' if variant_id == product['id'] else ''}{label}{'' if in_stock > 0 else ' ❌'}",
+                callback_data=f"product_{variant_id}"
             )
+            for variant_id, label, in_stock in variants
         ])
     
-    keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="catalog")])
-    keyboard.append([InlineKeyboardButton(text="📋 Главное меню", callback_data="main_menu")])
+    prev_id, next_id = get_neighbours(variant_index.root(product['id']))
+    navigation = []
+    if prev_id:
+        navigation.append(InlineKeyboardButton(text="◀️", callback_data=f"product_{prev_id}"))
+    if next_id:
+        navigation.append(InlineKeyboardButton(text="▶️", callback_data=f"product_{next_id}"))
+    if navigation:
+        keyboard.append(navigation)
+    
+    keyboard.extend([
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data=f"cat_{product['category']}")],
+        [InlineKeyboardButton(text="📋 Главное меню", callback_data="main_menu")]
+    ])
     
-    await callback.message.edit_text(
-        f"{category_name}\n\nВыберите товар:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+    text = (
+        f"🚴 **{product['name']}**\n\n"
+        f"{product['desc']}\n\n"
+        f"💵 Цена: {format_price(product['price'])}₽"
     )
-    await callback.answer()
+    
+    family = variant_index.family(product['id'])
+    if family:
+        sizes = ", ".join(variant_index.available_labels(product['id'])) or "нет в наличии"
+        text += (
+            f"\n📏 Вариант: {product.get('variant') or '-'}\n"
+            f"💰 Цены от {format_price(family.min_price)}₽\n"
+            f"📦 Доступные варианты: {sizes} (всего {family.total_stock} шт.)"
+        )
+    return text, InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def render_product_screen(screen: str):
+    """Экран карточки товара по callback_data (None - товара нет)"""
+    product = get_product(int(screen.split('_')[1]))
+    return render_product_card(product) if product else None
 
-@router.callback_query(F.data.startswith("product_"))
-async def handle_product_selection(callback: CallbackQuery):
+async def warm_product_photo(screen: str):
+    """Прогрев хэша фото товара (в потоке), чтобы показ карточки не читал файл с диска"""
+    if screen.startswith("product_"):
+        product = get_product(int(screen.split('_')[1]))
+        if product and product.get('photo_path'):
+            await media_registry.warm(product['photo_path'])
+
+def invalidate_product_screens(product_id: int, available: int):
+    """Остаток изменился - карточки семейства товара нужно перерисовать"""
+    family = variant_index.variants(product_id) or [(product_id, None, None)]
+    for variant_id, _, _ in family:
+        prefetcher.invalidate(f"product_{variant_id}")
+
+prefetcher.renderers["cat_"] = render_category
+prefetcher.renderers["product_"] = render_product_screen
+prefetcher.warmers.append(warm_product_photo)
+stock_listeners.append(invalidate_product_screens)
+
+def invalidate_price_screens(product_id: int, price: int):
+    """Цена изменилась - перерисовать карточки семейства и список категории"""
+    invalidate_product_screens(product_id, None)
+    product = get_product(product_id)
+    if product:
+        prefetcher.invalidate(f"cat_{product['category']}")
+
+price_listeners.append(invalidate_price_screens)
+stock_listeners.append(recommender.set_stock)
+price_listeners.append(recommender.set_price)
+
+@callbacks.prefix("product_", int)
+async def handle_product_selection(callback: CallbackQuery, cb: int):
     """Обработка выбора товара"""
-    product_id = int(callback.data.split('_')[1])
+    product_id = cb
     
-    products = {
-        1: {"name": "Горный велосипед X1", "price": 25000, "desc": "21 скорость, алюминиевая рама. Идеален для начинающих"},
-        2: {"name": "Горный велосипед Pro", "price": 35000, "desc": "27 скоростей, гидравлические тормоза. Профессиональная модель"},
-        3: {"name": "Складной велосипед City", "price": 18000, "desc": "Компактный для города. Удобен для commuting"},
-        4: {"name": "Гибридный велосипед Tour", "price": 22000, "desc": "Универсальный для города и трассы. Комфортная посадка"},
-    }
+    screen = prefetcher.get_screen(f"product_{product_id}")
+    if not screen:
+        await callback.answer("❌ Товар не найден")
+        return
     
-    product = products.get(product_id, {"name": "Товар", "price": 0, "desc": "Описание"})
+    product = get_product(product_id)
+    text, reply_markup = screen
     
-    keyboard = [
-        [InlineKeyboardButton(text="🛒 Добавить в корзину", callback_data=f"add_to_cart_{product_id}")],
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data="catalog")],
-        [InlineKeyboardButton(text="📋 Главное меню", callback_data="main_menu")]
-    ]
+    photo_path = product.get('photo_path')
+    if photo_path:
+        await media_registry.warm(photo_path)
+    media = media_registry.get_media(photo_path) if photo_path else None
+    
+    if media is None:
+        await show_text_screen(callback, text, reply_markup=reply_markup)
+    elif callback.message.photo:
+        # Листание карточек: меняем фото в том же сообщении, известные фото уходят по file_id
+        sent = await callback.message.edit_media(
+            InputMediaPhoto(media=media, caption=text),
+            reply_markup=reply_markup
+        )
+        media_registry.remember(photo_path, sent)
+    else:
+        await callback.message.delete()
+        sent = await callback.message.answer_photo(media, caption=text, reply_markup=reply_markup)
+        media_registry.remember(photo_path, sent)
     
-    await callback.message.edit_text(
-        f"🚴 **{product['name']}**\n\n"
-        f"{product['desc']}\n\n"
-        f"💵 Цена: {product['price']}₽",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
-    )
     await callback.answer()
 
 # 🆕 ОБРАБОТЧИКИ ДЛЯ КОРЗИНЫ И АКЦИЙ
-@router.callback_query(F.data.startswith("add_to_cart_"))
-async def add_to_cart(callback: CallbackQuery):
+@callbacks.packed(ADD_TO_CART, flags={"flood": "cart"})
+async def add_to_cart(callback: CallbackQuery, cb):
     """Добавление товара в корзину"""
-    from order_system import user_carts
+    from order_system import cart_add, stock_reservations
     
     user_id = callback.from_user.id
-    product_id = int(callback.data.split('_')[3])
-    
-    if user_id not in user_carts:
-        user_carts[user_id] = {}
+    product_id = cb.product_id
     
-    if product_id not in user_carts[user_id]:
-        user_carts[user_id][product_id] = 0
+    if not stock_reservations.reserve(user_id, product_id):
+        await callback.answer("😔 Товара нет в наличии", show_alert=True)
+        return
     
-    user_carts[user_id][product_id] += 1
+    await cart_add(user_id, product_id)
     
     await callback.answer("✅ Товар добавлен в корзину!")
 
-@router.callback_query(F.data == "clear_cart")
+@callbacks.exact("clear_cart", flags={"flood": "cart"})
 async def clear_cart(callback: CallbackQuery):
     """Очистка корзины"""
-    from order_system import user_carts
+    from order_system import cart_clear, stock_reservations
     
     user_id = callback.from_user.id
-    if user_id in user_carts:
-        user_carts[user_id] = {}
+    await cart_clear(user_id)
+    stock_reservations.release(user_id)
     
     await callback.message.edit_text(
         "🗑️ Корзина очищена",
@@ -730,61 +821,353 @@ async def clear_cart(callback: CallbackQuery):
         ])
     )
 
-@router.callback_query(F.data == "subscribe_promo")
-async def subscribe_to_promotions(callback: CallbackQuery):
-    """Подписка на акции и уведомления"""
-    await callback.message.edit_text(
-        "🔔 **Вы подписаны на уведомления!**\n\n"
-        "Теперь вы будете первыми узнавать о:\n"
-        "• 🎁 Скидках и акциях\n"
-        "• 🚴 Новых поступлениях\n"
-        "• ⚡ Специальных предложениях\n\n"
-        "Не пропустите ничего важного!",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🛒 Перейти в каталог", callback_data="catalog")],
-            [InlineKeyboardButton(text="📋 Главное меню", callback_data="main_menu")]
-        ])
-    )
-
-@router.callback_query(F.data == "promo")
-async def enter_promo(callback: CallbackQuery):
-    """Информация о промокодах"""
-    await callback.message.edit_text(
-        "🎁 **Промокоды**\n\n"
-        "Доступные промокоды:\n"
-        "• WELCOME10 - 10% скидка\n"
-        "• BIKE2024 - 15% на велосипеды\n"
-        "• FREEDELIVERY - бесплатная доставка\n\n"
-        "Введите промокод при оформлении заказа!",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🛒 Перейти в корзину", callback_data="cart")],
-            [InlineKeyboardButton(text="📋 Главное меню", callback_data="main_menu")]
-        ])
-    )
+@callbacks.packed(CART_QUANTITY, flags={"flood": "cart"})
+async def change_cart_quantity(callback: CallbackQuery, state: FSMContext, cb):
+    """Изменение количества товара в корзине"""
+    from order_system import user_carts, cart_set_quantity, stock_reservations
+    
+    user_id = callback.from_user.id
+    product_id = cb.product_id
+    
+    cart = user_carts.get(user_id)
+    if not cart or product_id not in cart:
+        await callback.answer("❌ Товара уже нет в корзине")
+        return
+    
+    if cb.delta > 0:
+        if not stock_reservations.reserve(user_id, product_id):
+            await callback.answer("😔 Больше нет в наличии", show_alert=True)
+            return
+        await cart_set_quantity(user_id, product_id, cart[product_id] + 1)
+    else:
+        # Возвращаем в остаток одну единицу, остальной резерв не трогаем
+        stock_reservations.release(user_id, product_id, 1)
+        await cart_set_quantity(user_id, product_id, cart[product_id] - 1)
+    
+    await handle_cart(callback, state)
 
 # 🆕 ДОБАВЛЯЕМ ОБРАБОТЧИКИ ДЛЯ ВСЕХ ОСТАВШИХСЯ CALLBACK_DATA
-@router.callback_query(F.data == "back")
-async def handle_back(callback: CallbackQuery):
+def _current_question(session: QuizSession):
+    """Вопрос, на котором сейчас пользователь (None - тест удалён или пройден)"""
+    quiz = quiz_engine.quizzes.get(session.test_id)
+    return quiz.question(session.index) if quiz else None
+
+@callbacks.exact("back")
+async def handle_back(callback: CallbackQuery, state: FSMContext):
     """Обработка кнопки Назад в тесте"""
     user_id = callback.from_user.id
     
-    if user_id in user_progress:
-        progress = user_progress[user_id]
-        if progress['current_question'] > 0:
-            progress['current_question'] -= 1
-        await show_question(callback)
+    session = await quiz_sessions.load(user_id, state)
+    if session:
+        question = _current_question(session)
+        if question is not None:
+            quiz_funnel.back(question)
+        if session.back():
+            await quiz_sessions.save(user_id, session, state)
+        await show_question(callback, session, state)
     else:
         await callback.answer("❌ Сессия устарела")
 
-@router.callback_query(F.data == "cancel_test")
-async def handle_cancel_test(callback: CallbackQuery):
+@callbacks.exact("cancel_test")
+async def handle_cancel_test(callback: CallbackQuery, state: FSMContext):
     """Отмена теста"""
-    user_id = callback.from_user.id
-    if user_id in user_progress:
-        del user_progress[user_id]
+    session = await quiz_sessions.load(callback.from_user.id, state)
+    question = _current_question(session) if session else None
+    if question is not None:
+        quiz_funnel.cancel(question)
+    await quiz_sessions.drop(callback.from_user.id, state)
     await callback.message.edit_text("Тест отменен")
     await start(callback.message)
 
+@router.message(Command("prefetch_stats"))
+async def show_prefetch_stats(message: Message):
+    """Статистика упреждающего рендера (для администраторов)"""
+    if message.from_user.id not in SUPPORT_IDS:
+        return
+    
+    stats = prefetcher.stats()
+    await message.answer(
+        "⚡ **Упреждающий рендер экранов**\n\n"
+        f"🎯 Попадания: {stats['hits']} / промахи: {stats['misses']} "
+        f"({stats['hit_rate']:.1%})\n"
+        f"🔮 Использовано упреждающих: {stats['prefetch_used']}, "
+        f"вытеснено без использования: {stats['prefetch_evicted']}\n"
+        f"💾 Память: {stats['memory_used']} / {stats['memory_budget']} байт\n"
+        f"⏱ Обработка нажатия: из кэша {stats['hit_latency_ms']:.1f} мс, "
+        f"без кэша {stats['miss_latency_ms']:.1f} мс"
+    )
+
+@router.message(Command("broadcast"))
+async def start_broadcast(message: Message, command: CommandObject):
+    """
+    Запуск рассылки акции (для администраторов):
+    /broadcast <id акции> [аудитория], по умолчанию - подписчики
+    Аудитория: customers или выражение над сегментами,
+    например: subscribed & bought:mountain - ordered:30d
+    """
+    if message.from_user.id not in SUPPORT_IDS:
+        return
+    
+    promo_id, _, audience = (command.args or "").strip().partition(" ")
+    if promo_id not in PROMOTIONS:
+        await message.answer(f"❌ Укажите акцию: /broadcast {' | '.join(PROMOTIONS)} [аудитория]")
+        return
+    
+    campaign_id = f"{promo_id}-{int(message.date.timestamp())}"
+    try:
+        campaign = broadcasts.start(
+            campaign_id, PROMOTIONS[promo_id], audience.strip() or "subscribed", notify_user_about_promotion
+        )
+    except ValueError as e:
+        await message.answer(f"❌ {e}")
+        return
+    
+    await message.answer(
+        f"📣 Рассылка {campaign_id} запущена\n"
+        f"👥 Получателей: {campaign.total}\n\n"
+        f"Прогресс: /broadcast_status {campaign_id}"
+    )
+
+@router.message(Command("audience"))
+async def show_audience(message: Message, command: CommandObject):
+    """Размер аудитории по выражению: /audience <выражение>; без аргумента - все сегменты"""
+    if message.from_user.id not in SUPPORT_IDS:
+        return
+    
+    expression = (command.args or "").strip()
+    if not expression:
+        lines = [f"• {name}: {size}" for name, size in subscribers.stats().items()]
+        await message.answer("🔔 **Сегменты**\n\n" + ("\n".join(lines) or "пока пусто"))
+        return
+    
+    try:
+        audience = subscribers.select(expression)
+    except ValueError as e:
+        await message.answer(f"❌ {e}")
+        return
+    await message.answer(f"👥 {expression}: {len(audience)} пользователей")
+
+@router.message(Command("broadcast_status"))
+async def show_broadcast_status(message: Message, command: CommandObject):
+    """Прогресс рассылки: /broadcast_status <id рассылки>"""
+    if message.from_user.id not in SUPPORT_IDS:
+        return
+    
+    campaign_id = (command.args or "").strip()
+    progress = broadcasts.progress(campaign_id)
+    if not progress:
+        await message.answer(f"❌ Рассылка не найдена. Известные: {', '.join(broadcasts.campaigns) or 'нет'}")
+        return
+    
+    await message.answer(
+        f"📣 **Рассылка {campaign_id}**: {progress['status']}\n\n"
+        f"✅ Отправлено: {progress['sent']}\n"
+        f"❌ Ошибок: {progress['failed']}\n"
+        f"🚫 Заблокировали бота: {progress['removed']}\n"
+        f"⏳ Осталось: {progress['remaining']} (~{progress['eta_seconds'] / 60:.0f} мин)"
+    )
+
+WEEKDAYS = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота", "воскресенье"]
+
+@router.message(Command("stats"))
+async def show_stats(message: Message):
+    """Сводка продаж по готовым агрегатам (для администраторов)"""
+    from order_system import analytics
+    
+    if message.from_user.id not in SUPPORT_IDS:
+        return
+    
+    count, revenue = analytics.day()
+    lines = [f"📊 **Продажи сегодня**: {count} заказов на {revenue:,.0f}₽"]
+    for delivery, (delivery_count, delivery_revenue) in analytics.day_by_delivery().items():
+        lines.append(f"• {delivery}: {delivery_count} / {delivery_revenue:,.0f}₽")
+    
+    lines.append("\n📦 **По статусам**")
+    for status, (status_count, status_revenue) in analytics.statuses().items():
+        lines.append(f"• {status}: {status_count} / {status_revenue:,.0f}₽")
+    
+    lines.append("\n🏆 **Топ товаров**")
+    for name, quantity, product_revenue in analytics.top_products():
+        lines.append(f"• {name}: {quantity} шт. / {product_revenue:,.0f}₽")
+    
+    await message.answer("\n".join(lines))
+
+@router.message(Command("funnel"))
+async def show_quiz_funnel(message: Message, command: CommandObject):
+    """Воронка теста: /funnel [ID теста] (для администраторов)"""
+    if message.from_user.id not in SUPPORT_IDS:
+        return
+    
+    test_id = int(command.args) if command.args and command.args.isdigit() else 1
+    quiz = quiz_engine.quizzes.get(test_id)
+    if not quiz:
+        await message.answer("❌ Тест не найден")
+        return
+    
+    starts, completions, rows = quiz_funnel.report(quiz)
+    conversion = completions / starts * 100 if starts else 0
+    lines = [f"🧭 **Воронка: {quiz.title}**", f"▶️ Начали: {starts}"]
+    # Дошедшие до вопроса - ответившие на предыдущий (до первого - начавшие)
+    reached = starts
+    for question, views, backs, cancels, answers in rows:
+        answered = sum(count for _, count in answers)
+        drop = max(0, 1 - answered / reached) * 100 if reached else 0
+        lines.append(
+            f"\n{question.index + 1}. {question.text}\n"
+            f"👁 Показов: {views}, ответили: {answered}, ⬅️ назад: {backs}, ❌ отмен: {cancels}, отвал: {drop:.0f}%"
+        )
+        for answer, count in answers:
+            share = count / answered * 100 if answered else 0
+            lines.append(f"   • {answer.text}: {count} ({share:.0f}%)")
+        reached = answered
+    lines.append(f"\n✅ Завершили: {completions} ({conversion:.0f}%)")
+    
+    await message.answer("\n".join(lines))
+
+@router.message(Command("loglevel"))
+async def set_log_level(message: Message, command: CommandObject):
+    """Уровни логов без перезапуска: /loglevel [модуль] <уровень> (для администраторов)"""
+    if message.from_user.id not in SUPPORT_IDS:
+        return
+    
+    args = (command.args or "").split()
+    if not args:
+        lines = [f"📝 root: {log_pipeline.level}"]
+        lines += [f"   {name}: {level}" for name, level in sorted(log_pipeline.levels.items())]
+        if log_pipeline.dropped:
+            lines.append(f"⚠️ Отброшено при переполнении очереди: {log_pipeline.dropped}")
+        await message.answer("\n".join(lines))
+        return
+    
+    name, level = (args[0], args[1]) if len(args) > 1 else ("root", args[0])
+    try:
+        log_pipeline.set_level(name, level)
+    except ValueError as e:
+        await message.answer(f"❌ {e}. Формат: /loglevel [модуль] DEBUG|INFO|WARNING|ERROR")
+        return
+    await message.answer(f"✅ {name}: {level.upper()}")
+
+def format_profile_report(report: Dict) -> str:
+    lines = [
+        f"🔬 **Профиль: {report['updates']} апдейтов за {report['duration']:.0f} с**",
+        f"Сэмпл раз в {report['interval'] * 1000:.0f} мс, файлы: {report['path']}",
+    ]
+    for name, updates, samples, leaves in report["handlers"]:
+        lines.append(f"\n• {name}: апдейтов {updates}, сэмплов {samples}")
+        lines += [f"   {frame}: {count}" for frame, count in leaves]
+    return "\n".join(lines)
+
+async def send_profile_report(message: Message, done):
+    report = await done
+    try:
+        await message.answer(format_profile_report(report))
+    except Exception as e:
+        logger.error(f"❌ Не удалось отправить отчёт профилирования: {e}")
+
+@router.message(Command("profile"))
+async def start_profiling(message: Message, command: CommandObject, dispatcher: Dispatcher):
+    """Профилирование обработчиков: /profile <N апдейтов | T s> | /profile stop (для администраторов)"""
+    if message.from_user.id not in SUPPORT_IDS:
+        return
+    
+    args = (command.args or "").strip().lower()
+    if args == "stop":
+        if not await profiler.stop():
+            await message.answer("❌ Профилирование не запущено")
+        return
+    
+    try:
+        if args.endswith("s"):
+            max_updates, seconds = None, float(args[:-1])
+        else:
+            max_updates, seconds = int(args), None
+        done = profiler.start(dispatcher, max_updates=max_updates, seconds=seconds)
+    except ValueError:
+        await message.answer("❌ Формат: /profile 200 (апдейтов) | /profile 30s | /profile stop")
+        return
+    except RuntimeError as e:
+        await message.answer(f"❌ {e}")
+        return
+    
+    # Отчёт придёт по окончании сеанса (в том числе после /profile stop)
+    asyncio.create_task(send_profile_report(message, done))
+    await message.answer("🔬 Профилирование запущено")
+
+@router.startup()
+async def on_startup():
+    quiz_funnel.start_flushing()
+    if config.METRICS_PORT:
+        try:
+            await metrics_server.start()
+        except OSError as e:
+            logger.error(f"❌ Не удалось открыть порт метрик {config.METRICS_PORT}: {e}")
+
+@router.shutdown()
+async def on_shutdown():
+    await profiler.stop()
+    await quiz_funnel.stop()
+    await metrics_server.stop()
+
+@router.message(Command("report"))
+async def show_report(message: Message, command: CommandObject):
+    """Подробный отчёт за N дней: /report [дней=30]; считается в отдельном процессе"""
+    from order_system import user_orders, reports
+    from services.analytics import build_report, report_rows
+    
+    if message.from_user.id not in SUPPORT_IDS:
+        return
+    
+    days = int(command.args) if (command.args or "").strip().isdigit() else 30
+    now = message.date.timestamp()
+    rows = report_rows(user_orders.between(now - days * 86400, now + 1))
+    await message.answer(f"⏳ Считаю отчёт по {len(rows)} заказам...")
+    
+    report = await reports.run(build_report, rows)
+    if not report["orders"]:
+        await message.answer(f"📈 За {days} дн. заказов нет")
+        return
+    
+    by_delivery = "\n".join(f"• {delivery}: {revenue:,.0f}₽" for delivery, revenue in report["by_delivery"].items())
+    await message.answer(
+        f"📈 **Отчёт за {days} дн.**\n\n"
+        f"🧾 Заказов: {report['orders']}, выручка {report['revenue']:,.0f}₽\n"
+        f"💵 Средний чек: {report['average']:,.0f}₽, медиана {report['median']:,.0f}₽, p90 {report['p90']:,.0f}₽\n"
+        f"👥 Покупателей: {report['customers']}, повторных {report['repeat_rate']:.0%}\n"
+        f"⏰ Пиковый час: {report['busiest_hour']}:00, лучший день - {WEEKDAYS[report['best_weekday']]}\n\n"
+        f"🚚 По доставке:\n{by_delivery}"
+    )
+
+@router.message(Command("set_price"))
+async def set_product_price(message: Message, command: CommandObject):
+    """Изменение цен: /set_price <id товара> <цена> [<id товара> <цена> ...] (для администраторов)"""
+    if message.from_user.id not in SUPPORT_IDS:
+        return
+    
+    values = (command.args or "").split()
+    try:
+        pairs = [(int(product_id), int(price)) for product_id, price in zip(values[::2], values[1::2])]
+    except ValueError:
+        pairs = []
+    if not pairs or len(values) % 2:
+        await message.answer("❌ Формат: /set_price <id товара> <цена> [<id товара> <цена> ...]")
+        return
+    
+    # Старые цены запоминаем до изменения: без снимка каталога set_price меняет товар на месте
+    changes = {}
+    for product_id, price in pairs:
+        product = get_product(product_id)
+        if not product or price <= 0:
+            await message.answer(f"❌ Товар {product_id} не найден или цена неверна")
+            return
+        changes[product_id] = (product['name'], product['price'], price)
+    
+    change_prices({product_id: price for product_id, (_, _, price) in changes.items()})
+    lines = [
+        f"• {name}: {format_price(old)}₽ → {format_price(new)}₽"
+        for name, old, new in changes.values()
+    ]
+    await message.answer("✅ Цены изменены, корзины пересчитаны:\n" + "\n".join(lines))
+
 async def main():
     """Запуск бота"""
     bot = Bot(token=config.BOT_TOKEN)
@@ -792,6 +1175,14 @@ async def main():
     
     dp.include_router(router)
     dp.include_router(order_router)
+    # Задержки обработчиков и запросов к Telegram
+    metrics.instrument(dp)
+    # Внутренние middleware диспетчера действуют во всех роутерах
+    flood_middleware = FloodControlMiddleware(flood_control, callback_routers=[callbacks, order_callbacks])
+    dp.message.middleware(flood_middleware)
+    dp.callback_query.middleware(flood_middleware)
+    dp.shutdown.register(flood_middleware.close)
+    bot.session.middleware(TelegramMetrics(metrics))
     
     print(f"🤖 Бот {config.SHOP_NAME} запущен!")
     print(f"📞 Поддержка: {len(SUPPORT_IDS)} администраторов")
@@ -801,5 +1192,5 @@ async def main():
     await dp.start_polling(bot)
 
 if __name__ == '__main__':
-    import asyncio
+    log_pipeline.start()
     asyncio.run(main())
\ No newline at end of file
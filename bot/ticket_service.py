@@ -6,9 +6,19 @@ from typing import List, Optional, Dict, Any
 from aiogram.types import User as TgUser
 import json
 import ssl
+import time
+
+from services.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+
+def _operation(method: str, endpoint: str) -> str:
+    """Операция для метрик: ID в пути заменяются на {id}, чтобы не плодить серии"""
+    segments = ("{id}" if any(char.isdigit() for char in segment) else segment
+                for segment in endpoint.strip("/").split("/"))
+    return f"{method.upper()} /{'/'.join(segments)}"
+
 class APITicketService:
     """
     Сервис для работы с тикетами через REST API
@@ -20,9 +30,7 @@ class APITicketService:
         self.api_token = api_token
         self.timeout = aiohttp.ClientTimeout(total=30)
         
-        logger.info(f"🚀 APITicketService инициализирован")
-        logger.info(f"🌐 API Base URL: {self.api_base_url}")
-        logger.info(f"🔑 API Token: {self.api_token[:10]}...")
+        logger.info("🚀 APITicketService инициализирован, API Base URL: %s", self.api_base_url)
     
     async def _send_api_request(self, method: str, endpoint: str, data: Dict[str, Any] = None) -> Dict[str, Any]:
         """
@@ -30,10 +38,11 @@ class APITicketService:
         """
         url = f"{self.api_base_url}/{endpoint.lstrip('/')}"
         
-        logger.info(f"📤 Отправка {method} запроса к: {url}")
+        # Транспортные подробности - на DEBUG: время и ошибки запросов есть в метриках
+        logger.debug("📤 Отправка %s запроса к: %s", method, url)
         
-        if data:
-            logger.debug(f"📦 Тело запроса: {json.dumps(data, indent=2, ensure_ascii=False)}")
+        if data and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📦 Тело запроса: %s", json.dumps(data, indent=2, ensure_ascii=False))
         
         headers = {
             "Authorization": self.api_token,
@@ -46,6 +55,8 @@ class APITicketService:
         ssl_context.check_hostname = False
         ssl_context.verify_mode = ssl.CERT_NONE
         
+        failed = False
+        started = time.perf_counter()
         try:
             connector = aiohttp.TCPConnector(ssl=ssl_context)
             
@@ -63,34 +74,40 @@ class APITicketService:
                     return await self._process_api_response(response, url)
                     
         except aiohttp.ClientConnectorError as e:
-            logger.error(f"❌ Ошибка подключения к {url}: {e}")
+            failed = True
+            logger.error("❌ Ошибка подключения к %s: %s", url, e)
             raise ConnectionError(f"Не удалось подключиться к API: {e}")
         except aiohttp.ServerTimeoutError as e:
-            logger.error(f"❌ Таймаут при обращении к {url}: {e}")
+            failed = True
+            logger.error("❌ Таймаут при обращении к %s: %s", url, e)
             raise TimeoutError(f"Превышено время ожидания API: {e}")
         except Exception as e:
-            logger.error(f"❌ Неожиданная ошибка при запросе к {url}: {e}")
+            failed = True
+            logger.error("❌ Неожиданная ошибка при запросе к %s: %s", url, e)
             raise
+        finally:
+            metrics.observe_dependency("ticket_api", _operation(method, endpoint),
+                                       time.perf_counter() - started, failed)
     
     async def _process_api_response(self, response: aiohttp.ClientResponse, url: str) -> Dict[str, Any]:
         """
         Обработка ответа от API
         """
-        logger.info(f"📥 Получен ответ от {url}, статус: {response.status}")
+        logger.debug("📥 Получен ответ от %s, статус: %s", url, response.status)
         
         response_text = await response.text()
         
-        # Логируем тело ответа для отладки
-        if response_text:
-            logger.debug(f"📄 Тело ответа: {response_text[:500]}...")
-        else:
-            logger.debug("📄 Тело ответа: пустое")
+        # Логируем тело ответа для отладки (срез строки - только если DEBUG включён)
+        if logger.isEnabledFor(logging.DEBUG):
+            if response_text:
+                logger.debug("📄 Тело ответа: %s...", response_text[:500])
+            else:
+                logger.debug("📄 Тело ответа: пустое")
         
         # Проверяем статус код
         if response.status >= 400:
             error_msg = f"API вернул ошибку {response.status} для {url}"
-            logger.error(f"❌ {error_msg}")
-            logger.error(f"   Ответ: {response_text}")
+            logger.error("❌ %s\n   Ответ: %s", error_msg, response_text)
             raise aiohttp.ClientResponseError(
                 request_info=response.request_info,
                 history=response.history,
@@ -103,11 +120,10 @@ class APITicketService:
         if response_text.strip():
             try:
                 result = await response.json()
-                logger.info(f"✅ Успешный ответ от API")
+                logger.debug("✅ Успешный ответ от API")
                 return result
             except json.JSONDecodeError as e:
-                logger.error(f"❌ Ошибка парсинга JSON от {url}: {e}")
-                logger.error(f"   Сырой ответ: {response_text}")
+                logger.error("❌ Ошибка парсинга JSON от %s: %s\n   Сырой ответ: %s", url, e, response_text)
                 raise ValueError(f"Невалидный JSON в ответе API: {e}")
         else:
             logger.warning("⚠️ Пустой ответ от API")
@@ -128,17 +144,17 @@ class APITicketService:
                 logger.info("✅ API доступен (получена ожидаемая 404)")
                 return True
             else:
-                logger.error(f"❌ API недоступен, статус: {e.status}")
+                logger.error("❌ API недоступен, статус: %s", e.status)
                 return False
         except Exception as e:
-            logger.error(f"❌ API недоступен: {e}")
+            logger.error("❌ API недоступен: %s", e)
             return False
     
     async def create_ticket(self, tg_user: TgUser, message_text: str, chat_id: str, msg_id: str) -> Dict[str, Any]:
         """
         Создание нового тикета через API
         """
-        logger.info(f"🎫 Создание тикета для пользователя {tg_user.id}")
+        logger.info("🎫 Создание тикета для пользователя %s", tg_user.id)
         
         ticket_id = str(uuid4())
         
@@ -167,12 +183,12 @@ class APITicketService:
             # Создаем тикет
             logger.info("📝 Создание тикета через API...")
             ticket_result = await self._send_api_request("POST", "ticket/add", ticket_data)
-            logger.info(f"✅ Тикет создан: {ticket_id}")
+            logger.info("✅ Тикет создан: %s", ticket_id)
             
             # Добавляем первое сообщение
             logger.info("💬 Добавление начального сообщения...")
             message_result = await self._send_api_request("POST", f"ticket/{ticket_id}/messages/add", message_data)
-            logger.info(f"✅ Сообщение добавлено в тикет {ticket_id}")
+            logger.info("✅ Сообщение добавлено в тикет %s", ticket_id)
             
             return {
                 "ticket": ticket_result,
@@ -181,7 +197,7 @@ class APITicketService:
             }
             
         except Exception as e:
-            logger.error(f"❌ Ошибка при создании тикета: {e}")
+            logger.error("❌ Ошибка при создании тикета: %s", e)
             raise
     
     async def add_message(self, ticket_id: str, tg_user: TgUser, message_text: str, 
@@ -189,7 +205,7 @@ class APITicketService:
         """
         Добавление сообщения в существующий тикет
         """
-        logger.info(f"📨 Добавление сообщения в тикет {ticket_id}")
+        logger.info("📨 Добавление сообщения в тикет %s", ticket_id)
         
         message_data = {
             "id": str(uuid4()),
@@ -205,11 +221,11 @@ class APITicketService:
         
         try:
             result = await self._send_api_request("POST", f"ticket/{ticket_id}/messages/add", message_data)
-            logger.info(f"✅ Сообщение добавлено в тикет {ticket_id}")
+            logger.info("✅ Сообщение добавлено в тикет %s", ticket_id)
             return result
             
         except Exception as e:
-            logger.error(f"❌ Ошибка при добавлении сообщения в тикет {ticket_id}: {e}")
+            logger.error("❌ Ошибка при добавлении сообщения в тикет %s: %s", ticket_id, e)
             raise
     
     async def add_message_with_attachments(self, ticket_id: str, tg_user: TgUser, 
@@ -218,7 +234,7 @@ class APITicketService:
         """
         Добавление сообщения с вложениями
         """
-        logger.info(f"📎 Добавление сообщения с {len(attachments)} вложениями в тикет {ticket_id}")
+        logger.info("📎 Добавление сообщения с %s вложениями в тикет %s", len(attachments), ticket_id)
         
         message_data = {
             "id": str(uuid4()),
@@ -234,42 +250,42 @@ class APITicketService:
         
         try:
             result = await self._send_api_request("POST", f"ticket/{ticket_id}/messages/add", message_data)
-            logger.info(f"✅ Сообщение с вложениями добавлено в тикет {ticket_id}")
+            logger.info("✅ Сообщение с вложениями добавлено в тикет %s", ticket_id)
             return result
             
         except Exception as e:
-            logger.error(f"❌ Ошибка при добавлении сообщения с вложениями: {e}")
+            logger.error("❌ Ошибка при добавлении сообщения с вложениями: %s", e)
             raise
     
     async def get_ticket(self, ticket_id: str) -> Dict[str, Any]:
         """
         Получение информации о тикете
         """
-        logger.info(f"📋 Получение тикета {ticket_id}")
+        logger.info("📋 Получение тикета %s", ticket_id)
         
         try:
             result = await self._send_api_request("GET", f"ticket/{ticket_id}")
-            logger.info(f"✅ Тикет {ticket_id} получен")
+            logger.info("✅ Тикет %s получен", ticket_id)
             return result
             
         except Exception as e:
-            logger.error(f"❌ Ошибка при получении тикета {ticket_id}: {e}")
+            logger.error("❌ Ошибка при получении тикета %s: %s", ticket_id, e)
             raise
     
     async def get_ticket_messages(self, ticket_id: str) -> List[Dict[str, Any]]:
         """
         Получение сообщений тикета
         """
-        logger.info(f"💬 Получение сообщений тикета {ticket_id}")
+        logger.info("💬 Получение сообщений тикета %s", ticket_id)
         
         try:
             ticket_data = await self.get_ticket(ticket_id)
             messages = ticket_data.get("messages", [])
-            logger.info(f"✅ Получено {len(messages)} сообщений для тикета {ticket_id}")
+            logger.info("✅ Получено %s сообщений для тикета %s", len(messages), ticket_id)
             return messages
             
         except Exception as e:
-            logger.error(f"❌ Ошибка при получении сообщений тикета {ticket_id}: {e}")
+            logger.error("❌ Ошибка при получении сообщений тикета %s: %s", ticket_id, e)
             raise
     
     async def get_user_tickets(self, user_id: int, status: str = None) -> List[Dict[str, Any]]:
@@ -277,7 +293,7 @@ class APITicketService:
         Получение тикетов пользователя
         TODO: Нужно добавить соответствующий эндпоинт в API
         """
-        logger.info(f"📂 Получение тикетов пользователя {user_id}")
+        logger.info("📂 Получение тикетов пользователя %s", user_id)
         
         # Временная заглушка - получаем все тикеты и фильтруем локально
         # В будущем нужно добавить эндпоинт /tickets?user_id=123
@@ -288,7 +304,7 @@ class APITicketService:
         """
         Закрытие тикета
         """
-        logger.info(f"🔒 Закрытие тикета {ticket_id}")
+        logger.info("🔒 Закрытие тикета %s", ticket_id)
         
         try:
             # Добавляем системное сообщение о закрытии
@@ -297,9 +313,9 @@ class APITicketService:
                 ticket_id, closed_by, close_message, "system", str(uuid4()), True
             )
             
-            logger.info(f"✅ Тикет {ticket_id} закрыт")
+            logger.info("✅ Тикет %s закрыт", ticket_id)
             return result
             
         except Exception as e:
-            logger.error(f"❌ Ошибка при закрытии тикета {ticket_id}: {e}")
+            logger.error("❌ Ошибка при закрытии тикета %s: %s", ticket_id, e)
             raise
\ No newline at end of file
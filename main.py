@@ -1,15 +1,26 @@
 from aiogram import Bot, Dispatcher
 from bot.config import config
-from bot.routers import hello
-from bot.routers import ticket
+from bot.routers import LazyRouters
+from bot.services.log_pipeline import LogPipeline, parse_pairs
 bot = Bot(token=config.BOT_TOKEN)
 dispatcher = Dispatcher()
 
-dispatcher.include_router(hello.router)
-dispatcher.include_router(ticket.router)
+# Роутеры импортируются в фоне после старта polling, а не при импорте main
+routers = LazyRouters(dispatcher, [
+    "bot.routers.hello",
+    "bot.routers.ticket",
+])
+# Типы апдейтов заданы явно: к началу опроса роутеры ещё не подключены
+ALLOWED_UPDATES = ["message", "callback_query"]
 
 
 
 if __name__ == "__main__":
+    LogPipeline(
+        level=config.LOG_LEVEL,
+        fmt=config.LOG_FORMAT,
+        levels=parse_pairs(config.LOG_LEVELS),
+        sample={name: int(rate) for name, rate in parse_pairs(config.LOG_SAMPLE).items()},
+    ).start()
     print("Bot is starting...")
-    dispatcher.run_polling(bot)
+    dispatcher.run_polling(bot, allowed_updates=ALLOWED_UPDATES)
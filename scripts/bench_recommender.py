@@ -0,0 +1,69 @@
+"""
+Бенчмарк подбора велосипедов: 100 000 товаров, построение матрицы,
+подбор top-3 и точечные обновления остатка и цены
+
+    python scripts/bench_recommender.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot"))
+
+from services.recommender import CATEGORY_PROFILES, Recommender  # noqa: E402
+
+PRODUCTS_COUNT = 100_000
+QUERIES = 1000
+
+
+def main() -> None:
+    rng = np.random.default_rng(42)
+
+    ids = np.arange(1, PRODUCTS_COUNT + 1, dtype=np.int64)
+    # Каждый пятый товар - вариант предыдущего
+    parents = np.where(ids % 5 == 0, ids - 1, 0)
+    codes = rng.integers(0, len(CATEGORY_PROFILES), PRODUCTS_COUNT)
+    prices = rng.integers(10_000, 120_000, PRODUCTS_COUNT) * 100
+    stock = rng.integers(0, 5, PRODUCTS_COUNT)
+    columns = (ids, parents, codes, list(CATEGORY_PROFILES), prices, stock)
+
+    recommender = Recommender()
+    started = time.perf_counter()
+    recommender.build(columns)
+    build_time = time.perf_counter() - started
+
+    answers = [{"purpose": int(rng.integers(1, 5)), "skill": int(rng.integers(1, 4)),
+                "budget": int(rng.integers(1, 4))} for _ in range(QUERIES)]
+    started = time.perf_counter()
+    for features in answers:
+        result = recommender.top(features, 3)
+    query_time = (time.perf_counter() - started) / QUERIES
+
+    started = time.perf_counter()
+    for product_id in range(1, 1001):
+        recommender.set_stock(product_id, 0)
+    stock_time = (time.perf_counter() - started) / 1000
+
+    started = time.perf_counter()
+    for product_id in range(1, 1001):
+        recommender.set_price(product_id, 30_000)
+    price_time = (time.perf_counter() - started) / 1000
+
+    print(f"Товаров: {PRODUCTS_COUNT}, строк матрицы: {len(recommender)}")
+    print(f"Построение матрицы: {build_time * 1000:.1f} мс")
+    print(f"Подбор top-3: {query_time * 1000:.3f} мс на запрос")
+    print(f"Обновление остатка: {stock_time * 1_000_000:.1f} мкс")
+    print(f"Обновление цены: {price_time * 1_000_000:.1f} мкс")
+
+    # Сверка с полной сортировкой
+    features = answers[0]
+    scores = recommender.matrix @ recommender.user_vector(features)
+    scores[recommender.candidate_stock <= 0] = -np.inf
+    expected = np.sort(scores)[::-1][:3]
+    assert np.allclose([score for _, score in recommender.top(features, 3)], expected), "top-k не совпадает"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Проверка времени старта бота
+Запускает `python -X importtime -c "import <модуль>"` несколько раз,
+собирает время импорта каждого модуля (собственное и суммарное, мкс),
+печатает самые тяжёлые и при необходимости сохраняет отчёт в JSON.
+Завершается с ошибкой, если импорт модуля дольше бюджета или при старте
+импортируется модуль, который должен загружаться лениво.
+
+    python scripts/check_startup.py --budget-ms 600 --report data/startup.json
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули, которые не должны импортироваться при старте (грузятся лениво)
+FORBIDDEN = ["bot.routers.ticket", "sqlmodel", "numpy"]
+
+# Заглушки обязательных настроек: main создаёт Bot и Config при импорте
+PLACEHOLDER_ENV = {
+    "BOT_TOKEN": "123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA",
+    "API_TOKEN": "startup-check",
+    "SHOP_NAME": "startup-check",
+    "SHOP_PHONE": "startup-check",
+    "SHOP_ADDRESS": "startup-check",
+}
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def measure(module: str, cwd: str) -> Dict[str, Tuple[int, int]]:
+    """Один холодный импорт: {модуль: (собственное время, суммарное), мкс}"""
+    env = dict(os.environ)
+    for key, value in PLACEHOLDER_ENV.items():
+        env.setdefault(key, value)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        tail = "\n".join(errors[-15:])
+        raise RuntimeError(f"Импорт {module} завершился с ошибкой:\n{tail}")
+    times = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            times[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return times
+
+
+def best_of(module: str, cwd: str, runs: int) -> Dict[str, Tuple[int, int]]:
+    """Минимум по нескольким запускам - меньше шума от диска и планировщика"""
+    best: Dict[str, Tuple[int, int]] = {}
+    for _ in range(runs):
+        for name, (own, cumulative) in measure(module, cwd).items():
+            if name not in best or cumulative < best[name][1]:
+                best[name] = (own, cumulative)
+    return best
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Время импорта при старте бота")
+    parser.add_argument("--module", default="main", help="импортируемый модуль (по умолчанию main)")
+    parser.add_argument("--cwd", default=ROOT, help="каталог запуска")
+    parser.add_argument("--budget-ms", type=float, default=800, help="бюджет на импорт модуля, мс")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--report", help="сохранить время всех модулей в JSON")
+    parser.add_argument("--forbid", action="append", default=None,
+                        help="модуль, который не должен импортироваться при старте (можно несколько)")
+    args = parser.parse_args(argv)
+
+    try:
+        times = best_of(args.module, args.cwd, args.runs)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.module not in times:
+        print(f"Модуль {args.module} не найден в выводе -X importtime (уже импортирован?)", file=sys.stderr)
+        return 2
+
+    total_ms = times[args.module][1] / 1000
+    print(f"Импорт {args.module}: {total_ms:.1f} мс (бюджет {args.budget_ms:.0f} мс), модулей: {len(times)}")
+    print(f"{'собств., мс':>12} {'всего, мс':>10}  модуль")
+    for name, (own, cumulative) in sorted(times.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"{own / 1000:>12.1f} {cumulative / 1000:>10.1f}  {name}")
+
+    if args.report:
+        os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"module": args.module, "total_us": times[args.module][1],
+                       "modules": {name: {"self_us": own, "cumulative_us": cumulative}
+                                   for name, (own, cumulative) in times.items()}},
+                      f, ensure_ascii=False, indent=2)
+
+    failed = False
+    for name in args.forbid if args.forbid is not None else FORBIDDEN:
+        if name in times:
+            print(f"❌ {name} импортируется при старте ({times[name][1] / 1000:.1f} мс)")
+            failed = True
+    if total_ms > args.budget_ms:
+        print(f"❌ Импорт дольше бюджета на {total_ms - args.budget_ms:.1f} мс")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
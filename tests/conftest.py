@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+# Модули бота импортируются так же, как при запуске из bot/: from services.x import ...
+BOT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot")
+sys.path.insert(0, BOT_DIR)
+
+# Настройки для импорта модулей бота (config читает их при импорте); данные - во временном каталоге
+for _name, _value in {
+    "BOT_TOKEN": "42:TEST",
+    "API_TOKEN": "test",
+    "API_URL": "http://127.0.0.1:9",
+    "SHOP_NAME": "Test",
+    "SHOP_PHONE": "+70000000000",
+    "SHOP_ADDRESS": "Test",
+    "METRICS_PORT": "0",
+    "QUIZ_PATH": os.path.join(BOT_DIR, "quizzes.json"),
+    "PROMO_RULES_PATH": os.path.join(BOT_DIR, "promocodes.json"),
+}.items():
+    os.environ.setdefault(_name, _value)
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="bot-tests-"))
@@ -0,0 +1,41 @@
+from services.analytics import SalesAnalytics, build_report
+
+
+def make_order(order_id, total, status="Новый", created_ts=1767268800):
+    return {
+        "id": order_id, "user_id": 1, "created_ts": created_ts, "total": total, "status": status,
+        "delivery_type": "Самовывоз",
+        "items": [{"product_id": 1, "name": "Товар", "quantity": 1, "total": total}],
+    }
+
+
+def test_cancellation_removes_sale_from_daily_revenue():
+    analytics = SalesAnalytics()
+    day = "2026-01-01"
+    first, second = make_order("a", 1000), make_order("b", 500)
+    analytics.order_created(first)
+    analytics.order_created(second)
+
+    second["status"] = "Отменен"
+    analytics.status_changed(second, "Новый")
+    assert analytics.day(day) == (1, 1000)
+    assert analytics.day_by_delivery(day) == {"Самовывоз": (1, 1000)}
+    assert analytics.top_products() == [("Товар", 1, 1000)]
+    assert analytics.statuses() == {"Новый": (1, 1000), "Отменен": (1, 500)}
+
+    # Возврат из отмены снова считает продажу
+    second["status"] = "В работе"
+    analytics.status_changed(second, "Отменен")
+    assert analytics.day(day) == (2, 1500)
+
+
+def test_restored_cancelled_order_is_not_a_sale():
+    analytics = SalesAnalytics()
+    analytics.order_created(make_order("a", 700, status="Отменен"))
+    assert analytics.day("2026-01-01") == (0, 0.0)
+
+
+def test_period_report_skips_cancelled():
+    rows = [(1767268800, 1, 1000, "Самовывоз", "Новый"), (1767268800, 2, 500, "Самовывоз", "Отменен")]
+    report = build_report(rows)
+    assert (report["orders"], report["revenue"]) == (1, 1000)
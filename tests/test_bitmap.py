@@ -0,0 +1,33 @@
+import random
+
+from services.bitmap import ARRAY_LIMIT, RoaringBitmap
+
+
+def test_set_operations_match_python_sets():
+    rng = random.Random(1)
+    # Плотный блок (битовая карта), разреженный блок (массив) и большие ID
+    left = set(range(0, 20_000, 2)) | {rng.randrange(1 << 40) for _ in range(500)}
+    right = set(range(0, 20_000, 3)) | set(rng.sample(sorted(left), 100))
+    a, b = RoaringBitmap(left), RoaringBitmap(right)
+    assert set(a & b) == left & right
+    assert set(a | b) == left | right
+    assert set(a - b) == left - right
+    assert len(a) == len(left) and list(a) == sorted(left)
+
+
+def test_discard_converts_dense_block_back():
+    bitmap = RoaringBitmap(range(ARRAY_LIMIT + 1))
+    bitmap.discard(0)
+    bitmap.discard(10)
+    assert 10 not in bitmap and 11 in bitmap
+    assert len(bitmap) == ARRAY_LIMIT - 1
+
+
+def test_iter_from_and_serialization():
+    values = [5, 70_000, 70_001, 1 << 33]
+    bitmap = RoaringBitmap(values)
+    assert list(bitmap.iter_from(70_000)) == [70_001, 1 << 33]
+    assert list(bitmap.iter_from()) == values
+    restored = RoaringBitmap.from_bytes(bitmap.to_bytes())
+    assert list(restored) == values
+    assert not RoaringBitmap()
@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+from services.broadcast import BroadcastEngine  # noqa: E402
+from services.notifications import NotificationPipeline  # noqa: E402
+
+
+class Audience:
+    def __init__(self, user_ids):
+        self.user_ids = sorted(user_ids)
+        self.removed = []
+
+    def iter_from(self, after_user_id=None):
+        return (user_id for user_id in self.user_ids if after_user_id is None or user_id > after_user_id)
+
+    def discard(self, user_id):
+        self.removed.append(user_id)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+
+def test_retry_after_pauses_campaign_not_notification_worker(tmp_path):
+    attempts = []
+    status_sent = []
+
+    async def send(bot, user_id, promotion):
+        attempts.append(user_id)
+        if user_id == 20 and attempts.count(20) == 1:
+            raise TelegramRetryAfter(method=None, message="Flood control exceeded", retry_after=1)
+
+    async def send_status(bot):
+        status_sent.append(time.monotonic())
+
+    async def run():
+        pipeline = NotificationPipeline(workers=1)
+        await pipeline.start(None)
+        engine = BroadcastEngine(pipeline, str(tmp_path), rate=1000)
+        engine.audiences["all"] = Audience([10, 20, 30])
+        campaign = engine.start("spring", {"text": "-10%"}, "all", send)
+        await asyncio.sleep(0.2)
+        # Рассылка стоит на паузе, а единственный воркер свободен для статусов заказов
+        started = time.monotonic()
+        await pipeline.submit("order:1", send_status)
+        assert status_sent[0] - started < 0.5
+        await engine._tasks["spring"]
+        await pipeline.stop()
+        return campaign
+
+    campaign = asyncio.run(run())
+    assert campaign.status == "finished"
+    assert (campaign.sent, campaign.failed, campaign.removed) == (3, 0, 0)
+    assert attempts.count(20) == 2
+    assert campaign.checkpoint == 30
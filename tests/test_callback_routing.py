@@ -0,0 +1,84 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from aiogram.dispatcher.event.bases import SkipHandler  # noqa: E402
+from aiogram.fsm.context import FSMContext  # noqa: E402
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from aiogram.types import CallbackQuery, User  # noqa: E402
+
+from services.callback_data import CallbackCodec, CallbackRouter  # noqa: E402
+from services.flood_control import FloodControl, FloodControlMiddleware, FloodLimit  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_query(data):
+    return CallbackQuery(id="1", from_user=User(id=7, is_bot=False, first_name="T"), chat_instance="c", data=data)
+
+
+def test_codec_round_trip_and_legacy_text():
+    codec = CallbackCodec()
+    schema = codec.schema("item", 1, item_id="I", note="s")
+    packed = schema.pack(42, "тест")
+    assert codec.unpack(packed) == (schema, (42, "тест"))
+    assert codec.unpack("~" + "!" * 4) is None
+    assert schema.from_text("42_a_b") == (42, "a_b")
+    with pytest.raises(ValueError):
+        codec.schema("other", 1, value="B")
+
+
+def test_route_resolved_once_for_middleware_and_dispatch():
+    codec = CallbackCodec()
+    callbacks = CallbackRouter(codec)
+    seen = []
+
+    @callbacks.prefix("item_", int, flags={"flood": "cart"})
+    async def handle_item(callback, cb):
+        seen.append(cb)
+
+    calls = []
+    resolve = callbacks.resolve
+    callbacks.resolve = lambda data: calls.append(data) or resolve(data)
+
+    flood = FloodControl({"default": FloodLimit(rate=5, burst=10), "cart": FloodLimit(rate=1, burst=1)},
+                         default="default")
+    middleware = FloodControlMiddleware(flood, callback_routers=[callbacks])
+    query = make_query("item_5")
+    data = {"handler": SimpleNamespace(callback=callbacks.dispatch)}
+
+    assert middleware._limit_name(query, data) == "cart"
+    asyncio.run(callbacks.dispatch(query, **data))
+    assert seen == [5]
+    assert calls == ["item_5"]
+
+
+def test_unknown_data_skips_to_next_handler():
+    callbacks = CallbackRouter(CallbackCodec())
+    with pytest.raises(SkipHandler):
+        asyncio.run(callbacks.dispatch(make_query("nothing")))
+
+
+def test_ticket_support_buttons_old_and_packed():
+    sys.path.insert(0, ROOT)
+    try:
+        from bot.routers import ticket
+    finally:
+        sys.path.remove(ROOT)
+
+    async def press(data):
+        state = FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=1, chat_id=9, user_id=9))
+        callback = SimpleNamespace(data=data, from_user=SimpleNamespace(id=9),
+                                   message=SimpleNamespace(edit_text=AsyncMock()), answer=AsyncMock())
+        await ticket.callbacks.dispatch(callback, state=state)
+        return (await state.get_data()).get("user_id")
+
+    assert asyncio.run(press("reply_42")) == 42
+    assert asyncio.run(press(ticket.SUPPORT_REPLY.pack(42))) == 42
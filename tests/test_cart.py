@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+from services.cart import CartStore
+from catalog import format_price
+
+
+def test_reprice_all_recomputes_each_cart_once():
+    priced = []
+
+    def pricer(cart):
+        priced.append(cart.user_id)
+        return SimpleNamespace(ok=True, discount=cart.subtotal // 10, free_delivery=False)
+
+    store = CartStore(pricer=pricer)
+    store.set_quantity(1, 10, 2, 100, "a")
+    store.set_quantity(1, 11, 1, 50, "b")
+    store.set_quantity(2, 11, 3, 50, "b")
+    store.set_quantity(3, 12, 1, 70, "a")
+    for user_id in (1, 2, 3):
+        store.cart(user_id).set_promo("SALE")
+    priced.clear()
+
+    assert store.reprice_all({10: 120, 11: 40}) == 2
+    assert sorted(priced) == [1, 2]
+    assert store.get(1).subtotal == 2 * 120 + 40
+    assert store.get(1).category_totals == {"a": 240, "b": 40}
+    assert store.get(1).discount == 28
+    assert store.get(2).subtotal == 3 * 40
+    assert store.get(3).subtotal == 70
+
+
+def test_format_price_keeps_kopecks():
+    assert format_price(25000) == "25,000"
+    assert format_price(25000.0) == "25,000"
+    assert format_price(1234.5) == "1,234.50"
@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("numpy")
+
+from aiogram.fsm.context import FSMContext  # noqa: E402
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+
+import support_bot  # noqa: E402
+from order_system import OrderStates  # noqa: E402
+
+
+def make_callback(data, user_id=501):
+    return SimpleNamespace(
+        data=data,
+        from_user=SimpleNamespace(id=user_id),
+        message=SimpleNamespace(edit_text=AsyncMock(), answer=AsyncMock()),
+        answer=AsyncMock(),
+    )
+
+
+def make_state(user_id=501):
+    return FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=42, chat_id=user_id, user_id=user_id))
+
+
+def test_cancel_promo_input_leaves_promo_state():
+    async def run():
+        state = make_state()
+        await state.set_state(OrderStates.waiting_for_promo)
+        callback = make_callback("cart")
+        await support_bot.callbacks.dispatch(callback, state=state)
+        callback.message.edit_text.assert_awaited()
+        return await state.get_state()
+
+    assert asyncio.run(run()) is None
+
+
+def make_message(user_id, text):
+    return SimpleNamespace(from_user=SimpleNamespace(id=user_id), text=text, answer=AsyncMock())
+
+
+def test_set_price_reports_old_and_new_prices():
+    from catalog import get_product
+
+    product_id = 1
+    old = get_product(product_id)["price"]
+    admin = support_bot.SUPPORT_IDS[0]
+
+    async def run():
+        message = make_message(admin, f"/set_price {product_id} {old + 1}")
+        try:
+            await support_bot.set_product_price(message, SimpleNamespace(args=f"{product_id} {old + 1}"))
+        finally:
+            support_bot.change_prices({product_id: old})
+        return message.answer.await_args.args[0]
+
+    reply = asyncio.run(run())
+    assert f"{support_bot.format_price(old)}₽ → {support_bot.format_price(old + 1)}₽" in reply
+
+
+def test_quantity_buttons_redraw_cart():
+    import order_system
+    from services.callback_schemas import CART_QUANTITY
+
+    user_id = 502
+
+    async def run():
+        await order_system.journal.start()
+        try:
+            state = make_state(user_id)
+            assert order_system.stock_reservations.reserve(user_id, 1, 2)
+            await order_system.cart_set_quantity(user_id, 1, 2)
+            callback = make_callback(CART_QUANTITY.pack(1, -1), user_id)
+            await support_bot.callbacks.dispatch(callback, state=state)
+            callback.message.edit_text.assert_awaited()
+        finally:
+            await order_system.journal.stop()
+
+    asyncio.run(run())
+    assert order_system.user_carts.get(user_id)[1] == 1
+    assert order_system.stock_reservations.reserved(user_id) == {1: 1}
@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from services.flood_control import MERGE, FloodControl, FloodControlMiddleware, FloodLimit  # noqa: E402
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_data(flood_class, user_id=7):
+    return {"handler": SimpleNamespace(flags={"flood": flood_class}, callback=None),
+            "event_from_user": SimpleNamespace(id=user_id)}
+
+
+def test_bucket_refills_and_warns_once():
+    flood = FloodControl({"cart": FloodLimit(rate=1, burst=2)})
+    clock = flood.stores["cart"].clock = Clock()
+    assert flood.take("cart", 1) == (0.0, False)
+    assert flood.take("cart", 1) == (0.0, False)
+    wait, notify = flood.take("cart", 1)
+    assert wait == pytest.approx(1) and notify
+    assert flood.take("cart", 1)[1] is False
+    clock.now += 1
+    assert flood.take("cart", 1) == (0.0, False)
+    # Другой пользователь не затронут
+    assert flood.take("cart", 2) == (0.0, False)
+
+
+def test_invalid_limits_rejected():
+    with pytest.raises(ValueError):
+        FloodControl({"cart": FloodLimit(rate=0, burst=1)})
+    with pytest.raises(ValueError):
+        FloodControl({"cart": FloodLimit(rate=1, burst=1)}, default="other")
+
+
+def test_drop_mode_skips_extra_updates():
+    flood = FloodControl({"cart": FloodLimit(rate=0.01, burst=2)}, exempt=[99])
+    middleware = FloodControlMiddleware(flood)
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event)
+
+    async def run():
+        for number in range(5):
+            await middleware(handler, number, make_data("cart"))
+        for number in range(3):
+            await middleware(handler, f"admin{number}", make_data("cart", user_id=99))
+
+    asyncio.run(run())
+    assert handled == [0, 1, "admin0", "admin1", "admin2"]
+    assert flood.stats()["cart"] == (1, 3, 0)
+
+
+def test_merge_mode_runs_only_latest_update():
+    flood = FloodControl({"search": FloodLimit(rate=20, burst=1, mode=MERGE)})
+    middleware = FloodControlMiddleware(flood)
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event)
+
+    async def run():
+        for query in ("s", "sh", "sho", "shoe"):
+            await middleware(handler, query, make_data("search"))
+        await asyncio.sleep(0.2)
+        await middleware.close()
+
+    asyncio.run(run())
+    assert handled == ["s", "shoe"]
+    assert flood.merged["search"] == 2
@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from services.media_registry import MediaRegistry  # noqa: E402
+from services.prefetch import Prefetcher  # noqa: E402
+
+
+def test_warm_hashes_photo_off_the_event_loop(tmp_path):
+    photo = tmp_path / "bike.jpg"
+    photo.write_bytes(b"\xff\xd8" + b"0" * 100_000)
+    registry = MediaRegistry(str(tmp_path / "media.json"))
+    threads = []
+    content_hash = registry._content_hash
+
+    def tracked(path):
+        threads.append(threading.get_ident())
+        return content_hash(path)
+
+    registry._content_hash = tracked
+
+    async def run():
+        await registry.warm(str(photo))
+        await registry.warm(str(photo))
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    # Один расчёт, и не в потоке цикла событий; второй прогрев берёт кэш
+    assert len(threads) == 1 and threads[0] != loop_thread
+    assert registry._key(str(photo)).startswith(str(photo))
+
+
+def test_prefetcher_awaits_async_warmers():
+    prefetcher = Prefetcher()
+    prefetcher.renderers["p_"] = lambda screen: "screen"
+    warmed = []
+
+    async def warm(screen):
+        await asyncio.sleep(0)
+        warmed.append(screen)
+
+    prefetcher.warmers.append(warm)
+    asyncio.run(prefetcher._warm(["p_1"]))
+    assert warmed == ["p_1"]
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from services.notifications import NotificationPipeline  # noqa: E402
+
+
+def test_notifications_for_one_chat_keep_order():
+    delivered = []
+
+    def sender(label, delay):
+        async def send(bot):
+            await asyncio.sleep(delay)
+            delivered.append(label)
+        return send
+
+    async def run():
+        pipeline = NotificationPipeline(workers=4)
+        await pipeline.start(None)
+        # Первое уведомление отправляется дольше: параллельный воркер обогнал бы его
+        futures = [
+            pipeline.submit(f"order:{number}", sender(number, 0.05 * (3 - number)), chat_id=77)
+            for number in range(3)
+        ]
+        await asyncio.gather(*futures)
+        await pipeline.stop()
+
+    asyncio.run(run())
+    assert delivered == [0, 1, 2]
+
+
+def test_same_key_collapses_within_its_worker():
+    async def run():
+        pipeline = NotificationPipeline(workers=4)
+        await pipeline.start(None)
+        sends = []
+
+        async def send(bot):
+            sends.append(1)
+
+        first = pipeline.submit("order:5", send)
+        second = pipeline.submit("order:5", send)
+        outcomes = await asyncio.gather(first, second)
+        await pipeline.stop()
+        return [outcome["status"] for outcome in outcomes], len(sends)
+
+    assert asyncio.run(run()) == (["collapsed", "sent"], 1)
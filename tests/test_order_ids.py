@@ -0,0 +1,29 @@
+from services.order_ids import ID_LENGTH, OrderIdGenerator, id_timestamp, is_generated_id
+
+
+def test_ids_are_unique_and_sorted():
+    generator = OrderIdGenerator(worker_id=3)
+    ids = [generator.next_id() for _ in range(10_000)]
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert all(len(order_id) == ID_LENGTH and is_generated_id(order_id) for order_id in ids)
+
+
+def test_workers_do_not_collide():
+    first, second = OrderIdGenerator(worker_id=1), OrderIdGenerator(worker_id=2)
+    assert not {first.next_id() for _ in range(1000)} & {second.next_id() for _ in range(1000)}
+
+
+def test_observe_keeps_ids_ahead_of_restored_ones(monkeypatch):
+    generator = OrderIdGenerator(worker_id=1)
+    issued = generator.next_id()
+    # Перезапуск с отставшими часами: новые ID не уходят назад
+    monkeypatch.setattr("services.order_ids.time.time", lambda: id_timestamp(issued) - 60)
+    restarted = OrderIdGenerator(worker_id=1)
+    restarted.observe(issued)
+    assert restarted.next_id() > issued
+    # ID другого процесса и старые текстовые ID не влияют
+    other = OrderIdGenerator(worker_id=1)
+    other.observe("ORD-123")
+    other.observe(OrderIdGenerator(worker_id=2).next_id())
+    assert other._last_ms == 0
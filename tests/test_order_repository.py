@@ -0,0 +1,39 @@
+from services.order_repository import OrderRepository
+
+
+def make_order(order_id, user_id, created_ts):
+    return {"id": order_id, "user_id": user_id, "created_ts": created_ts}
+
+
+def test_user_ids_after_resumes_in_order():
+    orders = OrderRepository()
+    for number, user_id in enumerate([30, 10, 20, 10, 40]):
+        orders.add(make_order(f"o{number}", user_id, number))
+    assert list(orders.user_ids_after()) == [10, 20, 30, 40]
+    assert list(orders.user_ids_after(20)) == [30, 40]
+    assert list(orders.user_ids_after(25)) == [30, 40]
+    assert list(orders.user_ids_after(40)) == []
+
+
+def test_new_customers_during_iteration_are_not_skipped():
+    orders = OrderRepository()
+    for number, user_id in enumerate([10, 30]):
+        orders.add(make_order(f"o{number}", user_id, number))
+    seen = []
+    for user_id in orders.user_ids_after():
+        seen.append(user_id)
+        if user_id == 10:
+            # Новый покупатель до и после текущей позиции
+            orders.add(make_order("o5", 5, 5))
+            orders.add(make_order("o20", 20, 6))
+    assert seen == [10, 20, 30]
+
+
+def test_history_pages_newest_first():
+    orders = OrderRepository()
+    for number in range(7):
+        orders.add(make_order(f"o{number}", 1, number))
+    page, cursor = orders.page(1, limit=5)
+    assert [order["id"] for order in page] == ["o6", "o5", "o4", "o3", "o2"]
+    page, cursor = orders.page(1, cursor, limit=5)
+    assert [order["id"] for order in page] == ["o1", "o0"] and cursor is None
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("numpy")
+
+import order_system  # noqa: E402
+
+
+def make_order(order_id, user_id, product_id, quantity, status="Новый"):
+    return {
+        "id": order_id, "user_id": user_id, "user_name": "Тест", "phone": "+70000000000",
+        "address": "Самовывоз", "delivery_type": "Самовывоз", "delivery_price": 0,
+        "status": status, "created_at": "01.01.2026 10:00", "created_ts": 1767250800,
+        "items": [{"product_id": product_id, "name": "Товар", "price": 100, "quantity": quantity, "total": 100 * quantity}],
+        "total": 100 * quantity,
+    }
+
+
+def test_failed_append_does_not_change_cart(monkeypatch):
+    def broken_append(op, data):
+        raise TypeError("not serializable")
+
+    monkeypatch.setattr(order_system.journal, "append", broken_append)
+    with pytest.raises(TypeError):
+        order_system.cart_add(9001, 1, 2)
+    assert 9001 not in order_system.user_carts
+
+
+def test_cancelled_orders_do_not_count_as_sold(monkeypatch):
+    orders = order_system.OrderRepository()
+    monkeypatch.setattr(order_system, "user_orders", orders)
+    orders.add(make_order("A1", 9002, 1, 2))
+    orders.add(make_order("A2", 9003, 1, 3, status="Отменен"))
+    try:
+        order_system._rebuild_stock()
+        assert order_system._sold_before_start == {1: 2}
+    finally:
+        order_system._sold_before_start.clear()
+
+
+def test_cancelling_order_returns_stock(monkeypatch):
+    orders = order_system.OrderRepository()
+    monkeypatch.setattr(order_system, "user_orders", orders)
+    orders.add(make_order("B1", 9004, 2, 1))
+    before = order_system.stock_reservations.available(2)
+
+    async def run():
+        order_system.set_order_status("B1", "Отменен")
+        order_system.set_order_status("B1", "Отменен")
+
+    asyncio.run(run())
+    assert order_system.stock_reservations.available(2) == before + 1
@@ -0,0 +1,45 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+
+from services.persistence import StateJournal
+
+
+def make_journal(path, state):
+    def apply(op, data):
+        state.setdefault(op, []).append(data)
+
+    return StateJournal(str(path), apply, lambda: dict(state), state.update)
+
+
+def test_decimal_prices_survive_restart(tmp_path):
+    async def run():
+        journal = make_journal(tmp_path, {})
+        journal.recover()
+        await journal.start()
+        await journal.append("price_set", {"prices": {"7": Decimal("1234.50")}})
+        # Снимок при остановке тоже содержит Decimal
+        journal.dump = lambda: {"price": Decimal("99.90")}
+        await journal.stop()
+
+    asyncio.run(run())
+    state = {}
+    make_journal(tmp_path, state).recover()
+    assert Decimal(state["price"]) == Decimal("99.90")
+
+
+def test_failed_append_leaves_no_record(tmp_path):
+    state = {}
+
+    async def run():
+        journal = make_journal(tmp_path, state)
+        journal.recover()
+        await journal.start()
+        with pytest.raises(TypeError):
+            journal.append("bad", {"value": object()})
+        await journal.append("good", {"value": 1})
+        await journal.stop()
+        return journal._seq
+
+    assert asyncio.run(run()) == 1
@@ -0,0 +1,64 @@
+import json
+import threading
+from datetime import datetime
+
+from services.promo_engine import PromoEngine
+
+RULES = {
+    "sale10": {"type": "percent", "value": 10, "categories": ["shoes"], "min_basket": 1000},
+    "minus500": {"type": "fixed", "value": 500, "global_limit": 3, "per_user_limit": 1},
+    "ship": {"type": "free_delivery", "valid_from": "2026-01-01", "valid_until": "2026-01-31"},
+}
+
+
+def make_engine(tmp_path):
+    path = tmp_path / "promos.json"
+    path.write_text(json.dumps(RULES), encoding="utf-8")
+    engine = PromoEngine(str(path))
+    engine.load()
+    return engine
+
+
+def test_pricing_rules(tmp_path):
+    engine = make_engine(tmp_path)
+    result = engine.evaluate(" sale10 ", 1, 3000, {"shoes": 1500, "hats": 1500})
+    assert result.ok and result.discount == 150
+    assert not engine.evaluate("SALE10", 1, 900, {"shoes": 900}).ok
+    assert not engine.evaluate("SALE10", 1, 3000, {"hats": 3000}).ok
+    # Фиксированная скидка не больше суммы корзины
+    assert engine.evaluate("MINUS500", 1, 300, {None: 300}).discount == 300
+    assert not engine.evaluate("NOPE", 1, 300, {None: 300}).ok
+
+
+def test_validity_window_includes_last_day(tmp_path):
+    engine = make_engine(tmp_path)
+    ts = lambda value: datetime.fromisoformat(value).timestamp()
+    assert not engine.evaluate("SHIP", 1, 100, {}, now=ts("2025-12-31T23:00")).ok
+    result = engine.evaluate("SHIP", 1, 100, {None: 100}, now=ts("2026-01-31T23:00"))
+    assert result.ok and result.free_delivery
+    assert not engine.evaluate("SHIP", 1, 100, {None: 100}, now=ts("2026-02-01T00:00")).ok
+
+
+def test_limits_hold_under_concurrent_redeem(tmp_path):
+    engine = make_engine(tmp_path)
+    assert engine.redeem("MINUS500", 1) is None
+    assert engine.redeem("MINUS500", 1) == "Вы уже использовали этот промокод"
+
+    errors = []
+    threads = [threading.Thread(target=lambda user_id=user_id: errors.append(engine.redeem("MINUS500", user_id)))
+               for user_id in range(2, 52)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors.count(None) == 2
+    assert engine.redemptions["MINUS500"] == 3
+
+
+def test_redemptions_survive_dump_and_restore(tmp_path):
+    engine = make_engine(tmp_path)
+    engine.redeem("MINUS500", 7)
+    restored = make_engine(tmp_path)
+    restored.restore(engine.dump())
+    assert restored.redeem("MINUS500", 7) == "Вы уже использовали этот промокод"
+    assert restored.redemptions["MINUS500"] == 1
@@ -0,0 +1,69 @@
+import json
+import os
+
+import pytest
+
+from services.quiz_engine import QuizEngine
+
+QUIZZES = [
+    {"id": 1, "questions": [
+        {"id": 10, "text": "Для чего?", "feature": "purpose", "answers": [
+            {"id": 100, "key": "a", "value": "sport", "text": "Спорт"},
+            {"id": 101, "key": "b", "value": "home", "text": "Дом"},
+        ]},
+        {"id": 11, "text": "Опыт?", "feature": "skill", "answers": [
+            {"id": 110, "key": "a", "value": 1, "text": "Новичок"},
+        ]},
+    ]},
+]
+
+
+def write(path, data, mtime):
+    path.write_text(json.dumps(data), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_lookup_tables_and_screens(tmp_path):
+    path = tmp_path / "quizzes.json"
+    write(path, QUIZZES, 1000)
+    engine = QuizEngine(str(path))
+    engine.load()
+
+    answer = engine.answer(110)
+    assert answer.question.id == 11 and answer.question.quiz.id == 1
+    assert [a.slot for a in engine.answers.values()] == [0, 1, 2]
+    first, second = engine.quiz(1).questions
+    assert first.screen.startswith("📊 Вопрос 1/2")
+    callbacks = [row[0].callback_data for row in second.markup.inline_keyboard]
+    assert callbacks == ["answer_110", "back", "cancel_test"]
+    assert engine.features([101, 110, 999]) == {"purpose": "home", "skill": 1}
+
+
+def test_duplicate_answer_id_is_rejected(tmp_path):
+    path = tmp_path / "quizzes.json"
+    broken = json.loads(json.dumps(QUIZZES))
+    broken[0]["questions"][1]["answers"][0]["id"] = 100
+    write(path, broken, 1000)
+    with pytest.raises(ValueError):
+        QuizEngine(str(path)).load()
+
+
+def test_reload_keeps_old_quizzes_on_broken_file(tmp_path):
+    path = tmp_path / "quizzes.json"
+    write(path, QUIZZES, 1000)
+    engine = QuizEngine(str(path), check_interval=0)
+    reloads = []
+    engine.listeners.append(reloads.append)
+    engine.load()
+
+    path.write_text("[", encoding="utf-8")
+    os.utime(path, (2000, 2000))
+    assert not engine.maybe_reload()
+    assert engine.quiz(1) is not None
+
+    renamed = json.loads(json.dumps(QUIZZES))
+    renamed[0]["title"] = "Новый"
+    write(path, renamed, 3000)
+    assert engine.maybe_reload()
+    assert engine.quiz(1).title == "Новый"
+    assert len(reloads) == 2
@@ -0,0 +1,36 @@
+import asyncio
+import json
+import threading
+import time
+
+from services.quiz_funnel import QuizFunnel
+
+
+def test_stop_waits_for_running_flush(tmp_path):
+    path = tmp_path / "funnel.json"
+    funnel = QuizFunnel(str(path), flush_interval=0.01)
+    writing = threading.Event()
+    writes = []
+    write = funnel._write
+
+    def slow_write(data):
+        writing.set()
+        time.sleep(0.2)
+        write(data)
+        writes.append(time.monotonic())
+
+    funnel._write = slow_write
+
+    async def run():
+        funnel.start_flushing()
+        while not writing.is_set():
+            await asyncio.sleep(0.005)
+        await funnel.stop()
+        return time.monotonic()
+
+    stopped = asyncio.run(run())
+    # Запись из цикла закончилась до финального save(), а не продолжилась после stop()
+    assert len(writes) == 2
+    assert writes[0] <= writes[1] <= stopped
+    assert json.loads(path.read_text()) == {"quizzes": {}, "questions": {}, "answers": {}}
+    assert not (tmp_path / "funnel.json.tmp").exists()
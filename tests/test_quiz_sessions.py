@@ -0,0 +1,63 @@
+import asyncio
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from services.quiz_sessions import QuizSession, QuizSessionStore
+from services.ttl_store import TTLStore
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_state(user_id=1):
+    return FSMContext(MemoryStorage(), StorageKey(bot_id=1, chat_id=user_id, user_id=user_id))
+
+
+def test_session_pack_and_back():
+    session = QuizSession(7)
+    session.answer(100)
+    session.answer(110)
+    assert session.back() and session.index == 1
+    # Ответ после "Назад" заменяет последующие
+    session.answer(111)
+    restored = QuizSession.unpack(session.pack())
+    assert (restored.test_id, restored.index, list(restored.answers)) == (7, 2, [100, 111])
+
+
+def test_ttl_store_expires_and_evicts_oldest():
+    clock = Clock()
+    store = TTLStore(ttl=10, max_entries=2, clock=clock)
+    store.set("a", b"1")
+    clock.now += 5
+    store.set("b", b"2")
+    clock.now += 5
+    store.set("c", b"3")
+    assert store.get("a") is None and store.evicted == 1
+    clock.now += 6
+    assert store.expire() == 1
+    assert store.get("b") is None and store.get("c") == b"3"
+
+
+def test_session_restored_from_fsm_after_eviction():
+    sessions = QuizSessionStore(ttl=60, max_entries=1)
+    first, second = make_state(1), make_state(2)
+
+    async def run():
+        session = QuizSession(3)
+        session.answer(100)
+        await sessions.save(1, session, first)
+        await sessions.save(2, QuizSession(4), second)
+        assert len(sessions) == 1
+        restored = await sessions.load(1, first)
+        assert list(restored.answers) == [100]
+        await sessions.drop(1, first)
+        assert await sessions.load(1, first) is None
+
+    asyncio.run(run())
@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from services.recommender import BUDGET_COLUMNS, FEATURES, Recommender  # noqa: E402
+
+
+def build():
+    # Семейства: 1 (варианты 2, 3) и 4 (вариант 5); цены в копейках
+    ids = [1, 2, 3, 4, 5]
+    parents = [0, 1, 1, 0, 4]
+    codes = [0, 0, 0, 1, 1]
+    prices = [60000_00, 55000_00, 70000_00, 15000_00, 18000_00]
+    stock = [1, 1, 1, 1, 1]
+    recommender = Recommender()
+    recommender.build((ids, parents, codes, ["mountain", "folding"], prices, stock))
+    return recommender
+
+
+def test_set_price_updates_family_minimum_and_budget_tier():
+    recommender = build()
+    assert recommender.candidate_price.tolist() == [55000_00, 15000_00]
+
+    recommender.set_price(3, 19000)
+    assert recommender.candidate_price.tolist() == [19000_00, 15000_00]
+    assert recommender.matrix[0, BUDGET_COLUMNS].tolist() == [1, 0, 0]
+
+    recommender.set_price(5, 10000)
+    assert recommender.candidate_price.tolist() == [19000_00, 10000_00]
+
+
+def test_user_vector_ignores_out_of_range_answers():
+    assert not Recommender.user_vector({"purpose": 5, "skill": -1, "budget": 0}).any()
+    assert Recommender.user_vector({"purpose": 4}).shape == (FEATURES,)
@@ -0,0 +1,53 @@
+import asyncio
+
+from services.scheduler import Scheduler, TimerWheel
+
+START = 1_000_000.0
+
+
+def test_timers_fire_in_due_order_across_levels():
+    wheel = TimerWheel(resolution=1.0, now=START)
+    wheel.schedule("far", START + 5000, "t")
+    wheel.schedule("near", START + 3, "t")
+    wheel.schedule("mid", START + 100, "t")
+    assert [timer.key for timer in wheel.advance(START + 2)] == []
+    assert [timer.key for timer in wheel.advance(START + 3)] == ["near"]
+    assert [timer.key for timer in wheel.advance(START + 4999)] == ["mid"]
+    assert [timer.key for timer in wheel.advance(START + 5000)] == ["far"]
+    assert len(wheel) == 0
+
+
+def test_reschedule_cancel_and_groups():
+    wheel = TimerWheel(resolution=1.0, now=START)
+    wheel.schedule("a", START + 10, "t", group="order:1")
+    wheel.schedule("a", START + 20, "t", group="order:1")
+    wheel.schedule("b", START + 15, "t", group="order:1")
+    wheel.schedule("c", START + 15, "t", group="order:2")
+    assert wheel.cancel_group("order:1") == 2
+    assert wheel.group("order:1") == []
+    assert [timer.key for timer in wheel.advance(START + 30)] == ["c"]
+
+
+def test_overdue_timer_fires_on_next_advance():
+    wheel = TimerWheel(resolution=1.0, now=START)
+    wheel.schedule("late", START - 5, "t")
+    assert [timer.key for timer in wheel.advance(START)] == ["late"]
+
+
+def test_scheduler_survives_failing_handler():
+    wheel = TimerWheel(resolution=1.0, now=START)
+    fired = []
+
+    async def broken(timer):
+        raise RuntimeError("boom")
+
+    scheduler = Scheduler(wheel, {"broken": broken}, on_fired=lambda timer: fired.append(timer.key))
+    wheel.schedule("x", START, "broken")
+    wheel.schedule("y", START, "unknown")
+
+    async def run():
+        for timer in wheel.advance(START):
+            await scheduler._fire(timer)
+
+    asyncio.run(run())
+    assert fired == ["x", "y"]
@@ -0,0 +1,44 @@
+from services.stock_reservation import StockReservations
+
+
+def make_stock(**stock):
+    reservations = StockReservations(ttl=60, shards=4)
+    for product_id, quantity in stock.items():
+        reservations.set_stock(int(product_id.lstrip("p")), quantity)
+    return reservations
+
+
+def test_partial_release_keeps_rest_of_reservation():
+    reservations = make_stock(p1=5)
+    assert reservations.reserve(10, 1, 3)
+    assert reservations.release(10, 1, 1) == {1: 1}
+    assert reservations.reserved(10) == {1: 2}
+    assert reservations.available(1) == 3
+    # Больше, чем зарезервировано, - возвращается весь резерв товара
+    assert reservations.release(10, 1, 5) == {1: 2}
+    assert reservations.reserved(10) == {}
+    assert reservations.available(1) == 5
+
+
+def test_atomic_reserve_cart_rolls_back_on_shortage():
+    reservations = make_stock(p1=5, p2=1)
+    assert reservations.reserve(10, 1, 1)
+    unavailable = reservations.reserve_cart(10, {1: 3, 2: 2}, atomic=True)
+    assert unavailable == [2]
+    # Резерв до вызова остаётся, дозарезервированное возвращено
+    assert reservations.reserved(10) == {1: 1}
+    assert (reservations.available(1), reservations.available(2)) == (4, 1)
+
+
+def test_reserve_cart_keeps_partial_result_by_default():
+    reservations = make_stock(p1=5, p2=1)
+    assert reservations.reserve_cart(10, {1: 3, 2: 2}) == [2]
+    assert reservations.reserved(10) == {1: 3}
+
+
+def test_shortage_is_all_or_nothing_across_shards():
+    reservations = make_stock(p1=3)
+    assert not reservations.reserve(10, 1, 4)
+    assert reservations.available(1) == 3
+    assert reservations.reserve(11, 1, 3)
+    assert reservations.available(1) == 0
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from services.subscribers import SegmentAudience, SubscriberRegistry
+
+
+def make_registry(tmp_path, user_ids):
+    registry = SubscriberRegistry(str(tmp_path / "subscribers.bin"))
+    for user_id in user_ids:
+        registry.subscribe(user_id)
+    return registry
+
+
+def test_select_single_segment_returns_copy(tmp_path):
+    registry = make_registry(tmp_path, [10, 20, 30])
+    selected = registry.select("subscribed")
+    assert selected is not registry.segments["subscribed"]
+    registry.unsubscribe(20)
+    assert list(selected) == [10, 20, 30]
+
+
+def test_audience_snapshot_survives_changes_during_iteration(tmp_path):
+    registry = make_registry(tmp_path, [10, 20, 30, 40])
+    audience = SegmentAudience(registry, "subscribed")
+    seen = []
+    for user_id in audience.iter_from(None):
+        seen.append(user_id)
+        if user_id == 10:
+            audience.discard(10)
+            registry.unsubscribe(20)
+            registry.subscribe(5)
+            registry.subscribe(15)
+    assert seen == [10, 20, 30, 40]
+    assert audience.blocked == {10}
+    assert list(registry.segment("subscribed")) == [5, 15, 30, 40]
+
+
+def test_campaign_with_unsubscribe_and_subscribe(tmp_path):
+    pytest.importorskip("aiogram")
+    from aiogram.exceptions import TelegramForbiddenError
+    from services.broadcast import BroadcastEngine
+
+    class Pipeline:
+        def submit(self, key, send, priority, chat_id=None):
+            return asyncio.ensure_future(self._run(send))
+
+        @staticmethod
+        async def _run(send):
+            try:
+                await send(None)
+                return {"status": "sent", "error": None}
+            except Exception as e:
+                return {"status": "failed", "error": e}
+
+    registry = make_registry(tmp_path, [10, 20, 30])
+    sent = []
+
+    async def send(bot, user_id, promotion):
+        if user_id == 10:
+            registry.subscribe(5)
+            registry.subscribe(15)
+            raise TelegramForbiddenError(method=None, message="Forbidden: bot was blocked by the user")
+        sent.append(user_id)
+
+    async def run():
+        engine = BroadcastEngine(Pipeline(), str(tmp_path / "campaigns"), rate=1000,
+                                 audience_factory=lambda expression: SegmentAudience(registry, expression))
+        campaign = engine.start("spring", {"text": "-10%"}, "subscribed", send)
+        await engine._tasks["spring"]
+        return campaign
+
+    campaign = asyncio.run(run())
+    assert campaign.status == "finished"
+    assert sent == [20, 30]
+    assert (campaign.sent, campaign.removed, campaign.failed) == (2, 1, 0)
+    assert not registry.is_subscribed(10)
+
+
+def test_journaled_changes_restore_after_crash(tmp_path):
+    journal = []
+    registry = make_registry(tmp_path, [])
+    registry.on_change = journal.append
+    registry.subscribe(10)
+    registry.subscribe(20)
+    registry.save()
+    registry.unsubscribe(10)
+    registry.subscribe(30)
+    assert [change["version"] for change in registry.unsaved()] == [3, 4]
+
+    # Падение без записи файла: файл + весь журнал дают то же состояние
+    restored = SubscriberRegistry(registry.path)
+    restored.load()
+    assert restored.version == 2
+    for change in journal:
+        restored.apply_change(change)
+    assert list(restored.segment("subscribed")) == [20, 30]
+    assert restored.version == registry.version
+    assert restored.unsaved() == registry.unsaved()
+
+
+def test_snapshot_is_isolated_from_later_changes(tmp_path):
+    registry = make_registry(tmp_path, [10, 20])
+    snapshot = registry.snapshot()
+    registry.unsubscribe(10)
+    registry.add("quiz:road", 20)
+    registry.write(snapshot)
+    registry.mark_saved(snapshot[0])
+    assert registry.dirty
+
+    restored = SubscriberRegistry(registry.path)
+    restored.load()
+    assert list(restored.segment("subscribed")) == [10, 20]
+    assert "quiz:road" not in restored.segments
@@ -0,0 +1,43 @@
+from services.variant_index import VariantIndex
+
+ROWS = [
+    (1, None, 500, 0, "S"),
+    (2, 1, 400, 3, "M"),
+    (3, 2, 450, 2, "L"),
+    (4, None, 100, 1, ""),
+]
+
+
+def test_family_closure_and_aggregates():
+    index = VariantIndex.build(ROWS)
+    assert index.root(3) == 1
+    family = index.family(3)
+    assert family.members == [1, 2, 3]
+    assert (family.min_price, family.total_stock) == (400, 5)
+    assert index.available_labels(1) == ["M", "L"]
+    # Товар без вариантов
+    assert index.family(4) is None and index.variants(4) == []
+
+
+def test_point_updates_keep_aggregates():
+    index = VariantIndex.build(ROWS)
+    index.update_stock(2, 0)
+    assert index.family(1).total_stock == 2
+    assert index.available_labels(1) == ["L"]
+    index.update_price(2, 600)
+    assert index.family(1).min_price == 450
+    index.update_price(3, 300)
+    assert index.family(1).min_price == 300
+
+
+def test_lazy_index_builds_once_on_first_use():
+    calls = []
+    index = VariantIndex.lazy(lambda: calls.append(1) or ROWS)
+    assert not calls
+    assert index.root(2) == 1 and index.root(3) == 1
+    assert calls == [1]
+
+
+def test_parent_cycle_does_not_hang():
+    index = VariantIndex.build([(1, 2, 10, 1, "a"), (2, 1, 20, 1, "b")])
+    assert index.root(1) == index.root(2)